@@ -1,24 +1,220 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import requests
 import os
+import atexit
+import contextvars
+import itertools
 import json
 import re
+import sys
+import threading
+import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from dotenv import load_dotenv
-from huggingface_hub import InferenceClient
+from cache import MISSING, TTLCache, canonical_key
+from completion_cache import CompletionCache, completion_key
+from event_log import EventLog, conversation_key, history_digest
+from generation_scheduler import BatchEndpointBackend, GenerationScheduler, HuggingFaceBackend
+from keyword_matcher import KeywordMatcher
+from metrics import (
+    CHAT_BRANCHES, GENERATIONS, REGISTRY, REQUEST_SECONDS, request_timings, server_timing, stage,
+    start_request, upstream,
+)
+from person_cache import PersonCache
+from rate_limiter import BACKGROUND, PREFETCH, RateLimited, RateLimiter, current_priority, priority_scope, with_priority
+from recommendation_cursor import MOVIE_FIELDS, RecommendationCursor
+from recommendation_snapshot import RecommendationSnapshot, SnapshotBuildError, SnapshotRefresher, build_snapshot
+from resilience import CircuitBreaker, bounded_timeout, deadline_scope
+from sessions import create_session_store, new_session_id
+from singleflight import SingleFlight
+from tmdb_client import TMDbClient
 
 # Cargar variables de entorno
 load_dotenv()
 
 app = Flask(__name__)
 
+# Plazo total de una petición de chat (segundos, 0 = sin plazo): todas las
+# llamadas salientes recortan sus timeouts a lo que queda
+CHAT_DEADLINE = float(os.environ.get("CHAT_DEADLINE", "8"))
+
+def circuit_breaker(name, slow_call_seconds):
+    """Circuit breaker de un servicio configurado con variables de entorno."""
+    prefix = f"{name.upper()}_BREAKER"
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.environ.get(f"{prefix}_FAILURES", "5")),
+        slow_call_seconds=float(os.environ.get(f"{prefix}_SLOW_CALL", slow_call_seconds)),
+        reset_timeout=float(os.environ.get(f"{prefix}_RESET", "30")),
+    )
+
 # Hugging Face API configuration
 HUGGINGFACE_API_KEY = os.environ.get("HUGGINGFACE_API_KEY")
-hf_client = InferenceClient(token=HUGGINGFACE_API_KEY)
+HF_TIMEOUT = float(os.environ.get("HF_TIMEOUT", "6"))
+# El cliente se crea en la primera generación (ver get_hf_client)
+_hf_client = None
+_hf_client_lock = threading.Lock()
+hf_breaker = circuit_breaker("hf", "5")
+# Las generaciones simultáneas con el mismo prompt comparten una sola llamada
+hf_flight = SingleFlight()
 
 # TMDb API configuration
 TMDB_API_KEY = os.environ.get("TMDB_API_KEY")
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_BASE_URL = os.environ.get("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+# Cuota de TMDb por proceso (peticiones por segundo, 0 = sin límite): el chat
+# pasa primero y las precargas y trabajos en segundo plano usan lo que sobra
+TMDB_RATE_LIMIT = float(os.environ.get("TMDB_RATE_LIMIT", "40"))
+TMDB_RATE_BURST = float(os.environ.get("TMDB_RATE_BURST", "0")) or None
+
+# Cliente HTTP compartido (conexiones keep-alive, timeouts y reintentos)
+TMDB_CLIENT_OPTIONS = {
+    "pool_size": int(os.environ.get("TMDB_POOL_SIZE", "16")),
+    "connect_timeout": float(os.environ.get("TMDB_CONNECT_TIMEOUT", "3.05")),
+    "read_timeout": float(os.environ.get("TMDB_READ_TIMEOUT", "10")),
+    "max_retries": int(os.environ.get("TMDB_MAX_RETRIES", "2")),
+    "breaker": circuit_breaker("tmdb", "4"),
+    "rate_limiter": RateLimiter("tmdb", TMDB_RATE_LIMIT, TMDB_RATE_BURST) if TMDB_RATE_LIMIT > 0 else None,
+}
+tmdb_client = TMDbClient(TMDB_BASE_URL, **TMDB_CLIENT_OPTIONS)
+# Las peticiones idénticas simultáneas a TMDb comparten una sola llamada
+tmdb_flight = SingleFlight()
+
+# Lanzar en paralelo las búsquedas de respaldo de /discover/movie (opcional)
+TMDB_PARALLEL_FALLBACK = os.environ.get("TMDB_PARALLEL_FALLBACK") == "1"
+discover_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TMDB_FALLBACK_WORKERS", "8")),
+    thread_name_prefix="tmdb-discover",
+)
+
+# Índice local del catálogo (opcional): responde /discover/movie sin red
+movie_catalog = None
+if os.environ.get("MOVIE_CATALOG_DIR"):
+    from movie_catalog import MovieCatalog
+    movie_catalog = MovieCatalog(os.environ["MOVIE_CATALOG_DIR"])
+
+# Índice de películas parecidas sobre el catálogo local (opcional)
+movie_similarity = None
+if movie_catalog is not None and os.path.isdir(os.path.join(movie_catalog.directory, "similarity")):
+    from movie_similarity import MovieSimilarity
+    movie_similarity = MovieSimilarity(movie_catalog)
+
+# Índice local de personas de TMDb (opcional): reconoce cualquier nombre en los
+# mensajes y resuelve su id sin llamar a /search/person
+person_index = None
+if os.environ.get("PERSON_INDEX_DIR"):
+    from person_index import PersonIndex
+    person_index = PersonIndex(os.environ["PERSON_INDEX_DIR"])
+
+# Caché de respuestas de /discover/movie (los resultados vacíos expiran antes)
+discover_cache = TTLCache(
+    max_entries=int(os.environ.get("TMDB_CACHE_MAX_ENTRIES", "2048")),
+    ttl=float(os.environ.get("TMDB_CACHE_TTL", "3600")),
+    negative_ttl=float(os.environ.get("TMDB_CACHE_NEGATIVE_TTL", "300")),
+)
+
+# Caché de respuestas del modelo (por defecto sólo si la generación es determinista)
+completion_cache = CompletionCache(
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.environ.get("LLM_CACHE_TTL", "86400")),
+    path=os.environ.get("LLM_CACHE_PATH") or None,
+    reuse_sampled=os.environ.get("LLM_CACHE_REUSE_SAMPLED") == "1",
+)
+
+# Caché persistente nombre -> persona de TMDb (los ids no cambian)
+person_cache = PersonCache(os.environ.get("PERSON_CACHE_PATH", "person_cache.json"))
+
+# Instantánea precalculada de /discover/movie para la rejilla género × década/época × popularidad
+recommendation_snapshot = RecommendationSnapshot(
+    os.environ.get("RECOMMENDATION_SNAPSHOT_PATH", "recommendation_snapshot.json.gz"),
+    max_age=float(os.environ.get("RECOMMENDATION_SNAPSHOT_MAX_AGE", str(7 * 86400))),
+)
+RECOMMENDATION_SNAPSHOT_PAGES = int(os.environ.get("RECOMMENDATION_SNAPSHOT_PAGES", "2"))
+RECOMMENDATION_SNAPSHOT_REFRESH = float(os.environ.get("RECOMMENDATION_SNAPSHOT_REFRESH", "0"))
+
+@REGISTRY.collector
+def collect_cache_stats():
+    """Contadores de las cachés, la coalescencia y los circuit breakers, para /metrics."""
+    scan_info = scan_message.cache_info()
+    caches = {
+        "discover": discover_cache.stats(),
+        "completion": completion_cache.stats(),
+        "person": {"hits": person_cache.hits, "misses": person_cache.misses, "size": len(person_cache)},
+        "scan_message": {"hits": scan_info.hits, "misses": scan_info.misses, "size": scan_info.currsize},
+        "snapshot": recommendation_snapshot.stats(),
+    }
+    for name, stats in caches.items():
+        yield "cache_hits_total", "counter", "Aciertos de caché", {"cache": name}, stats["hits"] + stats.get("negative_hits", 0)
+    for name, stats in caches.items():
+        yield "cache_misses_total", "counter", "Fallos de caché", {"cache": name}, stats["misses"]
+    for name, stats in caches.items():
+        yield "cache_entries", "gauge", "Entradas en caché", {"cache": name}, stats["size"]
+    snapshot_age = caches["snapshot"]["age"]
+    if snapshot_age is not None:
+        yield "recommendation_snapshot_age_seconds", "gauge", "Antigüedad de la instantánea de recomendaciones", {}, snapshot_age
+
+    flights = [("tmdb", "sync", tmdb_flight), ("hf", "sync", hf_flight)]
+    # El camino asíncrono (asgi.py) tiene los suyos; async_chat importa app, así
+    # que se buscan sólo si ese módulo ya está cargado
+    async_chat = sys.modules.get("async_chat")
+    if async_chat is not None:
+        flights += [("tmdb", "async", async_chat.tmdb_flight), ("hf", "async", async_chat.hf_flight)]
+    for name, path, flight in flights:
+        yield "singleflight_coalesced_total", "counter", "Llamadas que esperaron a una idéntica en curso", {"upstream": name, "path": path}, flight.stats()["coalesced"]
+
+    for name, breaker in (("tmdb", TMDB_CLIENT_OPTIONS["breaker"]), ("hf", hf_breaker)):
+        stats = breaker.stats()
+        for state in ("closed", "open", "half_open"):
+            yield "circuit_breaker_state", "gauge", "Estado del circuit breaker (1 = estado actual)", {"upstream": name, "state": state}, int(stats["state"] == state)
+    if TMDB_CLIENT_OPTIONS["rate_limiter"] is not None:
+        yield "rate_limit_tokens", "gauge", "Fichas disponibles en el limitador (negativo = deuda)", {"limiter": "tmdb"}, TMDB_CLIENT_OPTIONS["rate_limiter"].stats()["tokens"]
+    for name, breaker in (("tmdb", TMDB_CLIENT_OPTIONS["breaker"]), ("hf", hf_breaker)):
+        yield "circuit_breaker_rejected_total", "counter", "Llamadas rechazadas con el circuito abierto", {"upstream": name}, breaker.stats()["rejected"]
+
+# Sesiones de conversación en el servidor (modo opcional de /api/chat)
+session_store = create_session_store(
+    backend=os.environ.get("CHAT_SESSION_BACKEND", "memory"),
+    ttl=int(os.environ.get("CHAT_SESSION_TTL", "1800")),
+    max_sessions=int(os.environ.get("CHAT_SESSION_MAX", "10000")),
+    path=os.environ.get("CHAT_SESSION_DB", "sessions.db"),
+)
+# Páginas de /discover/movie que se pueden pedir en un turno para completar
+# recomendaciones no vistas
+MAX_PAGES_PER_TURN = int(os.environ.get("RECOMMENDATION_MAX_PAGES_PER_TURN", "3"))
+# Mensajes de historial que se conservan por sesión
+SESSION_HISTORY_LIMIT = int(os.environ.get("CHAT_SESSION_HISTORY_LIMIT", "20"))
+# Recomendaciones por lotes: llamadas simultáneas a TMDb y tamaño máximo de un lote
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "8"))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "50000"))
+
+# Registro de eventos de las conversaciones (opcional): se escribe en segundo plano
+event_log = None
+if os.environ.get("EVENT_LOG_PATH"):
+    event_log = EventLog(
+        os.environ["EVENT_LOG_PATH"],
+        max_buffer=int(os.environ.get("EVENT_LOG_BUFFER", "10000")),
+        fsync_interval=float(os.environ.get("EVENT_LOG_FSYNC_INTERVAL", "5")),
+        max_bytes=int(os.environ.get("EVENT_LOG_MAX_MB", "64")) * 1024 * 1024,
+        backups=int(os.environ.get("EVENT_LOG_BACKUPS", "5")),
+    )
+    atexit.register(event_log.close)
+
+# Evento del turno en curso: las funciones del chat le añaden la rama, las
+# preferencias y las películas, y la vista lo envía al registro al terminar
+_turn_event = contextvars.ContextVar("turn_event", default=None)
+
+@REGISTRY.collector
+def collect_event_log():
+    """Eventos escritos, descartados y en el búfer del registro de conversaciones, para /metrics."""
+    if event_log is None:
+        return
+    stats = event_log.stats()
+    yield "event_log_written_total", "counter", "Eventos escritos en el registro", {}, stats["written"]
+    yield "event_log_dropped_total", "counter", "Eventos descartados con el búfer lleno", {}, stats["dropped"]
+    yield "event_log_errors_total", "counter", "Eventos perdidos por errores de escritura", {}, stats["errors"]
+    yield "event_log_buffered", "gauge", "Eventos esperando al escritor", {}, stats["buffered"]
+    yield "event_log_rotations_total", "counter", "Rotaciones del archivo de registro", {}, stats["rotations"]
 
 # Función para normalizar texto (eliminar acentos y convertir a minúsculas)
 def normalize_text(text):
@@ -111,6 +307,15 @@ FAMOUS_PEOPLE = {
     "darin": {"genre": "drama", "actor": "Ricardo Darín"}
 }
 
+# Frases del asistente que indican que está listo para recomendar (normalizadas)
+RECOMMENDATION_PHRASES = [
+    "quieres ver mis recomendaciones",
+    "te muestro algunas opciones",
+    "te recomiendo",
+    "puedo recomendarte",
+    "te gustaria ver"
+]
+
 # Décadas para detectar preferencias de época
 DECADES = {
     "50s": {"start_year": "1950", "end_year": "1959"},
@@ -123,6 +328,73 @@ DECADES = {
     "2020s": {"start_year": "2020", "end_year": "2029"}
 }
 
+# Todas las tablas de palabras clave compiladas en un único autómata al importar.
+# El orden de cada lista es la prioridad ("la primera coincidencia gana").
+KEYWORD_MATCHER = KeywordMatcher(
+    {
+        "person": [(normalize_text(person), person) for person in FAMOUS_PEOPLE],
+        "decade": [(normalize_text(decade), decade) for decade in DECADES],
+        "genre": [(normalize_text(genre), genre) for genre in GENRE_MAP],
+        "era": [(normalize_text(kw), era) for era, keywords in ERA_KEYWORDS.items() for kw in keywords],
+        "popularity": [(normalize_text(kw), popularity) for popularity, keywords in POPULARITY_KEYWORDS.items() for kw in keywords],
+        "recommendation": [(normalize_text(kw), kw) for kw in RECOMMENDATION_KEYWORDS],
+        "recommendation_phrase": [(normalize_text(phrase), phrase) for phrase in RECOMMENDATION_PHRASES],
+    },
+    word_tables={
+        "affirmative": [normalize_text(kw) for kw in AFFIRMATIVE_KEYWORDS],
+        "negative": [normalize_text(kw) for kw in NEGATIVE_KEYWORDS],
+    },
+)
+
+# Búsquedas precalculadas con las claves ya normalizadas (la primera gana)
+GENRE_IDS = {}
+for _genre, _genre_id in GENRE_MAP.items():
+    GENRE_IDS.setdefault(normalize_text(_genre), _genre_id)
+
+GENRE_FOLLOWUP_KEYS = {}
+for _key in FALLBACK_RESPONSES["genre_followup"]:
+    GENRE_FOLLOWUP_KEYS.setdefault(normalize_text(_key), _key)
+
+@lru_cache(maxsize=1024)
+def scan_message(normalized_message):
+    """Escanea un mensaje normalizado una sola vez; los predicados reutilizan el resultado."""
+    return KEYWORD_MATCHER.scan(normalized_message)
+
+@lru_cache(maxsize=1024)
+def find_person(normalized_message):
+    """Primera persona del índice local nombrada en el mensaje, o None (sin índice, siempre None)."""
+    if person_index is None:
+        return None
+    matches = person_index.find(normalized_message)
+    return matches[0] if matches else None
+
+def genre_followup_response(genre):
+    """Devuelve la pregunta de seguimiento predefinida para un género."""
+    key = GENRE_FOLLOWUP_KEYS.get(normalize_text(genre), "default")
+    return FALLBACK_RESPONSES["genre_followup"][key]
+
+@app.before_request
+def start_request_timing():
+    request.start_time = time.perf_counter()
+    start_request()
+
+@app.after_request
+def add_server_timing(response):
+    """Registra la duración de la petición y añade la cabecera Server-Timing con sus etapas.
+
+    En las respuestas en streaming la cabecera sólo incluye lo medido antes de
+    empezar a enviar; las etapas posteriores van igualmente a /metrics.
+    """
+    elapsed = time.perf_counter() - request.start_time
+    REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or "not_found")
+    response.headers["Server-Timing"] = server_timing(request_timings(), total=elapsed)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -131,80 +403,336 @@ def index():
 def chat():
     data = request.json
     user_message = data.get('message', '').strip()
+
+    if not user_message:
+        return jsonify({"error": "El mensaje no puede estar vacío"}), 400
+
+    # Modo sesión: el cliente envía sólo el identificador de sesión y el mensaje nuevo,
+    # y recibe sólo la respuesta nueva; el historial queda en el servidor
+    if 'session_id' in data:
+        with stage("session"):
+            session_id, conversation, preference_state, cursor = open_session(data.get('session_id'))
+        start_turn_event(user_message, session_id=session_id)
+        response = handle_chat_turn(user_message, conversation["history"], preference_state, cursor)
+        with stage("session"):
+            save_session(session_id, conversation, preference_state, cursor)
+        log_turn_event(response)
+        return jsonify({"response": response, "session_id": session_id})
+
+    # Modo sin estado: el cliente envía y recibe el historial completo
     chat_history = data.get('history', [])
+    start_turn_event(user_message, chat_history=chat_history)
+    response = handle_chat_turn(user_message, chat_history)
+    log_turn_event(response)
+    return jsonify({"response": response, "history": chat_history})
+
+@app.route('/api/recommendations/batch', methods=['POST'])
+def recommendations_batch():
+    """Recomendaciones para muchos conjuntos de preferencias, como NDJSON.
+
+    El cuerpo es ``{"preferences": [...], "limit": 3}`` con diccionarios en el
+    formato de extract_preferences. Cada línea de la respuesta es un registro
+    de batch_recommendations, en el orden en que se resuelven.
+    """
+    data = request.get_json(silent=True)
+    preference_sets = data.get("preferences") if isinstance(data, dict) else None
+    if not isinstance(preference_sets, list) or not all(isinstance(p, dict) for p in preference_sets):
+        return jsonify({"error": "El cuerpo debe tener una lista de preferencias"}), 400
+    if len(preference_sets) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"El lote no puede tener más de {BATCH_MAX_ITEMS} elementos"}), 413
+    # Validar todo antes de empezar a responder: un error a mitad del stream lo cortaría
+    for index, preferences in enumerate(preference_sets):
+        field = invalid_preference_field(preferences)
+        if field:
+            return jsonify({"error": f"Valor no válido en preferences[{index}].{field}"}), 400
+    limit = data.get("limit", 3)
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= 20:
+        return jsonify({"error": "limit debe ser un entero entre 1 y 20"}), 400
+
+    lines = (
+        json.dumps(record, ensure_ascii=False) + "\n"
+        for record in batch_recommendations(preference_sets, limit)
+    )
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+# Tipos admitidos de cada preferencia en /api/recommendations/batch (None siempre vale)
+PREFERENCE_TYPES = {
+    "genre": (str,), "director": (str,), "actor": (str,), "era": (str,),
+    "popularity": (str,), "similar_to": (str,), "year_from": (str, int), "year_to": (str, int),
+}
+
+# Los años son enteros o cadenas de dígitos (como los de extract_preferences)
+YEAR_PATTERN = re.compile(r"[0-9]{1,4}")
+
+def invalid_preference_field(preferences):
+    """Nombre del primer campo con un tipo o valor no admitido, o None si todos son válidos."""
+    for field, types in PREFERENCE_TYPES.items():
+        value = preferences.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, types):
+            return field
+        if field in ("year_from", "year_to") and not YEAR_PATTERN.fullmatch(str(value)):
+            return field
+    return None
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Igual que /api/chat, pero envía la respuesta como Server-Sent Events.
+
+    Emite eventos ``token`` con fragmentos de texto a medida que se generan y un
+    evento final ``done`` con la respuesta completa (que es la que vale si difiere
+    de lo enviado) y el ``session_id`` o el historial, según el protocolo.
+    """
+    data = request.json
+    user_message = data.get('message', '').strip()
 
     if not user_message:
         return jsonify({"error": "El mensaje no puede estar vacío"}), 400
 
+    session_id = None
+    preference_state = None
+    cursor = None
+    if 'session_id' in data:
+        with stage("session"):
+            session_id, conversation, preference_state, cursor = open_session(data.get('session_id'))
+        chat_history = conversation["history"]
+    else:
+        chat_history = data.get('history', [])
+
+    def events():
+        start_turn_event(user_message, session_id=session_id, chat_history=chat_history)
+        response = yield from sse_tokens(stream_chat_turn(user_message, chat_history, preference_state, cursor))
+        log_turn_event(response)
+        if session_id is not None:
+            with stage("session"):
+                save_session(session_id, conversation, preference_state, cursor)
+            yield format_sse("done", {"response": response, "session_id": session_id})
+        else:
+            yield format_sse("done", {"response": response, "history": chat_history})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def format_sse(event, payload):
+    """Formatea un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def sse_tokens(tokens):
+    """Reenvía como eventos ``token`` los fragmentos de un generador y devuelve su valor final."""
+    while True:
+        try:
+            token = next(tokens)
+        except StopIteration as stop:
+            return stop.value
+        yield format_sse("token", {"text": token})
+
+def start_turn_event(user_message, session_id=None, chat_history=None):
+    """Empieza el evento del turno actual, si el registro de eventos está activo.
+
+    Con sesión, el turno se asocia a un hash del id de sesión; sin ella, a un
+    hash de los mensajes anteriores (hay que llamarla antes de añadir el nuevo).
+    """
+    if event_log is None:
+        return
+    event = {"type": "chat_turn", "ts": time.time(), "message": user_message}
+    if session_id is not None:
+        event["conversation"] = conversation_key(session_id)
+    else:
+        event["parent"] = history_digest(chat_history)
+    _turn_event.set(event)
+
+def note_turn(**fields):
+    """Añade datos al evento del turno actual (no hace nada si no hay uno en curso)."""
+    event = _turn_event.get()
+    if event is not None:
+        event.update(fields)
+
+def log_turn_event(response):
+    """Envía el evento del turno actual al registro sin esperar a que se escriba."""
+    event = _turn_event.get()
+    if event is None:
+        return
+    _turn_event.set(None)
+    event["seconds"] = round(time.time() - event["ts"], 4)
+    event["response_chars"] = len(response)
+    event_log.log(event)
+
+def open_session(session_id):
+    """Carga la conversación de una sesión, o crea una nueva si no existe o expiró.
+
+    Devuelve ``(session_id, conversación, PreferenceState, RecommendationCursor)``.
+    """
+    conversation = session_store.get(session_id) if session_id else None
+    if conversation is None:
+        # Sesión nueva, expirada o expulsada: empezar una conversación nueva
+        session_id = new_session_id()
+        conversation = {"history": [], "preferences": PreferenceState().to_dict()}
+    elif isinstance(conversation, list):
+        # Sesión guardada cuando sólo se guardaba el historial
+        conversation = {
+            "history": conversation,
+            "preferences": PreferenceState.from_history(conversation).to_dict(),
+            "cursor": RecommendationCursor.from_history(conversation).to_dict(),
+        }
+    return (
+        session_id,
+        conversation,
+        PreferenceState.from_dict(conversation["preferences"]),
+        RecommendationCursor.from_dict(conversation.get("cursor")),
+    )
+
+def save_session(session_id, conversation, preference_state, cursor):
+    """Guarda la conversación de una sesión con el historial recortado."""
+    # Las preferencias viven en el estado, así que basta con los últimos mensajes
+    conversation["history"] = conversation["history"][-SESSION_HISTORY_LIMIT:]
+    conversation["preferences"] = preference_state.to_dict()
+    conversation["cursor"] = cursor.to_dict()
+    session_store.save(session_id, conversation)
+
+def handle_chat_turn(user_message, chat_history, preference_state=None, cursor=None):
+    """Procesa un mensaje del usuario, actualiza el historial y devuelve la respuesta.
+
+    Si se pasa un PreferenceState, se le incorpora sólo el mensaje nuevo y las
+    preferencias salen de él; si no, se extraen recorriendo todo el historial.
+    Lo mismo con el RecommendationCursor: sin él, las películas ya mostradas
+    se leen de los enlaces del historial.
+    """
+    with stage("route"):
+        action, value = plan_chat_turn(user_message, chat_history, preference_state)
+    
+    with deadline_scope(CHAT_DEADLINE):
+        if action == "recommend":
+            cursor = cursor or RecommendationCursor.from_history(chat_history)
+            movies = get_movie_recommendations(value, cursor)
+            note_turn(recommendations=[movie.get("id") for movie in movies])
+            response = recommendation_response(movies)
+        elif action == "generate":
+            response = finish_ai_response(generate_ai_response(chat_history), chat_history)
+        else:
+            response = value
+
+    chat_history.append({"role": "assistant", "content": response})
+    
+    return response
+
+def stream_chat_turn(user_message, chat_history, preference_state=None, cursor=None):
+    """Versión en streaming de handle_chat_turn: genera fragmentos y devuelve la respuesta final."""
+    with stage("route"):
+        action, value = plan_chat_turn(user_message, chat_history, preference_state)
+    
+    with deadline_scope(CHAT_DEADLINE):
+        if action == "recommend":
+            cursor = cursor or RecommendationCursor.from_history(chat_history)
+            movies = get_movie_recommendations(value, cursor)
+            note_turn(recommendations=[movie.get("id") for movie in movies])
+            response = recommendation_response(movies)
+            yield response
+        elif action == "generate":
+            response = yield from stream_ai_response(chat_history)
+            response = finish_ai_response(response, chat_history)
+        else:
+            response = value
+            yield response
+
+    chat_history.append({"role": "assistant", "content": response})
+    
+    return response
+
+def plan_chat_turn(user_message, chat_history, preference_state=None):
+    """Añade el mensaje al historial y decide qué rama del chat lo responde.
+
+    Devuelve ``("reply", respuesta)`` cuando la respuesta se resuelve sin llamadas
+    externas, ``("recommend", preferencias)`` cuando hay que buscar películas en
+    TMDb y ``("generate", None)`` cuando hay que generar una respuesta
+    conversacional. Así la misma lógica sirve al camino síncrono y al asíncrono.
+    """
+    return routed(*route_chat_turn(user_message, chat_history, preference_state))
+
+def route_chat_turn(user_message, chat_history, preference_state=None):
+    """Como plan_chat_turn, pero devuelve ``(rama, acción, valor)`` sin contar la rama en /metrics.
+
+    Sirve también para saber qué rama responderá un mensaje sin afectar a las
+    métricas (por ejemplo, en benchmarks/loadtest.py).
+    """
     chat_history.append({"role": "user", "content": user_message})
     
     # Normalizar el mensaje del usuario para comparaciones
     user_message_normalized = normalize_text(user_message)
+    # Escanear el mensaje una sola vez; los predicados reutilizan este resultado
+    message_match = scan_message(user_message_normalized)
+    if preference_state is not None:
+        preference_state.fold(message_match)
     
     # Verificar si es una respuesta afirmativa a una pregunta de recomendación
     if is_affirmative_response(user_message_normalized) and should_recommend_based_on_context(chat_history):
-        # Extraer preferencias del historial de chat
-        preferences = extract_preferences(chat_history)
-        
-        # Obtener recomendaciones de películas
-        movies = get_movie_recommendations(preferences)
-        
-        if movies:
-            response = format_movie_recommendations(movies)
-        else:
-            response = "No encontré películas que coincidan con tus preferencias. ¿Te gustaría intentar con otros géneros?"
+        # Extraer preferencias del estado acumulado o del historial de chat
+        return "affirmative", "recommend", current_preferences(chat_history, preference_state)
     
     # Verificar si es una respuesta negativa a una pregunta de recomendación
-    elif is_negative_response(user_message_normalized) and should_recommend_based_on_context(chat_history):
-        response = "Entiendo. ¿Hay algún otro tipo de película que te interese? Puedes mencionar géneros, directores, actores o años específicos."
+    if is_negative_response(user_message_normalized) and should_recommend_based_on_context(chat_history):
+        return "negative", "reply", "Entiendo. ¿Hay algún otro tipo de película que te interese? Puedes mencionar géneros, directores, actores o años específicos."
     
     # Verificar si se mencionó a un director, actor o década específica
-    elif has_specific_criteria(user_message_normalized):
-        # Extraer preferencias específicas
+    if has_specific_criteria(user_message_normalized):
+        # Extraer preferencias específicas y confirmarlas
         preferences = extract_specific_preferences(user_message_normalized)
-        
-        # Confirmar las preferencias detectadas
-        response = confirm_preferences(preferences)
+        note_turn(preferences=preferences)
+        return "specific_criteria", "reply", confirm_preferences(preferences)
     
     # Verificar si se requieren recomendaciones de películas explícitamente
-    elif any(kw in user_message_normalized for kw in RECOMMENDATION_KEYWORDS):
-        # Extraer preferencias del historial de chat
-        preferences = extract_preferences(chat_history)
-        
-        # Obtener recomendaciones de películas
-        movies = get_movie_recommendations(preferences)
-        
-        if movies:
-            response = format_movie_recommendations(movies)
-        else:
-            response = "No encontré películas que coincidan con tus preferencias. ¿Te gustaría intentar con otros géneros?"
+    if message_match.has("recommendation"):
+        return "explicit_recommendation", "recommend", current_preferences(chat_history, preference_state)
+    
+    # Verificar si el mensaje es una respuesta a una pregunta sobre era
+    if is_era_response(user_message_normalized):
+        return "era", "reply", FALLBACK_RESPONSES["popularity_question"]
+    
+    # Verificar si el mensaje es una respuesta a una pregunta sobre popularidad
+    if is_popularity_response(user_message_normalized):
+        return "popularity", "reply", FALLBACK_RESPONSES["recommendation_prompt"]
+    
+    # Generar respuesta conversacional
+    return "conversation", "generate", None
+
+def routed(branch, action, value):
+    """Cuenta la rama de enrutado elegida, la anota en el evento del turno y devuelve la acción de plan_chat_turn."""
+    CHAT_BRANCHES.inc(branch=branch)
+    if action == "recommend":
+        note_turn(branch=branch, preferences=dict(value))
     else:
-        # Verificar si el mensaje es una respuesta a una pregunta sobre era
-        if is_era_response(user_message_normalized):
-            response = FALLBACK_RESPONSES["popularity_question"]
-        # Verificar si el mensaje es una respuesta a una pregunta sobre popularidad
-        elif is_popularity_response(user_message_normalized):
-            response = FALLBACK_RESPONSES["recommendation_prompt"]
-        else:
-            # Generar respuesta conversacional
-            response = generate_ai_response(chat_history)
-            
-            # Verificar si la respuesta está truncada y arreglarla
-            if len(response) > 10 and not response.endswith((".", "!", "?")):
-                # La respuesta parece estar truncada, usar una respuesta más corta y controlada
-                response = generate_fallback_response(chat_history)
+        note_turn(branch=branch)
+    return action, value
 
-    chat_history.append({"role": "assistant", "content": response})
-    
-    return jsonify({"response": response, "history": chat_history})
+def recommendation_response(movies):
+    """Mensaje con las películas recomendadas, o aviso si no se encontró ninguna."""
+    if movies:
+        return format_movie_recommendations(movies)
+    return "No encontré películas que coincidan con tus preferencias. ¿Te gustaría intentar con otros géneros?"
+
+def finish_ai_response(response, chat_history):
+    """Sustituye por una respuesta de respaldo las respuestas generadas que parecen truncadas."""
+    if len(response) > 10 and not response.endswith((".", "!", "?")):
+        # La respuesta parece estar truncada, usar una respuesta más corta y controlada
+        return generate_fallback_response(chat_history)
+    return response
+
+def current_preferences(chat_history, preference_state=None):
+    """Preferencias actuales: del estado incremental si existe, o del historial completo."""
+    if preference_state is not None:
+        return preference_state.to_preferences()
+    return extract_preferences(chat_history)
 
 def is_affirmative_response(normalized_message):
     """Detecta si el mensaje es una respuesta afirmativa."""
-    return any(keyword == normalized_message or keyword in normalized_message.split() for keyword in AFFIRMATIVE_KEYWORDS)
+    return scan_message(normalized_message).has("affirmative")
 
 def is_negative_response(normalized_message):
     """Detecta si el mensaje es una respuesta negativa."""
-    return any(keyword == normalized_message or keyword in normalized_message.split() for keyword in NEGATIVE_KEYWORDS)
+    return scan_message(normalized_message).has("negative")
 
 def should_recommend_based_on_context(chat_history):
     """Determina si el contexto de la conversación sugiere que se deben mostrar recomendaciones."""
@@ -212,41 +740,22 @@ def should_recommend_based_on_context(chat_history):
         return False
     
     # Verificar si el último mensaje del asistente sugiere recomendaciones
-    last_assistant_messages = [msg["content"] for msg in chat_history if msg["role"] == "assistant"]
-    if not last_assistant_messages:
-        return False
+    # (se recorre desde el final: normalmente es el penúltimo mensaje)
+    for msg in reversed(chat_history):
+        if msg["role"] == "assistant":
+            last_assistant_message = normalize_text(msg["content"])
+            # Buscar frases que sugieran que el asistente está listo para recomendar
+            return scan_message(last_assistant_message).has("recommendation_phrase")
     
-    last_assistant_message = normalize_text(last_assistant_messages[-1])
-    
-    # Buscar frases que sugieran que el asistente está listo para recomendar
-    recommendation_phrases = [
-        "quieres ver mis recomendaciones",
-        "te muestro algunas opciones",
-        "te recomiendo",
-        "puedo recomendarte",
-        "te gustaria ver"
-    ]
-    
-    return any(phrase in last_assistant_message for phrase in recommendation_phrases)
+    return False
 
 def has_specific_criteria(normalized_message):
     """Detecta si el mensaje contiene criterios específicos como director, actor o década."""
-    # Verificar si se menciona a un director o actor
-    for person in FAMOUS_PEOPLE.keys():
-        if person in normalized_message:
-            return True
-    
-    # Verificar si se menciona una década
-    for decade in DECADES.keys():
-        if decade in normalized_message:
-            return True
-    
-    # Verificar si se menciona un año específico (formato: 4 dígitos)
-    year_pattern = r'\b(19\d{2}|20\d{2})\b'
-    if re.search(year_pattern, normalized_message):
+    match = scan_message(normalized_message)
+    # Director o actor, década o año específico (formato: 4 dígitos)
+    if match.has("person") or match.has("decade") or match.years:
         return True
-    
-    return False
+    return find_person(normalized_message) is not None
 
 def extract_specific_preferences(normalized_message):
     """Extrae preferencias específicas del mensaje del usuario."""
@@ -258,40 +767,40 @@ def extract_specific_preferences(normalized_message):
         "year_to": None
     }
     
+    match = scan_message(normalized_message)
+    
     # Detectar director o actor
-    for person, info in FAMOUS_PEOPLE.items():
-        if person in normalized_message:
-            if "director" in info:
-                preferences["director"] = info["director"]
-            elif "actor" in info:
-                preferences["actor"] = info["actor"]
-            
-            # También asignar el género asociado
-            preferences["genre"] = info.get("genre")
-            break
+    person = match.first("person")
+    if person:
+        info = FAMOUS_PEOPLE[person]
+        if "director" in info:
+            preferences["director"] = info["director"]
+        elif "actor" in info:
+            preferences["actor"] = info["actor"]
+        
+        # También asignar el género asociado
+        preferences["genre"] = info.get("genre")
+    else:
+        # Cualquier otra persona, si hay índice local (sin género asociado)
+        named = find_person(normalized_message)
+        if named:
+            preferences["director" if named.director else "actor"] = named.name
     
     # Detectar década
-    for decade, years in DECADES.items():
-        if decade in normalized_message:
-            preferences["year_from"] = years["start_year"]
-            preferences["year_to"] = years["end_year"]
-            break
+    decade = match.first("decade")
+    if decade:
+        preferences["year_from"] = DECADES[decade]["start_year"]
+        preferences["year_to"] = DECADES[decade]["end_year"]
     
     # Detectar año específico
-    year_pattern = r'\b(19\d{2}|20\d{2})\b'
-    year_match = re.search(year_pattern, normalized_message)
-    if year_match:
-        specific_year = year_match.group(1)
+    if match.years:
+        specific_year = match.years[0]
         preferences["year_from"] = specific_year
         preferences["year_to"] = specific_year
     
     # Detectar género
     if not preferences["genre"]:
-        for genre in GENRE_MAP.keys():
-            normalized_genre = normalize_text(genre)
-            if normalized_genre in normalized_message:
-                preferences["genre"] = genre
-                break
+        preferences["genre"] = match.first("genre")
     
     return preferences
 
@@ -331,138 +840,155 @@ def confirm_preferences(preferences):
 
 def is_era_response(normalized_message):
     """Detecta si el mensaje es una respuesta sobre la era de las películas."""
-    for era, keywords in ERA_KEYWORDS.items():
-        if any(keyword in normalized_message for keyword in keywords):
-            return True
-    return False
+    return scan_message(normalized_message).has("era")
 
 def is_popularity_response(normalized_message):
     """Detecta si el mensaje es una respuesta sobre la popularidad de las películas."""
-    for popularity, keywords in POPULARITY_KEYWORDS.items():
-        if any(keyword in normalized_message for keyword in keywords):
-            return True
-    return False
+    return scan_message(normalized_message).has("popularity")
 
-def extract_preferences(chat_history):
-    """Extract movie preferences from chat history."""
-    # Método de respaldo para extraer preferencias
-    preferences = {
-        "genre": None,
-        "director": None,
-        "actor": None,
-        "year_from": None,
-        "year_to": None,
-        "era": "any",
-        "popularity": "any"
-    }
-    
-    # Combinar todos los mensajes del usuario y normalizar
-    user_messages = " ".join(msg["content"] for msg in chat_history if msg["role"] == "user")
-    user_messages_normalized = normalize_text(user_messages)
-    
-    # Detectar menciones de personas famosas
-    for person, info in FAMOUS_PEOPLE.items():
-        if person in user_messages_normalized:
+# Pedidos de películas parecidas a un título: "parecidas a <título>" (mensaje normalizado)
+SIMILAR_TO_PATTERN = re.compile(
+    r"\b(?:parecid[oa]s?\s+a|similar(?:es)?\s+a|del estilo de|como la pelicula)\s+(?P<title>[^.,;:!?¿¡]+)"
+)
+
+def extract_similar_title(normalized_message):
+    """Título mencionado en un pedido de películas parecidas, o None."""
+    match = SIMILAR_TO_PATTERN.search(normalized_message)
+    if match:
+        return match.group("title").strip() or None
+    return None
+
+class PreferenceState:
+    """Preferencias acumuladas de una conversación, actualizadas mensaje a mensaje.
+
+    Cada mensaje del usuario se incorpora una sola vez con ``fold``; se conserva
+    la coincidencia de mayor prioridad por tabla ("la primera gana") y el rango de
+    años mencionados, así que el historial puede recortarse sin perder preferencias.
+    Para "parecidas a <título>" vale la mención más reciente, hasta que un mensaje
+    posterior pida otro género, persona o fecha.
+    """
+
+    __slots__ = ("person", "named_person", "decade", "genre", "era", "popularity", "year_min", "year_max", "similar_to")
+
+    TABLES = ("person", "decade", "genre", "era", "popularity")
+
+    def __init__(self):
+        # Cada tabla guarda un par (prioridad, valor) o None
+        self.person = None
+        # Persona del índice local: par (rol, nombre), la primera mencionada
+        self.named_person = None
+        self.decade = None
+        self.genre = None
+        self.era = None
+        self.popularity = None
+        self.year_min = None
+        self.year_max = None
+        self.similar_to = None
+
+    def fold(self, match):
+        """Incorpora el MessageMatch de un mensaje nuevo del usuario."""
+        for table in self.TABLES:
+            hit = match.hit(table)
+            if hit is not None:
+                current = getattr(self, table)
+                if current is None or hit[0] < current[0]:
+                    setattr(self, table, hit)
+        for year in match.years:
+            if self.year_min is None or int(year) < int(self.year_min):
+                self.year_min = year
+            if self.year_max is None or int(year) > int(self.year_max):
+                self.year_max = year
+        if self.named_person is None:
+            named = find_person(match.text)
+            if named:
+                self.named_person = ("director" if named.director else "actor", named.name)
+        similar_to = extract_similar_title(match.text)
+        if similar_to:
+            self.similar_to = similar_to
+        elif (match.has("person") or match.has("decade") or match.has("genre") or match.years
+              or find_person(match.text)):
+            # Criterios nuevos sin "parecidas a": la película de referencia deja de valer
+            self.similar_to = None
+        return self
+
+    @classmethod
+    def from_history(cls, chat_history):
+        """Reconstruye el estado recorriendo todos los mensajes del usuario."""
+        state = cls()
+        for msg in chat_history:
+            if msg["role"] == "user":
+                state.fold(scan_message(normalize_text(msg["content"])))
+        return state
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        for table in cls.TABLES:
+            hit = data.get(table)
+            setattr(state, table, tuple(hit) if hit else None)
+        state.named_person = tuple(data["named_person"]) if data.get("named_person") else None
+        state.year_min = data.get("year_min")
+        state.year_max = data.get("year_max")
+        state.similar_to = data.get("similar_to")
+        return state
+
+    def to_preferences(self):
+        """Devuelve el diccionario de preferencias con el formato de extract_preferences."""
+        preferences = {
+            "genre": None,
+            "director": None,
+            "actor": None,
+            "year_from": None,
+            "year_to": None,
+            "era": "any",
+            "popularity": "any",
+            "similar_to": self.similar_to
+        }
+        
+        # Personas famosas (también asignan el género asociado)
+        if self.person:
+            info = FAMOUS_PEOPLE[self.person[1]]
             if "director" in info:
                 preferences["director"] = info["director"]
             elif "actor" in info:
                 preferences["actor"] = info["actor"]
-            
-            # También asignar el género asociado
             preferences["genre"] = info.get("genre")
-            break
-    
-    # Detectar década o año específico
-    for decade, years in DECADES.items():
-        if decade in user_messages_normalized:
-            preferences["year_from"] = years["start_year"]
-            preferences["year_to"] = years["end_year"]
-            break
-    
-    # Detectar año específico
-    year_pattern = r'\b(19\d{2}|20\d{2})\b'
-    year_matches = re.findall(year_pattern, user_messages_normalized)
-    if year_matches:
-        # Si hay múltiples años, usar el rango
-        if len(year_matches) > 1:
-            years = sorted([int(y) for y in year_matches])
-            preferences["year_from"] = str(years[0])
-            preferences["year_to"] = str(years[-1])
-        else:
-            specific_year = year_matches[0]
-            preferences["year_from"] = specific_year
-            preferences["year_to"] = specific_year
-    
-    # Detectar género
-    if not preferences["genre"]:
-        for genre, genre_id in GENRE_MAP.items():
-            normalized_genre = normalize_text(genre)
-            if normalized_genre in user_messages_normalized:
-                preferences["genre"] = genre
-                break
-    
-    # Si no se detectó ningún género, usar "action" como predeterminado
-    if not preferences["genre"]:
-        preferences["genre"] = "action"
-    
-    # Detectar era
-    for era, keywords in ERA_KEYWORDS.items():
-        if any(keyword in user_messages_normalized for keyword in keywords):
-            preferences["era"] = era
-            break
-    
-    # Detectar popularidad
-    for popularity, keywords in POPULARITY_KEYWORDS.items():
-        if any(keyword in user_messages_normalized for keyword in keywords):
-            preferences["popularity"] = popularity
-            break
-    
-    return preferences
-
-def generate_ai_response(chat_history):
-    """Generate a conversational response using Hugging Face."""
-    try:
-        # Obtener el último mensaje del usuario y normalizarlo
-        user_message = chat_history[-1]["content"]
-        user_message_normalized = normalize_text(user_message)
-        
-        # Detectar género mencionado
-        detected_genre = None
-        for genre in GENRE_MAP.keys():
-            normalized_genre = normalize_text(genre)
-            if normalized_genre in user_message_normalized:
-                detected_genre = genre
-                break
-        
-        # Si se detectó un género, usar respuesta predefinida
-        if detected_genre:
-            # Buscar el género en las respuestas predefinidas
-            for key in FALLBACK_RESPONSES["genre_followup"].keys():
-                if normalize_text(key) == normalize_text(detected_genre):
-                    return FALLBACK_RESPONSES["genre_followup"][key]
-            
-            # Si no se encuentra una respuesta específica, usar la respuesta predeterminada
-            return FALLBACK_RESPONSES["genre_followup"]["default"]
+        elif self.named_person:
+            role, name = self.named_person
+            preferences[role] = name
         
-        # Verificar si es una respuesta sobre era
-        if is_era_response(user_message_normalized):
-            return FALLBACK_RESPONSES["popularity_question"]
+        # Década
+        if self.decade:
+            preferences["year_from"] = DECADES[self.decade[1]]["start_year"]
+            preferences["year_to"] = DECADES[self.decade[1]]["end_year"]
         
-        # Verificar si es una respuesta sobre popularidad
-        if is_popularity_response(user_message_normalized):
-            return FALLBACK_RESPONSES["recommendation_prompt"]
+        # Año específico o rango de años (tiene prioridad sobre la década)
+        if self.year_min:
+            preferences["year_from"] = self.year_min
+            preferences["year_to"] = self.year_max
         
-        # Si el mensaje es corto y simple, usar respuestas predefinidas
-        if len(user_message.split()) <= 3:
-            return generate_fallback_response(chat_history)
+        # Género, o "action" como predeterminado (salvo con "parecidas a", que no lo necesita)
+        if not preferences["genre"] and self.genre:
+            preferences["genre"] = self.genre[1]
+        if not preferences["genre"] and not self.similar_to:
+            preferences["genre"] = "action"
         
-        # Para mensajes más complejos, usar Hugging Face
-        formatted_chat = []
-        for msg in chat_history[-3:]:  # Usar solo los últimos 3 mensajes para mantener el contexto manejable
-            role = "user" if msg["role"] == "user" else "assistant"
-            formatted_chat.append(f"<{role}>: {msg['content']}")
+        if self.era:
+            preferences["era"] = self.era[1]
+        if self.popularity:
+            preferences["popularity"] = self.popularity[1]
         
-        system_prompt = """
+        return preferences
+
+def extract_preferences(chat_history):
+    """Extract movie preferences from chat history."""
+    return PreferenceState.from_history(chat_history).to_preferences()
+
+# Prompt de sistema y parámetros de generación para Hugging Face
+AI_SYSTEM_PROMPT = """
         Eres un asistente de recomendación de películas amigable y conversacional.
         Tu objetivo es ayudar al usuario a encontrar películas que le gusten haciendo preguntas sobre sus preferencias.
         
@@ -473,38 +999,262 @@ def generate_ai_response(chat_history):
         Cuando tengas suficiente información, pregunta al usuario si quiere ver recomendaciones.
         No le pidas que escriba "recomiéndame películas", simplemente pregúntale si quiere ver tus recomendaciones.
         """
+
+# Id del modelo en Hugging Face o URL de un endpoint de Text Generation Inference
+HF_MODEL = os.environ.get("HF_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
+HF_GENERATION_PARAMS = {
+    "max_new_tokens": 100,  # Limitar la longitud para evitar respuestas truncadas
+    "temperature": 0.7,
+    "repetition_penalty": 1.2
+}
+
+# Micro-batching de generaciones (opcional): los prompts se agrupan unos
+# milisegundos y se envían en lote a Hugging Face o a un servidor local
+LLM_BATCH_URL = os.environ.get("LLM_BATCH_URL")
+generation_scheduler = None
+if os.environ.get("LLM_BATCHING") == "1" or LLM_BATCH_URL:
+    if LLM_BATCH_URL:
+        generation_backend = BatchEndpointBackend(LLM_BATCH_URL, HF_GENERATION_PARAMS, timeout=HF_TIMEOUT, breaker=hf_breaker)
+    else:
+        # get_hf_client se define más abajo; el cliente se sigue creando en la primera generación
+        generation_backend = HuggingFaceBackend(lambda: get_hf_client(), HF_MODEL, HF_GENERATION_PARAMS, breaker=hf_breaker)
+    generation_scheduler = GenerationScheduler(
+        generation_backend,
+        max_batch_size=int(os.environ.get("LLM_BATCH_MAX_SIZE", "8")),
+        max_wait=float(os.environ.get("LLM_BATCH_WINDOW_MS", "5")) / 1000,
+        max_queue=int(os.environ.get("LLM_QUEUE_MAX", "256")),
+    )
+
+@REGISTRY.collector
+def collect_generation_queue():
+    """Cola y configuración del micro-batching de generaciones, para /metrics."""
+    if generation_scheduler is None:
+        return
+    stats = generation_scheduler.stats()
+    yield "llm_queue_depth", "gauge", "Prompts esperando lote", {}, stats["queued"]
+    yield "llm_batches_in_flight", "gauge", "Lotes en el backend de generación", {}, stats["in_flight"]
+    yield "llm_queue_rejected_total", "counter", "Prompts rechazados con la cola llena", {}, stats["rejected"]
+    yield "llm_batch_window_seconds", "gauge", "Ventana máxima de agrupación", {}, generation_scheduler.max_wait
+    yield "llm_batch_max_size", "gauge", "Tamaño máximo de lote", {}, generation_scheduler.max_batch_size
+    yield "llm_queue_max", "gauge", "Capacidad de la cola de generación", {}, generation_scheduler.max_queue
+
+def generate_ai_response(chat_history):
+    """Generate a conversational response using Hugging Face."""
+    try:
+        reply, prompt = prepare_ai_response(chat_history)
+        if reply is not None:
+            GENERATIONS.inc(source="canned")
+            return reply
         
-        prompt = f"{system_prompt}\n\n{''.join(formatted_chat)}\n<assistant>:"
+        cached = completion_cache.get(prompt, HF_MODEL, HF_GENERATION_PARAMS)
+        if cached is not None:
+            GENERATIONS.inc(source="cache")
+            return cached
         
-        # Generar respuesta con Hugging Face
-        response = hf_client.text_generation(
-            prompt,
-            model="mistralai/Mistral-7B-Instruct-v0.2",
-            max_new_tokens=100,  # Limitar la longitud para evitar respuestas truncadas
-            temperature=0.7,
-            repetition_penalty=1.2
-        )
+        # Generar respuesta con Hugging Face (si el circuito está abierto o se
+        # agotó el plazo, la excepción lleva a la respuesta de respaldo)
+        key = completion_key(prompt, HF_MODEL, HF_GENERATION_PARAMS)
+        with stage("llm"):
+            response = hf_flight.do(key, complete_prompt, prompt)
+        GENERATIONS.inc(source="llm")
+        return response
+    
+    except Exception as e:
+        print(f"Error generating response with Hugging Face: {e}")
+        GENERATIONS.inc(source="fallback")
+        return generate_fallback_response(chat_history)
+
+def complete_prompt(prompt):
+    """Genera y limpia la respuesta del modelo para un prompt, y la guarda en la caché."""
+    if generation_scheduler is not None:
+        response = generation_scheduler.generate(prompt)
+    else:
+        client = hf_client_within_deadline()
+        with hf_breaker.guard(), upstream("hf", "text_generation"):
+            response = client.text_generation(prompt, model=HF_MODEL, **HF_GENERATION_PARAMS)
+    response = clean_ai_response(response)
+    completion_cache.set(prompt, HF_MODEL, HF_GENERATION_PARAMS, response)
+    return response
+
+def prepare_ai_response(chat_history):
+    """Devuelve ``(respuesta, None)`` si hay una respuesta predefinida, o ``(None, prompt)``."""
+    # Obtener el último mensaje del usuario y normalizarlo
+    user_message = chat_history[-1]["content"]
+    user_message_normalized = normalize_text(user_message)
+    
+    # Detectar género mencionado
+    detected_genre = scan_message(user_message_normalized).first("genre")
+    
+    # Si se detectó un género, usar respuesta predefinida (o la predeterminada)
+    if detected_genre:
+        return genre_followup_response(detected_genre), None
+    
+    # Verificar si es una respuesta sobre era
+    if is_era_response(user_message_normalized):
+        return FALLBACK_RESPONSES["popularity_question"], None
+    
+    # Verificar si es una respuesta sobre popularidad
+    if is_popularity_response(user_message_normalized):
+        return FALLBACK_RESPONSES["recommendation_prompt"], None
+    
+    # Si el mensaje es corto y simple, usar respuestas predefinidas
+    if len(user_message.split()) <= 3:
+        return generate_fallback_response(chat_history), None
+    
+    # Para mensajes más complejos, usar Hugging Face
+    return None, build_ai_prompt(chat_history)
+
+def get_hf_client():
+    """Cliente de Hugging Face compartido, creado la primera vez que se usa.
+
+    Importar huggingface_hub tarda varios cientos de milisegundos y la mayoría
+    de los turnos no generan texto, así que no se paga al arrancar.
+    """
+    global _hf_client
+    if _hf_client is None:
+        with _hf_client_lock:
+            if _hf_client is None:
+                _hf_client = new_hf_client(HF_TIMEOUT)
+    return _hf_client
+
+def new_hf_client(timeout):
+    from huggingface_hub import InferenceClient
+    return InferenceClient(token=HUGGINGFACE_API_KEY, timeout=timeout)
+
+def hf_client_within_deadline():
+    """Cliente de Hugging Face cuyo timeout no supera lo que queda del plazo.
+
+    Lanza DeadlineExceeded si el plazo ya se agotó.
+    """
+    timeout = bounded_timeout(HF_TIMEOUT)
+    if timeout >= HF_TIMEOUT:
+        return get_hf_client()
+    # El timeout es del cliente, no de la llamada: uno temporal (crearlo no abre conexiones)
+    return new_hf_client(timeout)
+
+def build_ai_prompt(chat_history):
+    """Construye el prompt para el modelo con los últimos mensajes de la conversación."""
+    formatted_chat = []
+    for msg in chat_history[-3:]:  # Usar solo los últimos 3 mensajes para mantener el contexto manejable
+        role = "user" if msg["role"] == "user" else "assistant"
+        formatted_chat.append(f"<{role}>: {msg['content']}")
+    
+    return f"{AI_SYSTEM_PROMPT}\n\n{''.join(formatted_chat)}\n<assistant>:"
+
+def stream_ai_response(chat_history):
+    """Como generate_ai_response, pero genera los fragmentos de texto a medida que llegan.
+
+    Devuelve la respuesta final; si hubo un error a mitad de camino es la
+    respuesta de respaldo, que reemplaza a lo enviado hasta entonces.
+    """
+    try:
+        reply, prompt = prepare_ai_response(chat_history)
+        if reply is not None:
+            GENERATIONS.inc(source="canned")
+            yield reply
+            return reply
         
-        # Limpiar la respuesta
-        response = response.strip()
-        if response.startswith("<assistant>:"):
-            response = response[len("<assistant>:"):].strip()
+        cached = completion_cache.get(prompt, HF_MODEL, HF_GENERATION_PARAMS)
+        if cached is not None:
+            GENERATIONS.inc(source="cache")
+            yield cached
+            return cached
         
-        # Asegurarse de que la respuesta termine con un signo de puntuación
-        if response and not response[-1] in ['.', '!', '?']:
-            # Buscar el último signo de puntuación y cortar ahí
-            last_period = max(response.rfind('.'), response.rfind('!'), response.rfind('?'))
-            if last_period > len(response) // 2:  # Solo cortar si el signo está en la segunda mitad
-                response = response[:last_period+1]
-            else:
-                response += "."
+        trimmer = StreamingResponseTrimmer()
+        client = hf_client_within_deadline()
+        with stage("llm"), upstream("hf", "text_generation_stream"):
+            # El breaker mide hasta el primer token: el resto llega al ritmo del cliente
+            with hf_breaker.guard():
+                tokens = iter(client.text_generation(prompt, model=HF_MODEL, stream=True, **HF_GENERATION_PARAMS))
+                first = next(tokens, None)
+            try:
+                for token in itertools.chain([first] if first is not None else [], tokens):
+                    # Cortar la generación si se agota el plazo entre tokens
+                    bounded_timeout(None)
+                    text = trimmer.feed(token)
+                    if text:
+                        yield text
+            except Exception:
+                hf_breaker.record_failure()
+                raise
         
+        remainder, response = trimmer.finish()
+        if remainder:
+            yield remainder
+        completion_cache.set(prompt, HF_MODEL, HF_GENERATION_PARAMS, response)
+        GENERATIONS.inc(source="llm")
         return response
     
     except Exception as e:
         print(f"Error generating response with Hugging Face: {e}")
+        GENERATIONS.inc(source="fallback")
         return generate_fallback_response(chat_history)
 
+class StreamingResponseTrimmer:
+    """Aplica clean_ai_response de forma incremental sobre los tokens generados.
+
+    Sólo deja pasar texto hasta el último signo de puntuación visto: lo que
+    viene después podría recortarse al final. El prefijo ``<assistant>:`` y los
+    espacios iniciales se descartan igual que en clean_ai_response.
+    """
+
+    PREFIX = "<assistant>:"
+
+    def __init__(self):
+        self.raw = ""
+        self.emitted = ""
+        self._body_start = None
+
+    def feed(self, token):
+        """Añade un token y devuelve el texto que ya es seguro mostrar (puede ser "")."""
+        self.raw += token
+        if self._body_start is None:
+            stripped = self.raw.lstrip()
+            if not stripped or self.PREFIX.startswith(stripped):
+                # Todavía no sabemos si la respuesta empieza con el prefijo
+                return ""
+            start = len(self.raw) - len(stripped)
+            if stripped.startswith(self.PREFIX):
+                start += len(self.PREFIX)
+                rest = self.raw[start:]
+                if not rest.strip():
+                    return ""
+                start += len(rest) - len(rest.lstrip())
+            self._body_start = start
+        
+        body = self.raw[self._body_start:]
+        last_period = max(body.rfind('.'), body.rfind('!'), body.rfind('?'))
+        if last_period < len(self.emitted):
+            return ""
+        text = body[len(self.emitted):last_period+1]
+        self.emitted += text
+        return text
+
+    def finish(self):
+        """Devuelve ``(resto, respuesta)``: el texto pendiente de enviar y la respuesta limpia."""
+        response = clean_ai_response(self.raw)
+        if response.startswith(self.emitted):
+            return response[len(self.emitted):], response
+        # No debería ocurrir: el evento final lleva la respuesta completa de todos modos
+        return "", response
+
+def clean_ai_response(response):
+    """Limpia la respuesta generada y la corta en el último signo de puntuación."""
+    response = response.strip()
+    if response.startswith("<assistant>:"):
+        response = response[len("<assistant>:"):].strip()
+    
+    # Asegurarse de que la respuesta termine con un signo de puntuación
+    if response and not response[-1] in ['.', '!', '?']:
+        # Buscar el último signo de puntuación y cortar ahí
+        last_period = max(response.rfind('.'), response.rfind('!'), response.rfind('?'))
+        if last_period > len(response) // 2:  # Solo cortar si el signo está en la segunda mitad
+            response = response[:last_period+1]
+        else:
+            response += "."
+    
+    return response
+
 def generate_fallback_response(chat_history):
     """Generar respuesta de respaldo cuando la API falla."""
     user_message = chat_history[-1]["content"]
@@ -515,22 +1265,11 @@ def generate_fallback_response(chat_history):
         return FALLBACK_RESPONSES["welcome"]
     
     # Detectar género mencionado
-    detected_genre = None
-    for genre in GENRE_MAP.keys():
-        normalized_genre = normalize_text(genre)
-        if normalized_genre in user_message_normalized:
-            detected_genre = genre
-            break
+    detected_genre = scan_message(user_message_normalized).first("genre")
     
-    # Si se detectó un género
+    # Si se detectó un género, usar respuesta predefinida (o la predeterminada)
     if detected_genre:
-        # Buscar el género en las respuestas predefinidas
-        for key in FALLBACK_RESPONSES["genre_followup"].keys():
-            if normalize_text(key) == normalize_text(detected_genre):
-                return FALLBACK_RESPONSES["genre_followup"][key]
-        
-        # Si no se encuentra una respuesta específica, usar la respuesta predeterminada
-        return FALLBACK_RESPONSES["genre_followup"]["default"]
+        return genre_followup_response(detected_genre)
     
     # Verificar si es una respuesta sobre era
     if is_era_response(user_message_normalized):
@@ -543,11 +1282,174 @@ def generate_fallback_response(chat_history):
     # Si no se entiende la respuesta
     return FALLBACK_RESPONSES["fallback"]
 
-def get_movie_recommendations(preferences):
-    """Get movie recommendations from TMDb based on preferences."""
-    if not TMDB_API_KEY:
+def get_movie_recommendations(preferences, cursor=None, limit=3):
+    """Get movie recommendations from TMDb based on preferences.
+
+    Con un RecommendationCursor sigue la consulta donde se quedó y omite las
+    películas ya mostradas en la conversación.
+    """
+    cursor = cursor or RecommendationCursor()
+    similar = similar_recommendations(preferences, cursor, limit)
+    if similar:
+        return similar
+    
+    if not TMDB_API_KEY and movie_catalog is None:
         return []
 
+    params = build_discover_params(preferences)
+    
+    # Buscar por director o actor si está disponible
+    person_name = preferred_person(preferences)
+    if person_name:
+        person_info = get_person_id(person_name)
+        if person_info:
+            params["with_people"] = person_info["id"]
+
+    try:
+        return next_recommendations(cursor, params, limit)
+    except requests.RequestException as e:
+        print(f"Error fetching movie recommendations: {e}")
+        return []
+
+def batch_recommendations(preference_sets, limit=3, max_workers=None):
+    """Recomendaciones para muchos conjuntos de preferencias (trabajos offline, boletines).
+
+    Genera un registro por conjunto, ``{"index": i, "recommendations": [...]}``
+    o ``{"index": i, "error": "..."}``, a medida que se resuelven (no en orden).
+    Los conjuntos idénticos se consultan una sola vez: primero se resuelven las
+    personas distintas y después las consultas distintas a /discover/movie, con
+    como mucho ``max_workers`` llamadas simultáneas y prioridad de segundo
+    plano en el limitador de TMDb (el chat pasa antes).
+    """
+    groups = {}
+    for index, preferences in enumerate(preference_sets):
+        groups.setdefault(canonical_key(preferences, exclude=()), (preferences, []))[1].append(index)
+    
+    pending = []
+    for preferences, indices in groups.values():
+        similar = similar_recommendations(preferences, limit=limit)
+        if similar or (not TMDB_API_KEY and movie_catalog is None):
+            yield from batch_records(indices, {"recommendations": trim_movies(similar)})
+        else:
+            pending.append((preferences, indices))
+    if not pending:
+        return
+    
+    with ThreadPoolExecutor(max_workers=max_workers or BATCH_MAX_WORKERS, thread_name_prefix="batch") as executor:
+        names = list({preferred_person(preferences) for preferences, _ in pending} - {None})
+        people = dict(zip(names, executor.map(with_priority(BACKGROUND, get_person_id), names)))
+        
+        # Conjuntos distintos pueden acabar en la misma consulta (p. ej. géneros desconocidos)
+        discover_queries = {}
+        for preferences, indices in pending:
+            params = build_discover_params(preferences)
+            person_info = people.get(preferred_person(preferences))
+            if person_info:
+                params["with_people"] = person_info["id"]
+            discover_queries.setdefault(canonical_key(params), (params, []))[1].extend(indices)
+        
+        futures = {
+            executor.submit(with_priority(BACKGROUND, discover_with_fallbacks), params): indices
+            for params, indices in discover_queries.values()
+        }
+        try:
+            for future in as_completed(futures):
+                try:
+                    _, results = future.result()
+                    record = {"recommendations": trim_movies(results[:limit])}
+                except requests.RequestException as e:
+                    # El texto de la excepción lleva la URL con la api_key: sólo al log
+                    print(f"Error in batch recommendations: {e}")
+                    record = {"error": "No se pudo consultar TMDb"}
+                yield from batch_records(futures[future], record)
+        finally:
+            # Si el cliente se desconecta, no seguir consultando lo pendiente
+            for future in futures:
+                future.cancel()
+
+def batch_records(indices, record):
+    for index in indices:
+        yield {"index": index, **record}
+
+def trim_movies(movies):
+    return [{field: movie.get(field) for field in MOVIE_FIELDS} for movie in movies]
+
+def next_recommendations(cursor, params, limit=3):
+    """Siguientes películas no vistas de la consulta.
+
+    Se sirven del buffer del cursor y sólo se piden páginas nuevas cuando no
+    alcanza; al final se precarga la página siguiente si el buffer se acaba.
+    """
+    cursor.start(canonical_key(params), params)
+    movies = cursor.take(limit)
+    for _ in range(MAX_PAGES_PER_TURN):
+        if len(movies) >= limit:
+            break
+        page_params = cursor.next_page_params()
+        if page_params is None:
+            break
+        with stage("discover"):
+            if cursor.page == 0:
+                # Primera página: aplicar la escalera de variantes y recordar la que respondió
+                page_params, results = discover_with_fallbacks(with_api_key(page_params))
+            else:
+                results = discover_movies(with_api_key(page_params))
+        cursor.add_page(page_params, results)
+        movies += cursor.take(limit - len(movies))
+    
+    prefetch_next_page(cursor, limit)
+    return movies
+
+def with_api_key(params):
+    return {"api_key": TMDB_API_KEY, **params}
+
+def prefetch_next_page(cursor, limit=3):
+    """Pide en segundo plano la página siguiente si la próxima respuesta la va a necesitar.
+
+    El resultado queda en discover_cache, así que "más recomendaciones" no espera a la red.
+    """
+    params = cursor.next_page_params()
+    if params is None or len(cursor.buffer) >= limit:
+        return
+    params = with_api_key(params)
+    if movie_catalog is not None and movie_catalog.supports(params):
+        return
+    # Sin copiar el contexto: la precarga no está sujeta al plazo de la petición
+    discover_executor.submit(prefetch_page, params)
+
+def prefetch_page(params):
+    try:
+        with priority_scope(PREFETCH):
+            discover_movies(params)
+    except RateLimited:
+        pass  # sin cuota libre no se precarga; la página se pedirá si hace falta
+    except requests.RequestException as e:
+        print(f"Error prefetching movie recommendations: {e}")
+
+def similar_recommendations(preferences, cursor=None, limit=3):
+    """Películas parecidas al título pedido con "parecidas a ...", si hay índice de similitud.
+
+    Sólo se proponen las que cumplen el género, las fechas y la popularidad
+    pedidos (los mismos filtros que /discover/movie); la persona no se comprueba
+    porque el catálogo local no la conoce.
+    """
+    if not preferences.get("similar_to") or movie_similarity is None:
+        return []
+    params = build_discover_params(preferences)
+    if cursor is None:
+        return movie_similarity.similar_to(preferences["similar_to"], k=limit, params=params)
+    
+    # Pedir tantas de más como películas ya vistas, para completar el límite
+    candidates = movie_similarity.similar_to(
+        preferences["similar_to"], k=limit + cursor.seen.count, params=params
+    )
+    movies = [movie for movie in candidates if movie.get("id") not in cursor.seen][:limit]
+    for movie in movies:
+        cursor.mark_seen(movie)
+    return movies
+
+def build_discover_params(preferences):
+    """Parámetros de /discover/movie para unas preferencias (sin el filtro de persona)."""
     # Parámetros base para la API
     params = {
         "api_key": TMDB_API_KEY,
@@ -559,12 +1461,7 @@ def get_movie_recommendations(preferences):
 
     # Añadir filtro de género si está disponible
     if preferences.get("genre"):
-        genre = preferences["genre"].lower()
-        genre_id = None
-        for g, gid in GENRE_MAP.items():
-            if normalize_text(g) == normalize_text(genre):
-                genre_id = gid
-                break
+        genre_id = GENRE_IDS.get(normalize_text(preferences["genre"]))
         
         if genre_id:
             params["with_genres"] = genre_id
@@ -587,60 +1484,164 @@ def get_movie_recommendations(preferences):
             "vote_average.gte": "7"
         })
     
-    # Buscar por director o actor si está disponible
-    person_id = None
+    return params
+
+def preferred_person(preferences):
+    """Nombre del director (o, si no hay, del actor) por el que filtrar."""
     if preferences.get("director"):
-        person_info = get_person_id(preferences["director"])
-        if person_info:
-            person_id = person_info["id"]
-    elif preferences.get("actor"):
-        person_info = get_person_id(preferences["actor"])
-        if person_info:
-            person_id = person_info["id"]
+        return preferences["director"]
+    if preferences.get("actor"):
+        return preferences["actor"]
+    return None
+
+def discover_fallback_ladder(params):
+    """Variantes de búsqueda en orden de prioridad, de la más específica a la más amplia."""
+    variants = [params]
+    
+    # Si no hay resultados, intentar una búsqueda más amplia
+    if "with_genres" in params:
+        params = {k: v for k, v in params.items() if k != "with_genres"}
+        variants.append(params)
     
-    if person_id:
-        params["with_people"] = person_id
+    # Si aún no hay resultados y hay filtro de persona, intentar sin él
+    if "with_people" in params:
+        params = {k: v for k, v in params.items() if k != "with_people"}
+        variants.append(params)
+    
+    return variants
+
+def preference_grid():
+    """Preferencias sin persona que produce el chat: género × década o época × popularidad."""
+    genres = {}
+    for genre, genre_id in GENRE_MAP.items():
+        genres.setdefault(genre_id, genre)
+    windows = [{"year_from": decade["start_year"], "year_to": decade["end_year"]} for decade in DECADES.values()]
+    windows += [{"era": era} for era in ("recent", "classic", "any")]
+    for genre in genres.values():
+        for window in windows:
+            for popularity in ("popular", "hidden_gems"):
+                yield {"genre": genre, "popularity": popularity, **window}
 
+def snapshot_queries():
+    """Consultas distintas de la rejilla, con sus variantes de respaldo (sin api_key)."""
+    queries = {}
+    for preferences in preference_grid():
+        params = build_discover_params(preferences)
+        params.pop("api_key")
+        for variant in discover_fallback_ladder(params):
+            queries.setdefault(canonical_key(variant), variant)
+    return list(queries.values())
+
+def refresh_recommendation_snapshot():
+    """Regenera la instantánea con prioridad de segundo plano (sin pasar por discover_movies)."""
+    def fetch(params):
+        return tmdb_get("/discover/movie", with_api_key(params)).get("results", [])
+
+    with priority_scope(BACKGROUND):
+        return build_snapshot(recommendation_snapshot.path, snapshot_queries(), fetch, RECOMMENDATION_SNAPSHOT_PAGES)
+
+def discover_with_fallbacks(params):
+    """Devuelve ``(variante, resultados)`` con el primer resultado no vacío de la escalera.
+
+    En modo paralelo (TMDB_PARALLEL_FALLBACK=1) todas las variantes se lanzan a
+    la vez y se espera por orden de prioridad, así que el peor caso cuesta un
+    solo viaje de ida y vuelta; las que siguen pendientes se cancelan o ignoran.
+    """
+    variants = discover_fallback_ladder(params)
+    
+    if not TMDB_PARALLEL_FALLBACK or len(variants) == 1:
+        results = []
+        for variant in variants:
+            results = discover_movies(variant)
+            if results:
+                break
+        return variant, results
+    
+    # Cada tarea lleva una copia del contexto para heredar el plazo de la petición
+    futures = [
+        discover_executor.submit(contextvars.copy_context().run, discover_movies, variant)
+        for variant in variants
+    ]
     try:
-        # Realizar la búsqueda
-        response = requests.get(f"{TMDB_BASE_URL}/discover/movie", params=params)
-        response.raise_for_status()
-        results = response.json().get("results", [])
-        
-        # Si no hay resultados, intentar una búsqueda más amplia
-        if not results and "with_genres" in params:
-            del params["with_genres"]
-            response = requests.get(f"{TMDB_BASE_URL}/discover/movie", params=params)
-            response.raise_for_status()
-            results = response.json().get("results", [])
-        
-        # Si aún no hay resultados y hay filtro de persona, intentar sin él
-        if not results and "with_people" in params:
-            del params["with_people"]
-            response = requests.get(f"{TMDB_BASE_URL}/discover/movie", params=params)
-            response.raise_for_status()
-            results = response.json().get("results", [])
-        
-        return results[:3]  # Devolver solo las 3 primeras películas
-    except requests.RequestException as e:
-        print(f"Error fetching movie recommendations: {e}")
-        return []
+        for variant, future in zip(variants, futures):
+            results = future.result()
+            if results:
+                return variant, results
+        return variant, []
+    finally:
+        for future in futures:
+            future.cancel()
+
+def discover_locally(params):
+    """Resultados del índice local del catálogo, o None si no hay índice o no puede responder."""
+    if movie_catalog is None:
+        return None
+    return movie_catalog.discover(params)
+
+def discover_movies(params):
+    """Consulta /discover/movie usando el índice local, la instantánea o la caché de respuestas (la clave excluye api_key)."""
+    results = discover_locally(params)
+    if results is not None:
+        return results
+    
+    results = recommendation_snapshot.get(params)
+    if results is not None:
+        return results
+    
+    key = canonical_key(params)
+    results = discover_cache.get(key)
+    if results is not MISSING:
+        return results
+    
+    results = tmdb_get("/discover/movie", params).get("results", [])
+    discover_cache.set(key, results, negative=not results)
+    return results
+
+def tmdb_get(path, params):
+    """GET a TMDb; las peticiones idénticas simultáneas comparten la llamada (la clave excluye api_key).
+
+    Sólo se comparten dentro de la misma clase de prioridad: una petición del
+    chat no espera a una de segundo plano que está en cola en el limitador.
+    """
+    return tmdb_flight.do((path, canonical_key(params), current_priority()), fetch_tmdb, path, params)
+
+def fetch_tmdb(path, params):
+    with upstream("tmdb", path):
+        return tmdb_client.get(path, params)
 
 def get_person_id(name):
-    """Get person ID from TMDb API."""
+    """Get person ID from TMDb API (usando el índice local o la caché persistente de personas)."""
     if not TMDB_API_KEY:
         return None
     
+    if person_index is not None:
+        person = person_index.lookup(name)
+        if person:
+            return person
+    
+    key = normalize_text(name)
+    cached = person_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    with stage("person_lookup"):
+        person = search_person(name)
+    if person:
+        person_cache.set(key, person)
+    return person
+
+def person_search_params(name):
+    """Parámetros de /search/person para un nombre."""
+    return {
+        "api_key": TMDB_API_KEY,
+        "language": "es-ES",
+        "query": name
+    }
+
+def search_person(name):
+    """Busca una persona en /search/person y devuelve el primer resultado, o None."""
     try:
-        params = {
-            "api_key": TMDB_API_KEY,
-            "language": "es-ES",
-            "query": name
-        }
-        
-        response = requests.get(f"{TMDB_BASE_URL}/search/person", params=params)
-        response.raise_for_status()
-        results = response.json().get("results", [])
+        results = tmdb_get("/search/person", person_search_params(name)).get("results", [])
         
         if results:
             return results[0]
@@ -674,5 +1675,67 @@ def format_movie_recommendations(movies):
     
     return response
 
+def prewarm_person_cache(names=None, max_workers=8):
+    """Resuelve en paralelo las personas que aún no están en la caché.
+
+    Por defecto usa todos los directores y actores de FAMOUS_PEOPLE. Devuelve la
+    cantidad de personas resueltas.
+    """
+    if not TMDB_API_KEY:
+        return 0
+    
+    if names is None:
+        names = [info.get("director") or info.get("actor") for info in FAMOUS_PEOPLE.values()]
+    pending = {normalize_text(name): name for name in names if normalize_text(name) not in person_cache}
+    if not pending:
+        return 0
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        people = dict(zip(pending, executor.map(with_priority(BACKGROUND, search_person), pending.values())))
+    
+    resolved = {key: person for key, person in people.items() if person}
+    person_cache.set_many(resolved)
+    return len(resolved)
+
+@app.cli.command("prewarm-people")
+def prewarm_people_command():
+    """Resuelve y guarda en caché los ids de TMDb de FAMOUS_PEOPLE."""
+    resolved = prewarm_person_cache()
+    print(f"Personas resueltas: {resolved} (en caché: {len(person_cache)})")
+
+@app.cli.command("refresh-snapshot")
+def refresh_snapshot_command():
+    """Precalcula las recomendaciones de la rejilla de preferencias y guarda la instantánea."""
+    try:
+        stored = refresh_recommendation_snapshot()
+    except SnapshotBuildError as e:
+        print(f"No se actualizó la instantánea: {e}")
+        return
+    print(f"Consultas guardadas: {stored} en {recommendation_snapshot.path}")
+
+def warmup():
+    """Crea por adelantado lo que, si no, se inicializa en la primera petición.
+
+    Crea el cliente de Hugging Face, compila la plantilla de la página y lee
+    la instantánea de recomendaciones, sin llamadas de red. Pensado para
+    llamarlo antes de recibir tráfico (por ejemplo en el hook post_fork de
+    gunicorn) o en segundo plano con APP_WARMUP=1.
+    """
+    get_hf_client()
+    app.jinja_env.get_template("index.html")
+    recommendation_snapshot.reload_if_changed()
+
+# Precalentar la caché de personas en segundo plano al arrancar (opcional)
+if os.environ.get("PERSON_CACHE_PREWARM") == "1":
+    threading.Thread(target=prewarm_person_cache, daemon=True).start()
+
+# Regenerar la instantánea de recomendaciones periódicamente (en un solo proceso)
+if RECOMMENDATION_SNAPSHOT_REFRESH > 0:
+    SnapshotRefresher(recommendation_snapshot, refresh_recommendation_snapshot, RECOMMENDATION_SNAPSHOT_REFRESH).start()
+
+# Inicializar los clientes en segundo plano al arrancar (opcional)
+if os.environ.get("APP_WARMUP") == "1":
+    threading.Thread(target=warmup, daemon=True).start()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""Punto de entrada ASGI: /api/chat asíncrono y el resto de rutas servidas por Flask.
+
+Uso: uvicorn asgi:application --workers 1
+
+Las llamadas a TMDb y Hugging Face de /api/chat no ocupan un hilo mientras
+esperan, así que un solo proceso atiende cientos de conversaciones a la vez.
+El punto de entrada síncrono (python app.py) sigue disponible.
+"""
+import json
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as core
+from async_chat import close_clients, handle_chat_turn_async
+from metrics import REQUEST_SECONDS, request_timings, server_timing, stage, start_request
+
+flask_application = WsgiToAsgi(core.app)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(scope, receive, send):
+    """Versión asíncrona de la vista chat() con los mismos dos protocolos.
+
+    Igual que en Flask, registra la duración en /metrics y responde con la
+    cabecera Server-Timing.
+    """
+    start = time.perf_counter()
+    start_request()
+
+    async def respond(payload, status=200):
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.observe(elapsed, endpoint="chat")
+        timing = server_timing(request_timings(), total=elapsed)
+        await send_json(send, payload, status, [(b"server-timing", timing.encode("ascii"))])
+
+    try:
+        data = json.loads(await read_body(receive) or b"null")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await respond({"error": "El cuerpo debe ser un objeto JSON"}, 400)
+        return
+
+    user_message = data.get('message', '').strip()
+    if not user_message:
+        await respond({"error": "El mensaje no puede estar vacío"}, 400)
+        return
+
+    if 'session_id' in data:
+        with stage("session"):
+            session_id, conversation, preference_state, cursor = core.open_session(data.get('session_id'))
+        core.start_turn_event(user_message, session_id=session_id)
+        response = await handle_chat_turn_async(user_message, conversation["history"], preference_state, cursor)
+        with stage("session"):
+            core.save_session(session_id, conversation, preference_state, cursor)
+        core.log_turn_event(response)
+        await respond({"response": response, "session_id": session_id})
+        return
+
+    chat_history = data.get('history', [])
+    core.start_turn_event(user_message, chat_history=chat_history)
+    response = await handle_chat_turn_async(user_message, chat_history)
+    core.log_turn_event(response)
+    await respond({"response": response, "history": chat_history})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        await chat(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
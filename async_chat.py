@@ -0,0 +1,249 @@
+import asyncio
+
+import requests
+
+import app as core
+from cache import MISSING, canonical_key
+from completion_cache import completion_key
+from metrics import GENERATIONS, stage, upstream
+from rate_limiter import current_priority
+from recommendation_cursor import RecommendationCursor
+from resilience import bounded_timeout, deadline_scope
+from singleflight import AsyncSingleFlight
+from tmdb_client import AsyncTMDbClient
+
+# Clientes asíncronos, creados la primera vez que se usan dentro del bucle de eventos
+_tmdb_client = None
+_hf_client = None
+
+# Single-flight de las llamadas del camino asíncrono (viven en el bucle de eventos)
+tmdb_flight = AsyncSingleFlight()
+hf_flight = AsyncSingleFlight()
+
+
+def get_async_tmdb_client():
+    global _tmdb_client
+    if _tmdb_client is None:
+        _tmdb_client = AsyncTMDbClient(core.TMDB_BASE_URL, **core.TMDB_CLIENT_OPTIONS)
+    return _tmdb_client
+
+
+def get_async_hf_client():
+    global _hf_client
+    if _hf_client is None:
+        from huggingface_hub import AsyncInferenceClient
+
+        _hf_client = AsyncInferenceClient(token=core.HUGGINGFACE_API_KEY, timeout=core.HF_TIMEOUT)
+    return _hf_client
+
+
+async def close_clients():
+    """Cierra los clientes asíncronos (al apagar el servidor)."""
+    global _tmdb_client, _hf_client
+    if _tmdb_client is not None:
+        await _tmdb_client.aclose()
+        _tmdb_client = None
+    if _hf_client is not None:
+        close = getattr(_hf_client, "close", None)
+        if close is not None:
+            await close()
+        _hf_client = None
+
+
+async def tmdb_get_async(path, params):
+    """Versión asíncrona de tmdb_get."""
+    return await tmdb_flight.do((path, canonical_key(params), current_priority()), fetch_tmdb_async, path, params)
+
+
+async def fetch_tmdb_async(path, params):
+    with upstream("tmdb", path):
+        return await get_async_tmdb_client().get(path, params)
+
+
+async def search_person_async(name):
+    """Versión asíncrona de search_person."""
+    try:
+        data = await tmdb_get_async("/search/person", core.person_search_params(name))
+        results = data.get("results", [])
+        return results[0] if results else None
+    except Exception as e:
+        print(f"Error searching for person: {e}")
+        return None
+
+
+async def get_person_id_async(name):
+    """Versión asíncrona de get_person_id (usa el mismo índice local y la misma caché persistente)."""
+    if not core.TMDB_API_KEY:
+        return None
+
+    if core.person_index is not None:
+        person = core.person_index.lookup(name)
+        if person:
+            return person
+
+    key = core.normalize_text(name)
+    cached = core.person_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with stage("person_lookup"):
+        person = await search_person_async(name)
+    if person:
+        # Escribir el archivo de la caché fuera del bucle de eventos
+        await asyncio.to_thread(core.person_cache.set, key, person)
+    return person
+
+
+async def discover_movies_async(params):
+    """Versión asíncrona de discover_movies (comparte el índice local, la instantánea y la caché de respuestas)."""
+    results = core.discover_locally(params)
+    if results is not None:
+        return results
+
+    results = core.recommendation_snapshot.get(params)
+    if results is not None:
+        return results
+
+    key = canonical_key(params)
+    results = core.discover_cache.get(key)
+    if results is not MISSING:
+        return results
+
+    data = await tmdb_get_async("/discover/movie", params)
+    results = data.get("results", [])
+    core.discover_cache.set(key, results, negative=not results)
+    return results
+
+
+async def discover_with_fallbacks_async(params):
+    """Versión asíncrona de discover_with_fallbacks (secuencial o con tareas en paralelo)."""
+    variants = core.discover_fallback_ladder(params)
+
+    if not core.TMDB_PARALLEL_FALLBACK or len(variants) == 1:
+        results = []
+        for variant in variants:
+            results = await discover_movies_async(variant)
+            if results:
+                break
+        return variant, results
+
+    tasks = [asyncio.ensure_future(discover_movies_async(variant)) for variant in variants]
+    try:
+        for variant, task in zip(variants, tasks):
+            results = await task
+            if results:
+                return variant, results
+        return variant, []
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def get_movie_recommendations_async(preferences, cursor=None, limit=3):
+    """Versión asíncrona de get_movie_recommendations."""
+    cursor = cursor or RecommendationCursor()
+    similar = core.similar_recommendations(preferences, cursor, limit)
+    if similar:
+        return similar
+
+    if not core.TMDB_API_KEY and core.movie_catalog is None:
+        return []
+
+    params = core.build_discover_params(preferences)
+
+    person_name = core.preferred_person(preferences)
+    if person_name:
+        person_info = await get_person_id_async(person_name)
+        if person_info:
+            params["with_people"] = person_info["id"]
+
+    try:
+        return await next_recommendations_async(cursor, params, limit)
+    except requests.RequestException as e:
+        print(f"Error fetching movie recommendations: {e}")
+        return []
+
+
+async def next_recommendations_async(cursor, params, limit=3):
+    """Versión asíncrona de next_recommendations (la precarga usa los hilos del camino síncrono)."""
+    cursor.start(canonical_key(params), params)
+    movies = cursor.take(limit)
+    for _ in range(core.MAX_PAGES_PER_TURN):
+        if len(movies) >= limit:
+            break
+        page_params = cursor.next_page_params()
+        if page_params is None:
+            break
+        with stage("discover"):
+            if cursor.page == 0:
+                page_params, results = await discover_with_fallbacks_async(core.with_api_key(page_params))
+            else:
+                results = await discover_movies_async(core.with_api_key(page_params))
+        cursor.add_page(page_params, results)
+        movies += cursor.take(limit - len(movies))
+
+    core.prefetch_next_page(cursor, limit)
+    return movies
+
+
+async def complete_prompt_async(prompt):
+    """Versión asíncrona de complete_prompt."""
+    if core.generation_scheduler is not None:
+        # El Future del lote se espera sin ocupar un hilo; al agotarse el plazo se cancela
+        future = core.generation_scheduler.enqueue(prompt)
+        response = await asyncio.wait_for(asyncio.wrap_future(future), bounded_timeout(None))
+    else:
+        timeout = bounded_timeout(core.HF_TIMEOUT)
+        with core.hf_breaker.guard(), upstream("hf", "text_generation"):
+            response = await asyncio.wait_for(
+                get_async_hf_client().text_generation(prompt, model=core.HF_MODEL, **core.HF_GENERATION_PARAMS),
+                timeout,
+            )
+    response = core.clean_ai_response(response)
+    core.completion_cache.set(prompt, core.HF_MODEL, core.HF_GENERATION_PARAMS, response)
+    return response
+
+
+async def generate_ai_response_async(chat_history):
+    """Versión asíncrona de generate_ai_response."""
+    try:
+        reply, prompt = core.prepare_ai_response(chat_history)
+        if reply is not None:
+            GENERATIONS.inc(source="canned")
+            return reply
+
+        cached = core.completion_cache.get(prompt, core.HF_MODEL, core.HF_GENERATION_PARAMS)
+        if cached is not None:
+            GENERATIONS.inc(source="cache")
+            return cached
+
+        key = completion_key(prompt, core.HF_MODEL, core.HF_GENERATION_PARAMS)
+        with stage("llm"):
+            response = await hf_flight.do(key, complete_prompt_async, prompt)
+        GENERATIONS.inc(source="llm")
+        return response
+    except Exception as e:
+        print(f"Error generating response with Hugging Face: {e}")
+        GENERATIONS.inc(source="fallback")
+        return core.generate_fallback_response(chat_history)
+
+
+async def handle_chat_turn_async(user_message, chat_history, preference_state=None, cursor=None):
+    """Versión asíncrona de handle_chat_turn: misma lógica, sin bloquear el hilo."""
+    with stage("route"):
+        action, value = core.plan_chat_turn(user_message, chat_history, preference_state)
+
+    with deadline_scope(core.CHAT_DEADLINE):
+        if action == "recommend":
+            cursor = cursor or RecommendationCursor.from_history(chat_history)
+            movies = await get_movie_recommendations_async(value, cursor)
+            core.note_turn(recommendations=[movie.get("id") for movie in movies])
+            response = core.recommendation_response(movies)
+        elif action == "generate":
+            response = core.finish_ai_response(await generate_ai_response_async(chat_history), chat_history)
+        else:
+            response = value
+
+    chat_history.append({"role": "assistant", "content": response})
+
+    return response
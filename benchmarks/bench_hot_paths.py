@@ -0,0 +1,189 @@
+"""Micro-benchmarks de las rutas de CPU de un turno de chat (sin red).
+
+Mide normalize_text, extract_preferences, has_specific_criteria, los
+predicados is_*_response, should_recommend_based_on_context y
+format_movie_recommendations sobre conversaciones en español generadas de 10,
+100 y 1000 turnos. Para cada función informa llamadas por segundo, µs por
+llamada, el pico de memoria de una llamada y los bloques que quedan reservados
+al terminar (tracemalloc).
+
+La caché de scan_message se vacía antes de cada pasada: se mide el costo de
+mensajes nuevos, no el de mensajes ya escaneados.
+
+Uso:
+    python benchmarks/bench_hot_paths.py --save benchmarks/baseline.json
+    python benchmarks/bench_hot_paths.py --compare benchmarks/baseline.json [--tolerance 0.3]
+
+Con --compare sale con código 1 si alguna función es más lenta que la línea
+base en más de la tolerancia.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+TURNS = (10, 100, 1000)
+
+USER_TEMPLATES = [
+    "Hola, me gustan mucho las películas de {genre}",
+    "Quiero ver algo de {person} de los {decade}",
+    "prefiero las {era}, algo para el fin de semana",
+    "¿Me recomiendas {popularity} de {genre} del {year}?",
+    "no sé, algo para ver con la familia",
+    "sí",
+    "no, mejor no",
+    "dale, muéstrame tus recomendaciones",
+    "me encantó una película de {person} que vi en {year}",
+    "¿y algo parecido pero más {era}?",
+]
+ASSISTANT_TEMPLATES = [
+    "¡Genial! ¿Prefieres películas más recientes o clásicas?",
+    "Perfecto. ¿Te gustaría ver mis recomendaciones?",
+    "Entiendo. ¿Qué tipo de películas te gustan más?",
+    "¿Prefieres películas populares o joyas ocultas?",
+]
+FILLERS = {
+    "genre": ["acción", "terror", "ciencia ficción", "comedia", "drama", "animación", "suspenso"],
+    "person": ["Nolan", "Tarantino", "Almodóvar", "del Toro", "Scorsese", "Ricardo Darín"],
+    "decade": ["80s", "90s", "2000s", "70s"],
+    "era": ["clásicas", "modernas", "antiguas", "recientes"],
+    "popularity": ["joyas ocultas", "películas famosas", "indies", "taquilleras"],
+    "year": [str(year) for year in range(1970, 2025)],
+}
+
+MOVIES = [
+    {
+        "id": 27205 + i,
+        "title": f"Película de prueba {i}",
+        "release_date": f"{2000 + i}-07-16",
+        "overview": "Un ladrón que roba secretos corporativos a través del uso de la tecnología de compartir sueños. " * 2,
+    }
+    for i in range(3)
+]
+
+
+def generate_conversation(turns, seed=0):
+    """Conversación sintética de ``turns`` turnos (mensaje del usuario y respuesta)."""
+    rng = random.Random(seed)
+    history = []
+    for _ in range(turns):
+        template = rng.choice(USER_TEMPLATES)
+        message = template.format(**{key: rng.choice(values) for key, values in FILLERS.items()})
+        history.append({"role": "user", "content": message})
+        history.append({"role": "assistant", "content": rng.choice(ASSISTANT_TEMPLATES)})
+    return history
+
+
+def cold(func):
+    """Envuelve una función para que cada llamada empiece con la caché de escaneo vacía."""
+    def run():
+        app.scan_message.cache_clear()
+        return func()
+    return run
+
+
+def build_cases():
+    """Casos de benchmark: nombre -> función sin argumentos."""
+    cases = {}
+    for turns in TURNS:
+        history = generate_conversation(turns, seed=turns)
+        messages = [msg["content"] for msg in history if msg["role"] == "user"]
+        normalized = [app.normalize_text(message) for message in messages]
+
+        cases[f"normalize_text[{turns}]"] = lambda m=messages: [app.normalize_text(x) for x in m]
+        cases[f"extract_preferences[{turns}]"] = cold(lambda h=history: app.extract_preferences(h))
+        cases[f"has_specific_criteria[{turns}]"] = cold(lambda n=normalized: [app.has_specific_criteria(x) for x in n])
+        cases[f"is_response_predicates[{turns}]"] = cold(lambda n=normalized: [
+            (app.is_affirmative_response(x), app.is_negative_response(x),
+             app.is_era_response(x), app.is_popularity_response(x))
+            for x in n
+        ])
+        cases[f"should_recommend_based_on_context[{turns}]"] = (
+            lambda h=history: app.should_recommend_based_on_context(h)
+        )
+    cases["format_movie_recommendations"] = lambda: app.format_movie_recommendations(MOVIES)
+    return cases
+
+
+def measure(func, repeat=5):
+    """Mide una función: mejor tiempo por llamada, pico de memoria y bloques retenidos."""
+    timer = timeit.Timer(func)
+    # Cantidad de llamadas para que cada repetición dure al menos 0.2 s
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    blocks_before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.reset_peak()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    blocks_after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    del result
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": 1 / seconds,
+        "us_per_call": seconds * 1e6,
+        "peak_bytes": peak,
+        "retained_blocks": blocks_after - blocks_before,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Imprime la comparación con la línea base y devuelve los casos que empeoraron."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result["us_per_call"] / base["us_per_call"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  <-- REGRESIÓN"
+        print(f"{name:<44} {base['us_per_call']:12.2f} -> {result['us_per_call']:12.2f} µs  ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", help="Guardar los resultados como línea base en este archivo JSON")
+    parser.add_argument("--compare", help="Comparar con la línea base guardada en este archivo JSON")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Empeoramiento admitido (0.3 = 30%%)")
+    parser.add_argument("--filter", default="", help="Medir sólo los casos cuyo nombre contiene este texto")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'caso':<44} {'llamadas/s':>12} {'µs/llamada':>12} {'pico KiB':>10} {'bloques':>8}")
+    for name, func in build_cases().items():
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(func)
+        print(f"{name:<44} {result['ops_per_sec']:12.1f} {result['us_per_call']:12.2f} "
+              f"{result['peak_bytes'] / 1024:10.1f} {result['retained_blocks']:8d}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Línea base guardada en {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} caso(s) más lentos que la línea base")
+            sys.exit(1)
+        print("Sin regresiones respecto a la línea base")
+
+
+if __name__ == "__main__":
+    main()
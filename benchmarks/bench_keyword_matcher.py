@@ -0,0 +1,76 @@
+"""Micro-benchmark: enrutado con bucles de subcadenas vs. KeywordMatcher compilado.
+
+Uso: python benchmarks/bench_keyword_matcher.py [--number N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from app import (  # noqa: E402
+    DECADES, ERA_KEYWORDS, FAMOUS_PEOPLE, GENRE_MAP, POPULARITY_KEYWORDS,
+    RECOMMENDATION_KEYWORDS, normalize_text,
+)
+
+MESSAGES = [
+    "Hola, me gustan mucho las películas de acción",
+    "Quiero ver algo de Nolan de los 90s",
+    "prefiero las clásicas, algo vintage",
+    "¿Me recomiendas joyas ocultas de ciencia ficción del 1999?",
+    "no sé, algo para ver con la familia este fin de semana",
+]
+
+
+# Implementación anterior (bucles por tabla), conservada como referencia
+def legacy_route(normalized_message):
+    has_person = any(person in normalized_message for person in FAMOUS_PEOPLE)
+    has_decade = any(decade in normalized_message for decade in DECADES)
+    has_year = re.search(r'\b(19\d{2}|20\d{2})\b', normalized_message) is not None
+    genre = None
+    for g in GENRE_MAP:
+        if normalize_text(g) in normalized_message:
+            genre = g
+            break
+    era = any(kw in normalized_message for kws in ERA_KEYWORDS.values() for kw in kws)
+    popularity = any(kw in normalized_message for kws in POPULARITY_KEYWORDS.values() for kw in kws)
+    recommendation = any(kw in normalized_message for kw in RECOMMENDATION_KEYWORDS)
+    return has_person or has_decade or has_year, genre, era, popularity, recommendation
+
+
+def compiled_route(normalized_message):
+    match = app.KEYWORD_MATCHER.scan(normalized_message)
+    return (
+        match.has("person") or match.has("decade") or bool(match.years),
+        match.first("genre"),
+        match.has("era"),
+        match.has("popularity"),
+        match.has("recommendation"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    normalized = [normalize_text(m) for m in MESSAGES]
+    for message in normalized:
+        assert legacy_route(message) == compiled_route(message), message
+
+    results = {}
+    for name, func in (("legacy", legacy_route), ("compiled", compiled_route)):
+        timer = timeit.Timer(lambda: [func(m) for m in normalized])
+        best = min(timer.repeat(repeat=5, number=args.number // len(normalized)))
+        per_message = best / (args.number // len(normalized) * len(normalized))
+        results[name] = per_message
+        print(f"{name:>9}: {per_message * 1e6:8.2f} µs/mensaje")
+
+    print(f"  speedup: {results['legacy'] / results['compiled']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Micro-benchmark del índice local del catálogo con un catálogo sintético.
+
+Uso: python benchmarks/bench_movie_catalog.py [--movies N] [--number N]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_catalog import TMDB_GENRE_IDS, MovieCatalog, build_catalog  # noqa: E402
+
+QUERIES = [
+    {"sort_by": "popularity.desc", "include_adult": "false", "page": 1, "with_genres": 28},
+    {"sort_by": "popularity.desc", "include_adult": "false", "page": 1, "with_genres": 878,
+     "primary_release_date.gte": "1990-01-01", "primary_release_date.lte": "1999-12-31"},
+    {"sort_by": "vote_average.desc", "include_adult": "false", "page": 1, "with_genres": 18,
+     "vote_count.gte": "50", "vote_count.lte": "1000", "vote_average.gte": "7"},
+    {"sort_by": "popularity.desc", "include_adult": "false", "page": 1,
+     "primary_release_date.gte": "2015-01-01"},
+]
+
+
+def write_synthetic_export(path, count, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for movie_id in range(1, count + 1):
+            year = rng.randint(1930, 2025)
+            f.write(json.dumps({
+                "id": movie_id,
+                "title": f"Película {movie_id}",
+                "overview": "Una historia cualquiera.",
+                "release_date": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "genre_ids": rng.sample(TMDB_GENRE_IDS, rng.randint(1, 3)),
+                "popularity": rng.expovariate(0.1),
+                "vote_count": int(rng.expovariate(0.002)),
+                "vote_average": round(rng.uniform(1, 10), 1),
+            }) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--movies", type=int, default=200000)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "export.jsonl")
+        write_synthetic_export(export, args.movies)
+        start = time.perf_counter()
+        build_catalog(export, os.path.join(tmp, "catalog"))
+        print(f"índice de {args.movies} películas construido en {time.perf_counter() - start:.1f} s")
+
+        catalog = MovieCatalog(os.path.join(tmp, "catalog"))
+        for query in QUERIES:
+            catalog.discover(query)
+            start = time.perf_counter()
+            for _ in range(args.number):
+                catalog.discover(query)
+            elapsed = (time.perf_counter() - start) / args.number
+            print(f"{elapsed * 1e3:8.3f} ms  {query}")
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
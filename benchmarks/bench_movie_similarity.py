@@ -0,0 +1,92 @@
+"""Benchmark del índice de películas parecidas: construcción, latencia de consulta y memoria.
+
+La construcción se ejecuta en un proceso aparte para medir su memoria residente
+máxima durante la construcción, no la que queda después.
+
+Uso: python benchmarks/bench_movie_similarity.py [--movies N] [--queries N]
+(por ejemplo --movies 100000 y --movies 1000000)
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from movie_catalog import TMDB_GENRE_IDS, MovieCatalog, build_catalog  # noqa: E402
+from movie_similarity import MovieSimilarity, build_similarity_index  # noqa: E402
+
+
+def write_synthetic_export(path, count, vocabulary=20000, seed=0):
+    """Catálogo sintético con sinopsis de ~40 palabras de un vocabulario con distribución Zipf."""
+    rng = random.Random(seed)
+    words = [f"palabra{i}" for i in range(vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    with open(path, "w", encoding="utf-8") as f:
+        for movie_id in range(1, count + 1):
+            overview = " ".join(rng.choices(words, weights=weights, k=40))
+            f.write(json.dumps({
+                "id": movie_id,
+                "title": f"Película {movie_id}",
+                "overview": overview,
+                "release_date": f"{rng.randint(1930, 2025)}-01-01",
+                "genre_ids": rng.sample(TMDB_GENRE_IDS, 2),
+                "popularity": rng.expovariate(0.1),
+                "vote_count": int(rng.expovariate(0.002)),
+                "vote_average": round(rng.uniform(1, 10), 1),
+            }) + "\n")
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--movies", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "export.jsonl")
+        catalog_dir = os.path.join(tmp, "catalog")
+        write_synthetic_export(export, args.movies)
+        build_catalog(export, catalog_dir)
+
+        # "spawn": el hijo empieza limpio, sin heredar la memoria del catálogo sintético
+        start = time.perf_counter()
+        builder = multiprocessing.get_context("spawn").Process(target=build_similarity_index, args=(catalog_dir,))
+        builder.start()
+        builder.join()
+        if builder.exitcode != 0:
+            sys.exit(f"la construcción del índice falló (código {builder.exitcode})")
+        build_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        print(f"índice de {args.movies} películas construido en {time.perf_counter() - start:.1f} s, "
+              f"{directory_size(os.path.join(catalog_dir, 'similarity')) / 2**20:.1f} MiB en disco")
+        print(f"memoria residente máxima durante la construcción: {build_rss / 1024:.1f} MiB")
+
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        catalog = MovieCatalog(catalog_dir)
+        similarity = MovieSimilarity(catalog)
+        rng = random.Random(1)
+        rows = [rng.randrange(len(catalog)) for _ in range(args.queries)]
+
+        similarity.similar_rows(rows[0])
+        start = time.perf_counter()
+        for row in rows:
+            similarity.similar_rows(row, k=3)
+        elapsed = (time.perf_counter() - start) / len(rows)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        print(f"consulta top-3: {elapsed * 1e3:.2f} ms de media")
+        print(f"memoria residente máxima tras las consultas: +{(rss_after - rss_before) / 1024:.1f} MiB")
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
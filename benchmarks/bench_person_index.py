@@ -0,0 +1,91 @@
+"""Micro-benchmark del índice local de personas con una exportación sintética.
+
+Genera nombres combinando nombres y apellidos al azar (más algunas personas
+reales), construye el índice y mide cuánto tarda en reconocer nombres en
+mensajes de chat típicos, con y sin faltas de ortografía.
+
+Uso: python benchmarks/bench_person_index.py [--people N] [--number N]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from person_index import PersonIndex, build_person_index, normalize_name  # noqa: E402
+
+FIRST_NAMES = [
+    "james", "john", "robert", "michael", "william", "david", "richard", "joseph", "thomas", "charles",
+    "maria", "ana", "lucia", "carmen", "elena", "laura", "sofia", "paula", "marta", "julia",
+    "jean", "pierre", "hans", "giulia", "marco", "yuki", "hiro", "olga", "ivan", "pedro",
+]
+LAST_NAMES = [
+    "smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "rodriguez", "martinez",
+    "hernandez", "lopez", "gonzalez", "wilson", "anderson", "taylor", "moore", "jackson", "martin", "lee",
+    "perez", "thompson", "white", "harris", "sanchez", "clark", "ramirez", "lewis", "robinson", "walker",
+]
+REAL_PEOPLE = [
+    ("Quentin Tarantino", True), ("Christopher Nolan", True), ("Pedro Almodóvar", True),
+    ("Guillermo del Toro", True), ("Alejandro González Iñárritu", True), ("Tom Hanks", False),
+    ("Penélope Cruz", False), ("Ricardo Darín", False), ("Robert De Niro", False), ("Greta Gerwig", True),
+]
+MESSAGES = [
+    "me gustan las peliculas de quentin tarantino",
+    "quiero ver algo con penelope cruz de los 90",
+    "algo dirigido por greta gerwig o por guillermo del toro",
+    "peliculas de quentin tarantno",            # falta de ortografía
+    "recomiendame peliculas de terror de los 80",  # sin personas
+]
+
+
+def write_synthetic_export(path, count, seed=0):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "ri", "men", "tan", "ve", "so", "bar", "din", "el", "mo", "ros", "te", "nu"]
+    with open(path, "w", encoding="utf-8") as f:
+        for person_id, (name, director) in enumerate(REAL_PEOPLE, start=1):
+            f.write(json.dumps({"id": person_id, "name": name, "popularity": 50.0,
+                                "known_for_department": "Directing" if director else "Acting"}) + "\n")
+        for person_id in range(len(REAL_PEOPLE) + 1, count + 1):
+            last = rng.choice(LAST_NAMES) if rng.random() < 0.5 else "".join(rng.sample(syllables, 3))
+            name = f"{rng.choice(FIRST_NAMES).title()} {last.title()}"
+            f.write(json.dumps({"id": person_id, "name": name, "popularity": rng.expovariate(1.0),
+                                "adult": False}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--people", type=int, default=150000)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "people.jsonl")
+        write_synthetic_export(export, args.people)
+        start = time.perf_counter()
+        build_person_index(export, os.path.join(tmp, "people"), limit=args.people)
+        print(f"índice de {args.people} personas construido en {time.perf_counter() - start:.1f} s")
+        size = sum(os.path.getsize(os.path.join(tmp, "people", name)) for name in os.listdir(os.path.join(tmp, "people")))
+        print(f"tamaño en disco (mapeado en memoria): {size / 1e6:.1f} MB")
+
+        index = PersonIndex(os.path.join(tmp, "people"))
+        for message in MESSAGES:
+            text = normalize_name(message)
+            matches = index.find(text)
+            start = time.perf_counter()
+            for _ in range(args.number):
+                index.find(text)
+            elapsed = (time.perf_counter() - start) / args.number
+            print(f"{elapsed * 1e3:8.3f} ms  {message!r} -> {[match.name for match in matches]}")
+
+        start = time.perf_counter()
+        for _ in range(args.number):
+            index.lookup("Pedro Almodovar")
+        print(f"{(time.perf_counter() - start) / args.number * 1e3:8.3f} ms  lookup('Pedro Almodovar') -> {index.lookup('Pedro Almodovar')}")
+
+
+if __name__ == "__main__":
+    main()
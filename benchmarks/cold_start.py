@@ -0,0 +1,118 @@
+"""Costo de arranque en frío: tiempo de importar app.py y latencia de las primeras peticiones.
+
+Cada pasada arranca un intérprete nuevo que importa la aplicación, opcionalmente
+llama a warmup(), y manda con el cliente de pruebas de Flask la página principal
+y un turno de cada rama del chat (dos veces: la segunda muestra el costo ya en
+caliente). TMDb y la generación de texto son los servidores de
+benchmarks/stub_servers.py, con latencias bajas para que lo medido sea la
+inicialización y no la red. Informa la mediana de las pasadas.
+
+Uso:
+    python benchmarks/cold_start.py --runs 5
+    python benchmarks/cold_start.py --runs 5 --warmup
+    python benchmarks/cold_start.py --importtime 15   # módulos que más tardan en importarse
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_servers import Latency, StubConfig, start_stub_server, stub_environment  # noqa: E402
+
+# Peticiones de cada pasada: nombre -> (ruta, cuerpo JSON o None para GET)
+REQUESTS = [
+    ("index", "/", None),
+    ("reply", "/api/chat", {"message": "Me gustan las películas de acción", "history": []}),
+    ("recommend", "/api/chat", {"message": "recomiéndame películas de terror", "history": []}),
+    ("generate", "/api/chat", {"message": "¿Qué opinas del cine de autor europeo de hoy en día?", "history": []}),
+]
+
+
+def child(warmup):
+    """Mide una pasada en este proceso e imprime el resultado en JSON."""
+    timings = {}
+    start = time.perf_counter()
+    import app
+    timings["import"] = time.perf_counter() - start
+
+    if warmup:
+        start = time.perf_counter()
+        app.warmup()
+        timings["warmup"] = time.perf_counter() - start
+
+    client = app.app.test_client()
+    for attempt in ("first", "second"):
+        for name, path, body in REQUESTS:
+            start = time.perf_counter()
+            response = client.get(path) if body is None else client.post(path, json=body)
+            response.get_data()
+            timings[f"{name} ({attempt})"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def run_child(env, warmup):
+    command = [sys.executable, os.path.abspath(__file__), "--child"] + (["--warmup"] if warmup else [])
+    output = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(env, top):
+    """Módulos con mayor tiempo de importación acumulado (python -X importtime)."""
+    command = [sys.executable, "-X", "importtime", "-c", "import app"]
+    stderr = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((int(cumulative) / 1e3, depth, name.strip()))
+    # Sólo los importados directamente por app.py (profundidad 1) y app misma
+    direct = sorted((m for m in modules if m[1] <= 1), reverse=True)
+    print(f"{'módulo':<48} {'ms acumulados':>14}")
+    for cumulative, _, name in direct[:top]:
+        print(f"{name:<48} {cumulative:14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Procesos nuevos a medir")
+    parser.add_argument("--warmup", action="store_true", help="Llamar a app.warmup() antes de la primera petición")
+    parser.add_argument("--importtime", type=int, metavar="N", help="Mostrar los N módulos que más tardan en importarse")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.warmup)
+        return
+
+    _, stub_url = start_stub_server(StubConfig(tmdb_latency=Latency(1), hf_latency=Latency(5), token_delay_ms=0))
+    env = {
+        **os.environ,
+        **stub_environment(stub_url),
+        # No tocar la caché de personas real ni precalentar nada por variables de entorno
+        "PERSON_CACHE_PATH": os.path.join(tempfile.mkdtemp(), "person_cache.json"),
+        "PERSON_CACHE_PREWARM": "0",
+        "APP_WARMUP": "0",
+    }
+
+    if args.importtime:
+        import_profile(env, args.importtime)
+        return
+
+    runs = [run_child(env, args.warmup) for _ in range(args.runs)]
+    print(f"Mediana de {args.runs} procesos{' con warmup()' if args.warmup else ''}:")
+    for name in runs[0]:
+        print(f"{name:<24} {statistics.median(run[name] for run in runs) * 1e3:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
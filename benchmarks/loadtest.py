@@ -0,0 +1,249 @@
+"""Prueba de carga de extremo a extremo de /api/chat contra servidores de prueba locales.
+
+Arranca los servidores de benchmarks/stub_servers.py, apunta la aplicación a
+ellos (TMDB_BASE_URL y HF_MODEL) y lanza conversaciones guionizadas
+concurrentes que recorren todas las ramas del chat. Informa latencias p50, p95
+y p99, rendimiento y tasa de errores por rama (con los nombres de la métrica
+chat_branch_total; las conversacionales, según se respondan con el modelo, una
+respuesta predefinida o la de respaldo), y las llamadas que recibieron
+los servidores de prueba (útil para validar cachés y coalescencia). Cuentan
+como errores los fallos HTTP y también las respuestas degradadas: la
+aplicación convierte los fallos de TMDb y de la generación en respuestas 200
+de respaldo ("No encontré películas…" o el texto de respaldo del chat).
+
+Uso:
+    python benchmarks/loadtest.py --conversations 200 --concurrency 32
+    python benchmarks/loadtest.py --stream --stateless
+    python benchmarks/loadtest.py --llm-batch   # micro-batching contra /generate_batch
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000   # servidor ya arrancado
+
+Sin --url la aplicación Flask se sirve en este mismo proceso con un servidor
+WSGI multihilo. Con --url hay que arrancar el servidor con las variables que
+imprime stub_servers.py (o pasar --stub-url si los servidores de prueba ya
+están corriendo).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_servers import add_stub_arguments, config_from_args, start_stub_server, stub_environment  # noqa: E402
+
+# Guion de una conversación; {person} y {genre} varían entre conversaciones
+SCRIPT = [
+    "Hola, estoy buscando una buena película para ver esta noche",
+    "Me gustan las películas de {person}",
+    "sí, recomiéndame algunas",
+    "sí",
+    "prefiero las clásicas",
+    "que sean populares",
+    "¿Y qué me dices de algo más ligero para el domingo por la tarde?",
+    "recomiéndame películas de {genre}",
+    "no",
+    "hmm, quizás",  # no se entiende: respuesta de respaldo
+]
+PEOPLE = ["Nolan", "Tarantino", "Almodóvar", "del Toro", "Scorsese", "Spielberg", "Ricardo Darín"]
+GENRES = ["acción", "terror", "comedia", "drama", "animación", "ciencia ficción", "suspenso"]
+
+
+def classify(core, user_message, transcript):
+    """Rama del chat que responderá el mensaje y su acción, según la misma lógica de la aplicación.
+
+    Usa route_chat_turn, que no cuenta la rama en /metrics. La rama
+    "conversation" se separa según cómo se responde: con el modelo
+    (conversation:llm), con una respuesta predefinida (conversation:canned) o con
+    la de respaldo para los mensajes que no se entienden (conversation:fallback).
+    """
+    history = [dict(msg) for msg in transcript]
+    branch, action, _ = core.route_chat_turn(user_message, history)
+    if action != "generate":
+        return branch, action
+    reply, _ = core.prepare_ai_response(history)
+    if reply is None:
+        return "conversation:llm", action
+    if reply == core.FALLBACK_RESPONSES["fallback"]:
+        return "conversation:fallback", action
+    return "conversation:canned", action
+
+
+def degraded_replies(core, branch, action, user_message, transcript):
+    """Respuestas que, para esa rama, indican que falló TMDb o la generación."""
+    if action == "recommend":
+        return {core.recommendation_response([])}
+    if branch == "conversation:llm":
+        history = [dict(msg) for msg in transcript] + [{"role": "user", "content": user_message}]
+        return {core.generate_fallback_response(history)}
+    return set()
+
+
+def post_chat(session, base_url, payload, stream):
+    """Envía un mensaje y devuelve el cuerpo JSON final (en streaming, el evento done)."""
+    if not stream:
+        response = session.post(f"{base_url}/api/chat", json=payload, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    with session.post(f"{base_url}/api/chat/stream", json=payload, timeout=60, stream=True) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "done":
+                return json.loads(line[len("data: "):])
+    raise requests.RequestException("El stream terminó sin evento done")
+
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.degraded = {}
+        self._lock = threading.Lock()
+
+    def record(self, branch, seconds, error=False, degraded=False):
+        """Registra una petición; las degradadas cuentan también como errores."""
+        with self._lock:
+            self.latencies.setdefault(branch, []).append(seconds)
+            if error or degraded:
+                self.errors[branch] = self.errors.get(branch, 0) + 1
+            if degraded:
+                self.degraded[branch] = self.degraded.get(branch, 0) + 1
+
+
+def run_conversation(core, base_url, seed, results, stateless, stream):
+    rng = random.Random(seed)
+    fillers = {"person": rng.choice(PEOPLE), "genre": rng.choice(GENRES)}
+    transcript = []
+    session_id = None
+    with requests.Session() as session:
+        for template in SCRIPT:
+            message = template.format(**fillers)
+            branch, action = classify(core, message, transcript)
+            degraded = degraded_replies(core, branch, action, message, transcript)
+            payload = {"message": message}
+            if stateless:
+                payload["history"] = transcript
+            else:
+                payload["session_id"] = session_id
+
+            start = time.perf_counter()
+            try:
+                data = post_chat(session, base_url, payload, stream)
+            except (requests.RequestException, ValueError):
+                # Seguir con el resto del guion para muestrear también las ramas siguientes
+                results.record(branch, time.perf_counter() - start, error=True)
+                continue
+            results.record(branch, time.perf_counter() - start, degraded=data.get("response") in degraded)
+
+            session_id = data.get("session_id")
+            if stateless:
+                transcript = data["history"]
+            else:
+                transcript = transcript + [
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": data["response"]},
+                ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(results, elapsed, stub_config):
+    total = sum(len(values) for values in results.latencies.values())
+    print(f"\n{total} peticiones en {elapsed:.1f} s: {total / elapsed:.1f} peticiones/s\n")
+    print(f"{'rama':<24} {'peticiones':>10} {'errores':>8} {'degradadas':>10} {'pet/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for branch, values in sorted(results.latencies.items()):
+        errors = results.errors.get(branch, 0)
+        degraded = results.degraded.get(branch, 0)
+        print(f"{branch:<24} {len(values):10d} {errors / len(values):8.1%} {degraded / len(values):10.1%} {len(values) / elapsed:8.1f} "
+              f"{percentile(values, 0.5) * 1e3:8.0f} {percentile(values, 0.95) * 1e3:8.0f} "
+              f"{percentile(values, 0.99) * 1e3:8.0f}")
+    if stub_config is not None:
+        print("\nLlamadas recibidas por los servidores de prueba:", dict(sorted(stub_config.counts.items())))
+
+
+def report_failures(futures):
+    """Avisa de las conversaciones que terminaron con una excepción del propio script."""
+    failed = [future.exception() for future in futures if future.exception() is not None]
+    if failed:
+        print(f"\n{len(failed)} conversaciones terminaron con una excepción; la primera:")
+        traceback.print_exception(type(failed[0]), failed[0], failed[0].__traceback__)
+
+
+def serve_in_process(wsgi_app):
+    """Sirve la aplicación en este proceso con un servidor WSGI multihilo; devuelve (servidor, URL)."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, wsgi_app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    parser.add_argument("--conversations", type=int, default=100, help="Conversaciones guionizadas en total")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversaciones simultáneas")
+    parser.add_argument("--stateless", action="store_true", help="Protocolo sin estado (historial completo)")
+    parser.add_argument("--stream", action="store_true", help="Usar /api/chat/stream")
+    parser.add_argument("--url", help="URL de una aplicación ya arrancada (si no, se sirve en este proceso)")
+    parser.add_argument("--stub-url", help="URL de servidores de prueba ya arrancados")
+    parser.add_argument("--llm-batch", action="store_true",
+                        help="Generar con micro-batching contra /generate_batch (LLM_BATCH_URL)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    stub_config = None
+    if args.stub_url:
+        stub_url = args.stub_url
+    else:
+        stub_config = config_from_args(args)
+        _, stub_url = start_stub_server(stub_config)
+    os.environ.update(stub_environment(stub_url))
+    if args.llm_batch:
+        os.environ["LLM_BATCH_URL"] = f"{stub_url}/generate_batch"
+    # No tocar la caché de personas real con los ids de los servidores de prueba
+    os.environ["PERSON_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "person_cache.json")
+
+    import app as core  # la configuración se lee al importar
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = serve_in_process(core.app)
+
+    results = Results()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(run_conversation, core, base_url, args.seed + i, results, args.stateless, args.stream)
+            for i in range(args.conversations)
+        ]
+    elapsed = time.perf_counter() - start
+
+    report(results, elapsed, stub_config)
+    report_failures(futures)
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
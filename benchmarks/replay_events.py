@@ -0,0 +1,180 @@
+"""Reproduce las conversaciones del registro de eventos contra /api/chat.
+
+Lee el registro (EVENT_LOG_PATH, con sus copias rotadas), reconstruye las
+conversaciones y vuelve a enviar sus mensajes, en orden, a la aplicación
+servida en este proceso contra los servidores de benchmarks/stub_servers.py.
+Sirve de carga realista para pruebas de rendimiento (latencias por rama, como
+loadtest.py) y de análisis offline: los turnos reproducidos se registran en
+otro archivo y se comparan con los originales, así que un cambio en el
+enrutado o en la extracción de preferencias aparece como diferencias.
+
+Uso:
+    python benchmarks/replay_events.py events.jsonl --concurrency 16
+    python benchmarks/replay_events.py events.jsonl --speed 10   # con los tiempos originales, 10 veces más rápido
+    python benchmarks/replay_events.py events.jsonl --stateless --out replay.jsonl
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from event_log import conversation_key, history_digest, log_files, read_conversations, read_events  # noqa: E402
+from loadtest import Results, post_chat, report, report_failures, serve_in_process  # noqa: E402
+from stub_servers import add_stub_arguments, config_from_args, start_stub_server, stub_environment  # noqa: E402
+
+
+class Replay:
+    """Turnos enviados: clave con la que el servidor registrará cada uno -> evento original."""
+
+    def __init__(self):
+        self.sent = {}
+        self._lock = threading.Lock()
+
+    def expect(self, key, event):
+        with self._lock:
+            self.sent[key] = event
+
+
+def run_conversation(base_url, turns, replay, results, stateless, start, first_ts, speed):
+    transcript = []
+    session_id = None
+    position = 0  # turnos que el servidor ha registrado en la sesión actual
+    with requests.Session() as session:
+        for event in turns:
+            if speed:
+                # Respetar el momento original del turno, comprimido por ``speed``
+                delay = start + (event["ts"] - first_ts) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            message = event["message"]
+            branch = event.get("branch", "unknown")
+            payload = {"message": message}
+            if stateless:
+                payload["history"] = transcript
+                key = (history_digest(transcript), message)
+            else:
+                payload["session_id"] = session_id
+
+            sent = time.perf_counter()
+            try:
+                data = post_chat(session, base_url, payload, stream=False)
+            except (requests.RequestException, ValueError):
+                # El turno cuenta como error y la conversación sigue con el siguiente
+                results.record(branch, time.perf_counter() - sent, error=True)
+                continue
+            results.record(branch, time.perf_counter() - sent)
+
+            if stateless:
+                transcript = data["history"]
+            else:
+                if data["session_id"] != session_id:
+                    # Sesión nueva (el primer turno que salió bien, o la anterior expiró)
+                    session_id = data["session_id"]
+                    position = 0
+                key = (conversation_key(session_id), position)
+                position += 1
+            replay.expect(key, event)
+
+
+def replayed_turns(path):
+    """Turnos registrados durante la reproducción, con la misma clave que Replay.expect."""
+    turns = {}
+    positions = Counter()
+    for event in read_events([path]):
+        if event.get("conversation"):
+            turns[(event["conversation"], positions[event["conversation"]])] = event
+            positions[event["conversation"]] += 1
+        else:
+            turns[(event.get("parent"), event["message"])] = event
+    return turns
+
+
+def compare(replay, replayed, examples):
+    """Diferencias de rama y de preferencias entre los turnos originales y los reproducidos."""
+    branches = Counter()
+    changed_preferences = 0
+    missing = 0
+    shown = 0
+    for key, original in replay.sent.items():
+        event = replayed.get(key)
+        if event is None:
+            missing += 1
+            continue
+        before, after = original.get("branch"), event.get("branch")
+        if before != after:
+            branches[(before, after)] += 1
+        if original.get("preferences") != event.get("preferences"):
+            changed_preferences += 1
+            if shown < examples:
+                shown += 1
+                print(f"  {original['message']!r}: {original.get('preferences')} -> {event.get('preferences')}")
+
+    print(f"\nTurnos comparados: {len(replay.sent) - missing} (sin registro de la reproducción: {missing})")
+    print(f"Con otras preferencias: {changed_preferences}")
+    print(f"Con otra rama: {sum(branches.values())}")
+    for (before, after), count in branches.most_common():
+        print(f"  {before} -> {after}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    parser.add_argument("log", help="Registro de eventos (se leen también sus copias rotadas)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversaciones simultáneas")
+    parser.add_argument("--limit", type=int, help="Reproducir sólo las primeras N conversaciones")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="Respetar los tiempos originales acelerados N veces (0 = sin esperas)")
+    parser.add_argument("--stateless", action="store_true", help="Protocolo sin estado (historial completo)")
+    parser.add_argument("--out", help="Archivo donde registrar los turnos reproducidos (por defecto, uno temporal)")
+    parser.add_argument("--examples", type=int, default=10, help="Ejemplos de preferencias distintas a mostrar")
+    args = parser.parse_args()
+
+    conversations = read_conversations(log_files(args.log))[:args.limit]
+    if not conversations:
+        parser.error(f"No hay turnos de chat en {args.log}")
+    turns = sum(len(conversation) for conversation in conversations)
+    print(f"{len(conversations)} conversaciones, {turns} turnos")
+
+    stub_config = config_from_args(args)
+    _, stub_url = start_stub_server(stub_config)
+    os.environ.update(stub_environment(stub_url))
+    workdir = tempfile.mkdtemp()
+    # No tocar la caché de personas real ni el registro de eventos original
+    os.environ["PERSON_CACHE_PATH"] = os.path.join(workdir, "person_cache.json")
+    out = args.out or os.path.join(workdir, "replay.jsonl")
+    os.environ["EVENT_LOG_PATH"] = out
+    os.environ["EVENT_LOG_MAX_MB"] = str(1 << 20)
+
+    import app as core  # la configuración se lee al importar
+
+    server, base_url = serve_in_process(core.app)
+    replay = Replay()
+    results = Results()
+    first_ts = conversations[0][0]["ts"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(run_conversation, base_url, conversation, replay, results,
+                            args.stateless, start, first_ts, args.speed)
+            for conversation in conversations
+        ]
+    elapsed = time.perf_counter() - start
+
+    report(results, elapsed, stub_config)
+    report_failures(futures)
+    core.event_log.flush(timeout=10)
+    compare(replay, replayed_turns(out), args.examples)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
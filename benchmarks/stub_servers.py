@@ -0,0 +1,247 @@
+"""Servidores locales que imitan a TMDb y a un endpoint de generación de texto.
+
+Sirven /3/discover/movie, /3/search/person y /generate (formato de Text
+Generation Inference, que es el que usa InferenceClient cuando el modelo es
+una URL, con o sin streaming) con latencias aleatorias, tasas de error y
+respuestas enlatadas configurables, para hacer pruebas de carga sin gastar
+cuota de las APIs reales. /generate_batch imita un servidor de modelos local
+que genera un lote entero en una petición (ver BatchEndpointBackend).
+
+Uso independiente (por ejemplo para probar un servidor uvicorn o gunicorn):
+    python benchmarks/stub_servers.py --tmdb-latency-ms 80 --hf-latency-ms 900
+imprime las variables de entorno con las que arrancar la aplicación.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENERATED_TEXT = "¡Qué buena elección! ¿Prefieres películas más recientes o clásicas?"
+
+
+class Latency:
+    """Distribución log-normal de latencias a partir de la mediana y la dispersión."""
+
+    def __init__(self, median_ms, sigma=0.5):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+
+    def sample(self):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(random.gauss(0, self.sigma))
+
+
+class StubConfig:
+    """Latencias, tasas de error y respuestas de los servidores de prueba."""
+
+    def __init__(self, tmdb_latency=None, hf_latency=None, tmdb_error_rate=0.0, hf_error_rate=0.0,
+                 discover_payload=None, generated_text=GENERATED_TEXT, token_delay_ms=20, tmdb_rate_limit=0):
+        self.tmdb_latency = tmdb_latency or Latency(80)
+        self.hf_latency = hf_latency or Latency(800)
+        self.tmdb_error_rate = tmdb_error_rate
+        self.hf_error_rate = hf_error_rate
+        self.discover_payload = discover_payload
+        self.generated_text = generated_text
+        self.token_delay = token_delay_ms / 1000
+        self.tmdb_rate_limit = tmdb_rate_limit
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (segundo, peticiones en ese segundo)
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def over_rate_limit(self):
+        """Cuenta una petición a TMDb y dice si supera la cuota por segundo (0 = sin cuota)."""
+        if not self.tmdb_rate_limit:
+            return False
+        with self._lock:
+            second, requests = self._window
+            now = int(time.monotonic())
+            requests = requests + 1 if now == second else 1
+            self._window = (now, requests)
+            return requests > self.tmdb_rate_limit
+
+
+def discover_page(params):
+    """Página sintética de /discover/movie: ids distintos según los filtros y la página."""
+    page = int(params.get("page", 1))
+    seed = hash((params.get("with_genres"), params.get("with_people"), params.get("sort_by"))) & 0xFFFF
+    return {
+        "page": page,
+        "total_pages": 5,
+        "results": [
+            {
+                "id": seed * 1000 + page * 20 + i,
+                "title": f"Película {seed}-{page}-{i}",
+                "overview": "Una historia sintética servida por el servidor de pruebas.",
+                "release_date": f"{1980 + (seed + i) % 45}-01-01",
+                "popularity": 100 - i,
+                "vote_count": 500,
+                "vote_average": 7.5,
+            }
+            for i in range(20 if page < 5 else 7)
+        ],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # StubConfig, asignado por start_stub_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def fail(self, name):
+        self.config.count(f"{name}_error")
+        self.send_json({"error": "stub error"}, 503)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        config = self.config
+        if config.over_rate_limit():
+            # Como TMDb: 429 con Retry-After
+            config.count("tmdb_429")
+            body = b'{"status_code": 25, "status_message": "Your request count is over the allowed limit."}'
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        time.sleep(config.tmdb_latency.sample())
+        if random.random() < config.tmdb_error_rate:
+            self.fail("tmdb")
+            return
+
+        if url.path.endswith("/discover/movie"):
+            config.count("discover")
+            self.send_json(config.discover_payload or discover_page(params))
+        elif url.path.endswith("/search/person"):
+            config.count("search_person")
+            query = params.get("query", "")
+            self.send_json({"results": [{"id": hash(query) & 0xFFFFF, "name": query, "popularity": 10}]})
+        else:
+            self.send_json({"status_message": "not found"}, 404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        config = self.config
+        if not self.path.startswith("/generate"):
+            self.send_json({"error": "not found"}, 404)
+            return
+        time.sleep(config.hf_latency.sample())
+        if random.random() < config.hf_error_rate:
+            self.fail("hf")
+            return
+
+        if self.path.startswith("/generate_batch"):
+            # Un lote cuesta lo mismo que una generación suelta (el modelo procesa los prompts juntos)
+            inputs = json.loads(body or b"{}").get("inputs", [])
+            config.count("generate_batch")
+            for _ in inputs:
+                config.count("generate_batch_prompts")
+            self.send_json([{"generated_text": config.generated_text} for _ in inputs])
+            return
+
+        config.count("generate")
+        request = json.loads(body or b"{}")
+        if not request.get("stream"):
+            self.send_json([{"generated_text": config.generated_text}])
+            return
+
+        # Streaming en el formato SSE de Text Generation Inference
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        words = config.generated_text.split(" ")
+        for i, word in enumerate(words):
+            text = word if i == 0 else " " + word
+            event = {"token": {"id": i, "text": text, "logprob": 0.0, "special": False},
+                     "generated_text": None, "details": None}
+            self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+            time.sleep(config.token_delay)
+
+
+def start_stub_server(config, host="127.0.0.1", port=0):
+    """Arranca el servidor de pruebas en un hilo y devuelve ``(servidor, url_base)``."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def stub_environment(base_url):
+    """Variables de entorno para que la aplicación use los servidores de prueba."""
+    return {
+        "TMDB_BASE_URL": f"{base_url}/3",
+        "TMDB_API_KEY": "stub",
+        "HF_MODEL": f"{base_url}/generate",
+        "HUGGINGFACE_API_KEY": "stub",
+    }
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--tmdb-latency-ms", type=float, default=80, help="Mediana de latencia de TMDb")
+    parser.add_argument("--hf-latency-ms", type=float, default=800, help="Mediana de latencia de la generación")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Dispersión log-normal de las latencias")
+    parser.add_argument("--tmdb-error-rate", type=float, default=0.0)
+    parser.add_argument("--hf-error-rate", type=float, default=0.0)
+    parser.add_argument("--tmdb-rate-limit", type=int, default=0, help="Peticiones por segundo antes de responder 429")
+    parser.add_argument("--discover-payload", help="Archivo JSON con la respuesta fija de /discover/movie")
+
+
+def config_from_args(args):
+    payload = None
+    if args.discover_payload:
+        with open(args.discover_payload, encoding="utf-8") as f:
+            payload = json.load(f)
+    return StubConfig(
+        tmdb_latency=Latency(args.tmdb_latency_ms, args.latency_sigma),
+        hf_latency=Latency(args.hf_latency_ms, args.latency_sigma),
+        tmdb_error_rate=args.tmdb_error_rate,
+        hf_error_rate=args.hf_error_rate,
+        discover_payload=payload,
+        tmdb_rate_limit=args.tmdb_rate_limit,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(config_from_args(args), port=args.port)
+    print("Servidores de prueba en", base_url)
+    for key, value in stub_environment(base_url).items():
+        print(f"{key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
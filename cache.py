@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Valor centinela para distinguir "no está en caché" de un resultado cacheado
+MISSING = object()
+
+
+def canonical_key(params, exclude=("api_key",)):
+    """Convierte un diccionario de parámetros en una clave hashable e independiente del orden."""
+    return tuple(sorted((str(k), str(v)) for k, v in params.items() if k not in exclude))
+
+
+class TTLCache:
+    """Caché en memoria con TTL, tamaño máximo con expulsión LRU y contadores.
+
+    Los resultados negativos (vacíos) se guardan con su propio TTL, normalmente
+    más corto, y se cuentan aparte para poder distinguirlos en las métricas.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, negative_ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # clave -> (expira, negativo, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Devuelve el valor cacheado o MISSING si no existe o expiró."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            if entry[1]:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, negative=False):
+        """Guarda un valor; ``negative`` indica un resultado vacío (usa negative_ttl)."""
+        ttl = self.negative_ttl if negative else self.ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, negative, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores de uso de la caché."""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
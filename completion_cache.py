@@ -0,0 +1,110 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from cache import MISSING, TTLCache
+
+
+def normalize_prompt(prompt):
+    """Forma canónica del prompt: espacios colapsados y minúsculas."""
+    return " ".join(prompt.split()).lower()
+
+
+def completion_key(prompt, model, params):
+    """Clave de caché de una generación: prompt normalizado, modelo y parámetros."""
+    payload = json.dumps(
+        {"prompt": normalize_prompt(prompt), "model": model, "params": params},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(params):
+    """True si los parámetros generan siempre el mismo texto (sin muestreo)."""
+    return not params.get("do_sample", True) or not params.get("temperature")
+
+
+class CompletionCache:
+    """Caché de respuestas del modelo de lenguaje indexada por prompt y parámetros.
+
+    Guarda las respuestas ya limpias en memoria (TTL y expulsión LRU) y,
+    opcionalmente, en un archivo SQLite que comparten los procesos y sobrevive a
+    reinicios. Con temperatura mayor que cero la generación es aleatoria, así
+    que sólo se reutilizan respuestas si ``reuse_sampled`` lo permite.
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, path=None, reuse_sampled=False):
+        self.ttl = ttl
+        self.reuse_sampled = reuse_sampled
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl, negative_ttl=0)
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def enabled_for(self, params):
+        return self.ttl > 0 and (self.reuse_sampled or is_deterministic(params))
+
+    def get(self, prompt, model, params):
+        """Respuesta cacheada para la generación, o None."""
+        if not self.enabled_for(params):
+            return None
+        key = completion_key(prompt, model, params)
+        response = self._memory.get(key)
+        if response is not MISSING:
+            return response
+        if self._conn is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                return None
+            self.disk_hits += 1
+        # Subir la entrada a memoria para las próximas consultas
+        self._memory.set(key, row[0])
+        return row[0]
+
+    def set(self, prompt, model, params, response):
+        """Guarda la respuesta de una generación (no hace nada si no es reutilizable)."""
+        if not response or not self.enabled_for(params):
+            return
+        key = completion_key(prompt, model, params)
+        self._memory.set(key, response)
+        if self._conn is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, expires) VALUES (?, ?, ?)",
+                (key, response, now + self.ttl),
+            )
+            self._conn.execute("DELETE FROM completions WHERE expires <= ?", (now,))
+
+    def stats(self):
+        """Contadores de uso; ``hits`` incluye los aciertos servidos desde el disco."""
+        stats = self._memory.stats()
+        # Un acierto en disco cuenta antes como fallo en memoria
+        hits = stats["hits"] + self.disk_hits
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "hits": hits,
+            "disk_hits": self.disk_hits,
+            "misses": stats["misses"] - self.disk_hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        })
+        del stats["negative_hits"]
+        return stats
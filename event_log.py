@@ -0,0 +1,268 @@
+"""Registro de eventos de las conversaciones en un archivo JSONL de sólo añadir.
+
+La petición sólo deja el evento en un búfer en memoria; un hilo lo serializa y
+lo escribe en lotes, así que el chat no espera al disco. El búfer está acotado:
+si el disco no da abasto, los eventos nuevos se descartan y se cuentan (mejor
+perder analítica que latencia o memoria). El archivo se sincroniza con fsync
+como mucho cada ``fsync_interval`` segundos y se rota al superar ``max_bytes``
+(events.jsonl -> events.jsonl.1 -> ... -> events.jsonl.N).
+
+Cada turno del chat es un evento ``chat_turn`` con el mensaje, la rama que lo
+respondió, las preferencias extraídas y los ids de las películas recomendadas.
+Los turnos se agrupan en conversaciones con ``conversation`` (un hash del id de
+sesión, nunca el id en sí) o, en el modo sin estado, con ``parent`` (un hash de
+los mensajes anteriores del usuario). ``read_conversations`` las reconstruye;
+benchmarks/replay_events.py las vuelve a enviar a /api/chat.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+def conversation_key(session_id):
+    """Identificador de conversación derivado del id de sesión (que da acceso a ella)."""
+    return hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def history_digest(chat_history):
+    """Hash de los mensajes del usuario de un historial, para encadenar turnos sin sesión."""
+    digest = hashlib.blake2b(digest_size=8)
+    for msg in chat_history:
+        if msg.get("role") == "user":
+            digest.update(str(msg.get("content", "")).encode("utf-8"))
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class EventLog:
+    """Escritor en segundo plano de eventos JSONL con búfer acotado, fsync por lotes y rotación.
+
+    El hilo escritor se arranca con el primer evento.
+    """
+
+    def __init__(self, path, max_buffer=10000, fsync_interval=5.0, max_bytes=64 * 1024 * 1024, backups=5):
+        self.path = path
+        self.max_buffer = max_buffer
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._file = None
+        self._size = 0
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def log(self, event):
+        """Encola un evento (un diccionario JSON) sin bloquear; devuelve False si se descartó."""
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return False
+            self._buffer.append(event)
+            self.logged += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def flush(self, timeout=None):
+        """Espera a que se escriban los eventos encolados hasta ahora; devuelve si se logró."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self.logged
+            while self.written + self.errors < target and self._thread is not None:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    def close(self, timeout=5.0):
+        """Escribe lo pendiente, sincroniza y cierra el archivo (p. ej. con atexit)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    if self._dirty:
+                        # Despertar a tiempo para el fsync pendiente
+                        left = self._last_fsync + self.fsync_interval - time.monotonic()
+                        if left <= 0:
+                            break
+                        self._cond.wait(left)
+                    else:
+                        self._cond.wait()
+                batch = list(self._buffer)
+                self._buffer.clear()
+                closing = self._closed
+
+            if batch:
+                try:
+                    self._write(batch)
+                    written, failed = len(batch), 0
+                except (OSError, TypeError, ValueError) as e:
+                    print(f"Error writing event log {self.path}: {e}")
+                    written, failed = 0, len(batch)
+                with self._cond:
+                    self.written += written
+                    self.errors += failed
+                    self._cond.notify_all()
+
+            if self._dirty and (closing or time.monotonic() - self._last_fsync >= self.fsync_interval):
+                self._sync()
+            if closing:
+                with self._cond:
+                    if self._buffer:
+                        continue
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, batch):
+        data = "".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in batch)
+        data = data.encode("utf-8")
+        if self._file is None:
+            self._open()
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+            self._open()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self._dirty = True
+
+    def _open(self):
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _sync(self):
+        try:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        except OSError as e:
+            print(f"Error syncing event log {self.path}: {e}")
+        self._dirty = False
+        self._last_fsync = time.monotonic()
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self._file = None
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "buffered": len(self._buffer),
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "fsyncs": self.fsyncs,
+                "rotations": self.rotations,
+            }
+
+
+def log_files(path):
+    """El registro y sus copias rotadas que existan, de la más antigua a la actual."""
+    rotated = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated.append(f"{path}.{index}")
+        index += 1
+    return rotated[::-1] + ([path] if os.path.exists(path) else [])
+
+
+def read_events(paths, event_type="chat_turn"):
+    """Eventos de un tipo leídos de varios archivos, ordenados por fecha.
+
+    Las líneas incompletas (por ejemplo, la última tras una caída) se ignoran.
+    """
+    events = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict) and event.get("type") == event_type:
+                    events.append(event)
+    events.sort(key=lambda event: event.get("ts", 0))
+    return events
+
+
+def read_conversations(paths):
+    """Reconstruye las conversaciones del registro: una lista de turnos por conversación.
+
+    Las de sesión se agrupan por ``conversation``. Las sin estado se encadenan
+    por ``parent``: cada camino desde el primer mensaje hasta un turno sin
+    continuación es una conversación (dos que empiezan igual comparten esos
+    turnos). Los turnos cuyo inicio se perdió (por la rotación) empiezan una
+    conversación nueva.
+    """
+    sessions = {}
+    children = {}
+    stateless = []
+    for event in read_events(paths):
+        if event.get("conversation"):
+            sessions.setdefault(event["conversation"], []).append(event)
+        elif "parent" in event:
+            children.setdefault(event["parent"], []).append(event)
+            stateless.append(event)
+
+    conversations = list(sessions.values())
+    visited = set()
+
+    def walk(first):
+        # Recorrido en profundidad con una pila explícita: las conversaciones
+        # largas no deben agotar el límite de recursión
+        stack = [([], first)]
+        while stack:
+            path, event = stack.pop()
+            if id(event) in visited:
+                continue
+            visited.add(id(event))
+            path = path + [event]
+            history = [{"role": "user", "content": turn["message"]} for turn in path]
+            following = children.get(history_digest(history), [])
+            if not following:
+                conversations.append(path)
+            for child in reversed(following):
+                if id(child) not in visited:
+                    stack.append((path, child))
+
+    for event in children.get(history_digest([]), []):
+        walk(event)
+    for event in stateless:
+        if id(event) not in visited:
+            walk(event)
+
+    conversations.sort(key=lambda turns: turns[0].get("ts", 0))
+    return conversations
@@ -0,0 +1,194 @@
+"""Micro-batching de generaciones de texto.
+
+Los prompts se encolan y un hilo despachador los agrupa: espera como mucho
+``max_wait`` segundos desde el primero de la cola o hasta juntar
+``max_batch_size``, y envía el lote al backend. Cada petición espera su propio
+resultado con el plazo de resilience.py. Con la cola llena (``max_queue``)
+se rechaza la petición en vez de acumular latencia, y el chat usa la
+respuesta de respaldo.
+
+Un backend es cualquier objeto con ``generate_batch(prompts)`` que devuelve
+una lista con un texto (o una excepción) por prompt.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+import requests
+
+from metrics import LLM_BATCH_SIZE, LLM_QUEUE_WAIT_SECONDS, upstream
+from resilience import DeadlineExceeded, bounded_timeout
+
+
+class QueueFullError(RuntimeError):
+    """La cola de generaciones está llena."""
+
+
+class HuggingFaceBackend:
+    """Un text_generation por prompt, todos los del lote en paralelo.
+
+    La Inference API y Text Generation Inference no aceptan varios prompts en
+    una petición (TGI los agrupa por su cuenta en el servidor), así que aquí el
+    lote sólo acota cuántas generaciones hay en curso.
+    """
+
+    def __init__(self, get_client, model, params, breaker=None, max_workers=16):
+        self.get_client = get_client
+        self.model = model
+        self.params = params
+        self.breaker = breaker
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hf-generate")
+
+    def generate(self, prompt):
+        with self.breaker.guard() if self.breaker else nullcontext(), upstream("hf", "text_generation"):
+            return self.get_client().text_generation(prompt, model=self.model, **self.params)
+
+    def generate_batch(self, prompts):
+        futures = [self._executor.submit(self.generate, prompt) for prompt in prompts]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class BatchEndpointBackend:
+    """Servidor de modelos local que genera un lote entero en una petición.
+
+    Envía ``POST {"inputs": [...], "parameters": {...}}`` y espera una lista de
+    ``{"generated_text": ...}`` en el mismo orden (benchmarks/stub_servers.py
+    sirve uno en /generate_batch).
+    """
+
+    def __init__(self, url, params, timeout=30.0, breaker=None):
+        self.url = url
+        self.params = params
+        self.timeout = timeout
+        self.breaker = breaker
+        self.session = requests.Session()
+
+    def generate_batch(self, prompts):
+        with self.breaker.guard() if self.breaker else nullcontext(), upstream("llm_batch", "generate_batch"):
+            response = self.session.post(
+                self.url, json={"inputs": prompts, "parameters": self.params}, timeout=self.timeout
+            )
+            response.raise_for_status()
+        return [item["generated_text"] for item in response.json()]
+
+
+class _Pending:
+    __slots__ = ("prompt", "future", "enqueued")
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class GenerationScheduler:
+    """Cola de prompts que se despachan en lotes a un backend.
+
+    Como mucho ``max_in_flight`` lotes están en el backend a la vez; mientras
+    tanto la cola sigue creciendo, así que con carga los lotes salen más llenos.
+    El hilo despachador se arranca con el primer prompt.
+    """
+
+    def __init__(self, backend, max_batch_size=8, max_wait=0.005, max_queue=256, max_in_flight=4):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.batches = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm-batch")
+        self._thread = None
+
+    def enqueue(self, prompt):
+        """Encola un prompt y devuelve el Future con su texto generado."""
+        pending = _Pending(prompt)
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"Cola de generación llena ({self.max_queue} prompts)")
+            self._queue.append(pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-batch-dispatcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return pending.future
+
+    def generate(self, prompt):
+        """Encola un prompt y espera su texto como mucho lo que queda del plazo."""
+        future = self.enqueue(prompt)
+        done, _ = wait([future], timeout=bounded_timeout(None))
+        if not done:
+            # Si aún no salió en un lote, ya no se envía
+            future.cancel()
+            raise DeadlineExceeded("Se agotó el plazo esperando la generación")
+        return future.result()
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                # Ventana contada desde el prompt más antiguo: acota la espera añadida
+                window_end = self._queue[0].enqueued + self.max_wait
+                while len(self._queue) < self.max_batch_size:
+                    remaining = window_end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+                self.in_flight += 1
+            try:
+                self._executor.submit(self._dispatch, batch)
+            except RuntimeError:
+                # El intérprete se está cerrando y el pool ya no acepta tareas
+                return
+
+    def _dispatch(self, batch):
+        try:
+            # Los cancelados (plazo agotado mientras esperaban) no se envían
+            batch = [pending for pending in batch if pending.future.set_running_or_notify_cancel()]
+            if not batch:
+                return
+            now = time.monotonic()
+            for pending in batch:
+                LLM_QUEUE_WAIT_SECONDS.observe(now - pending.enqueued)
+            LLM_BATCH_SIZE.observe(len(batch))
+            self.batches += 1
+
+            try:
+                results = self.backend.generate_batch([pending.prompt for pending in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"El backend devolvió {len(results)} resultados para {len(batch)} prompts")
+            except Exception as e:
+                results = [e] * len(batch)
+            for pending, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    pending.future.set_exception(result)
+                else:
+                    pending.future.set_result(result)
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "in_flight": self.in_flight,
+            "batches": self.batches,
+            "rejected": self.rejected,
+        }
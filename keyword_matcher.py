@@ -0,0 +1,137 @@
+import re
+
+# Patrón de años (mismo criterio que usaba app.py: 19xx o 20xx como palabra completa)
+YEAR_PATTERN = r'\b(?:19\d{2}|20\d{2})\b'
+
+
+def _trie_pattern(keywords):
+    """Construye una expresión regular con forma de trie para un conjunto de palabras.
+
+    Las alternativas comparten prefijos, así que en cada posición el motor de
+    regex descarta casi todas las palabras con una sola comparación, y las
+    partes opcionales son codiciosas para que siempre gane la coincidencia más larga.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        terminal = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            # Opcional y codicioso: intenta primero la palabra más larga
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class MessageMatch:
+    """Resultado de escanear un mensaje normalizado con un KeywordMatcher.
+
+    Guarda, por cada tabla, el valor de mayor prioridad encontrado (el primero en
+    el orden de la tabla original), los años mencionados en orden de aparición y
+    las coincidencias por palabra completa (respuestas afirmativas/negativas).
+    """
+
+    __slots__ = ("text", "years", "_best", "_words")
+
+    def __init__(self, text, years, best, words):
+        self.text = text
+        self.years = years
+        self._best = best
+        self._words = words
+
+    def first(self, table):
+        """Devuelve el valor de mayor prioridad encontrado en la tabla, o None."""
+        hit = self._best.get(table)
+        return hit[1] if hit else None
+
+    def hit(self, table):
+        """Devuelve el par (prioridad, valor) de mayor prioridad de la tabla, o None."""
+        return self._best.get(table)
+
+    def has(self, table):
+        """Indica si alguna palabra de la tabla aparece en el mensaje."""
+        return table in self._best or table in self._words
+
+    def __repr__(self):
+        found = {table: value for table, (_, value) in self._best.items()}
+        return f"MessageMatch({self.text!r}, found={found}, years={self.years}, words={sorted(self._words)})"
+
+
+class KeywordMatcher:
+    """Compila varias tablas de palabras clave en un único autómata.
+
+    ``tables`` asocia un nombre de tabla con una lista ordenada de pares
+    ``(palabra, valor)``; la posición en la lista es la prioridad, de modo que se
+    conserva la semántica de "la primera coincidencia gana" de los bucles
+    ``for clave in TABLA: if clave in mensaje``. Las palabras se buscan como
+    subcadenas, igual que con el operador ``in``.
+
+    ``word_tables`` contiene palabras que sólo cuentan si son el mensaje entero o
+    una de sus palabras (como hacían ``is_affirmative_response`` y
+    ``is_negative_response``).
+
+    Las palabras deben estar ya normalizadas con el mismo criterio que los mensajes.
+    """
+
+    def __init__(self, tables, word_tables=None):
+        # palabra -> [(tabla, prioridad, valor), ...]
+        self._entries = {}
+        for table, pairs in tables.items():
+            for priority, (keyword, value) in enumerate(pairs):
+                if keyword:
+                    self._entries.setdefault(keyword, []).append((table, priority, value))
+
+        # Para cada palabra, las palabras que son prefijo suyo (incluida ella misma).
+        # Si en una posición coincide la palabra más larga, también coinciden sus prefijos.
+        self._prefix_entries = {}
+        for keyword in self._entries:
+            hits = []
+            for end in range(1, len(keyword) + 1):
+                hits.extend(self._entries.get(keyword[:end], ()))
+            self._prefix_entries[keyword] = tuple(hits)
+
+        # Una sola pasada: lookahead en cada posición para encontrar también
+        # coincidencias solapadas, y el patrón de años en la misma expresión.
+        self._regex = re.compile(
+            r"(?=(?P<kw>" + _trie_pattern(self._entries) + r")|(?P<year>" + YEAR_PATTERN + r"))"
+        )
+
+        self._word_tables = {
+            table: frozenset(words) for table, words in (word_tables or {}).items()
+        }
+
+    def scan(self, normalized_text):
+        """Escanea el texto una sola vez y devuelve un MessageMatch reutilizable."""
+        best = {}
+        years = []
+        prefix_entries = self._prefix_entries
+        for match in self._regex.finditer(normalized_text):
+            keyword = match.group("kw")
+            if keyword:
+                for table, priority, value in prefix_entries[keyword]:
+                    current = best.get(table)
+                    if current is None or priority < current[0]:
+                        best[table] = (priority, value)
+            else:
+                year = match.group("year")
+                if year:
+                    years.append(year)
+
+        words = set()
+        if self._word_tables:
+            tokens = set(normalized_text.split())
+            tokens.add(normalized_text)
+            for table, vocabulary in self._word_tables.items():
+                if not vocabulary.isdisjoint(tokens):
+                    words.add(table)
+
+        return MessageMatch(normalized_text, years, best, frozenset(words))
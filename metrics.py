@@ -0,0 +1,224 @@
+"""Métricas del proceso en formato de texto de Prometheus y tiempos por etapa.
+
+Los contadores e histogramas viven en memoria del proceso (con varios workers,
+cada uno expone los suyos). ``stage`` mide una etapa de un turno de chat: la
+registra en el histograma ``chat_stage_seconds`` y en la lista de tiempos de
+la petición en curso, de la que sale la cabecera ``Server-Timing``. Esa lista
+se guarda en una ``ContextVar``, así que la heredan las tareas asíncronas y los
+hilos que copian el contexto, igual que el plazo de resilience.py.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador con etiquetas."""
+
+    type = "counter"
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.label_names), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.label_names, key)), value
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas (buckets en segundos)."""
+
+    type = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # etiquetas -> [cuentas por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        for key, entry in items:
+            labels = dict(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, entry):
+                yield f"{self.name}_bucket", {**labels, "le": format_value(float(bound))}, count
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, entry[-1]
+            yield f"{self.name}_sum", labels, entry[-2]
+            yield f"{self.name}_count", labels, entry[-1]
+
+
+class Registry:
+    """Conjunto de métricas del proceso y colectores que se evalúan al exportar."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, description, labels=()):
+        metric = Counter(name, description, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, description, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """Registra una función que devuelve tuplas ``(nombre, tipo, descripción, etiquetas, valor)``.
+
+        Sirve para exportar contadores que ya llevan otros objetos (cachés,
+        circuit breakers) sin duplicarlos. Se puede usar como decorador.
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        """Texto de exposición de Prometheus (versión 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+        declared = set()
+        for collect in self._collectors:
+            for name, kind, description, labels, value in collect():
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# HELP {name} {description}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chat_request_seconds", "Duración de las peticiones HTTP por ruta", ["endpoint"]
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "chat_stage_seconds", "Duración de cada etapa de un turno de chat", ["stage"]
+)
+CHAT_BRANCHES = REGISTRY.counter(
+    "chat_branch_total", "Turnos de chat por rama de enrutado", ["branch"]
+)
+GENERATIONS = REGISTRY.counter(
+    "chat_generation_total", "Respuestas conversacionales por origen (canned, cache, llm, fallback)", ["source"]
+)
+UPSTREAM_CALLS = REGISTRY.counter(
+    "upstream_calls_total", "Llamadas a servicios externos por resultado", ["upstream", "endpoint", "outcome"]
+)
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_call_seconds", "Duración de las llamadas a servicios externos", ["upstream", "endpoint"]
+)
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    "rate_limit_wait_seconds", "Espera en el limitador de tasa antes de una llamada saliente", ["limiter", "priority"]
+)
+RATE_LIMIT_SHED = REGISTRY.counter(
+    "rate_limit_shed_total", "Llamadas salientes descartadas por el limitador de tasa", ["limiter", "priority"]
+)
+LLM_BATCH_SIZE = REGISTRY.histogram(
+    "llm_batch_size", "Prompts por lote enviado al backend de generación", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Espera de un prompt en la cola de generación hasta salir en un lote"
+)
+
+
+def start_request():
+    """Empieza a registrar los tiempos por etapa de la petición actual."""
+    _timings.set([])
+
+
+def request_timings():
+    """Tiempos ``(etapa, segundos)`` registrados en la petición actual."""
+    return _timings.get() or []
+
+
+@contextmanager
+def stage(name):
+    """Mide una etapa del turno de chat."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing(timings, total=None):
+    """Valor de la cabecera Server-Timing (las etapas repetidas se suman)."""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1e3:.1f}" for name, seconds in totals.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1e3:.1f}")
+    return ", ".join(entries)
+
+
+@contextmanager
+def upstream(name, endpoint):
+    """Mide una llamada a un servicio externo y cuenta su resultado (ok o error)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_CALLS.inc(upstream=name, endpoint=endpoint, outcome="error")
+        raise
+    else:
+        UPSTREAM_CALLS.inc(upstream=name, endpoint=endpoint, outcome="ok")
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=name, endpoint=endpoint)
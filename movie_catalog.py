@@ -0,0 +1,261 @@
+"""Índice columnar local del catálogo de películas para responder /discover/movie sin red.
+
+Construir el índice a partir de una exportación JSONL con el formato de TMDb
+(un objeto por línea con id, title, overview, release_date, genre_ids o genres,
+popularity, vote_count y vote_average):
+
+    python movie_catalog.py build peliculas.jsonl catalog/
+
+El índice son arrays NumPy guardados como .npy (cargados con mmap), con las
+filas ordenadas por popularidad, y una tabla de metadatos JSONL con sus
+offsets, así que abrirlo es casi instantáneo y la memoria la comparte el
+sistema operativo entre procesos.
+"""
+import argparse
+import json
+import mmap
+import os
+
+import numpy as np
+
+# Géneros de películas de TMDb; la posición es el bit en la máscara de géneros
+TMDB_GENRE_IDS = (
+    28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37,
+)
+GENRE_BITS = {genre_id: 1 << bit for bit, genre_id in enumerate(TMDB_GENRE_IDS)}
+
+# Campos que se guardan en la tabla de metadatos y se devuelven como resultado
+METADATA_FIELDS = (
+    "id", "title", "original_title", "overview", "release_date", "poster_path",
+    "original_language", "genre_ids", "popularity", "vote_count", "vote_average",
+)
+
+# Tamaño de página de /discover/movie
+PAGE_SIZE = 20
+
+# Parámetros que el índice sabe evaluar; con cualquier otro filtro se usa la API
+SUPPORTED_PARAMS = {
+    "api_key", "language", "sort_by", "include_adult", "page", "with_genres",
+    "primary_release_date.gte", "primary_release_date.lte",
+    "vote_count.gte", "vote_count.lte", "vote_average.gte", "vote_average.lte",
+}
+
+SORT_COLUMNS = {
+    "popularity": "popularity",
+    "vote_average": "vote_average",
+    "vote_count": "vote_count",
+    "primary_release_date": "release_date",
+    "release_date": "release_date",
+}
+
+
+def date_to_int(value):
+    """Convierte "AAAA-MM-DD" en el entero AAAAMMDD (0 si falta o no es válida)."""
+    if not value:
+        return 0
+    try:
+        year, month, day = (value.split("-") + ["1", "1"])[:3]
+        return int(year) * 10000 + int(month) * 100 + int(day)
+    except ValueError:
+        return 0
+
+
+def genre_ids_of(movie):
+    if "genre_ids" in movie:
+        return movie["genre_ids"] or []
+    return [genre["id"] for genre in movie.get("genres") or []]
+
+
+def build_catalog(jsonl_path, out_dir):
+    """Lee la exportación JSONL y escribe el índice columnar en ``out_dir``."""
+    os.makedirs(out_dir, exist_ok=True)
+    ids, genre_masks, dates, popularity, vote_count, vote_average, adult = [], [], [], [], [], [], []
+    offsets = [0]  # offsets de cada fila en metadata.jsonl
+
+    with open(jsonl_path, encoding="utf-8") as source, \
+            open(os.path.join(out_dir, "metadata.jsonl"), "wb") as metadata:
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            movie = json.loads(line)
+            if movie.get("id") is None:
+                continue
+
+            genres = genre_ids_of(movie)
+            mask = 0
+            for genre_id in genres:
+                mask |= GENRE_BITS.get(genre_id, 0)
+
+            ids.append(movie["id"])
+            genre_masks.append(mask)
+            dates.append(date_to_int(movie.get("release_date")))
+            popularity.append(movie.get("popularity") or 0.0)
+            vote_count.append(movie.get("vote_count") or 0)
+            vote_average.append(movie.get("vote_average") or 0.0)
+            adult.append(bool(movie.get("adult")))
+
+            record = {field: movie.get(field) for field in METADATA_FIELDS}
+            record["genre_ids"] = genres
+            metadata.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            offsets.append(metadata.tell())
+
+    # Las filas se guardan ordenadas por popularidad descendente: así el orden
+    # más habitual (popularity.desc) sale directamente del filtro, sin ordenar
+    popularity = np.asarray(popularity, dtype=np.float32)
+    order = np.argsort(-popularity, kind="stable")
+    offsets = np.asarray(offsets, dtype=np.int64)
+    columns = {
+        "id": np.asarray(ids, dtype=np.int64)[order],
+        "genre_mask": np.asarray(genre_masks, dtype=np.uint32)[order],
+        "release_date": np.asarray(dates, dtype=np.int32)[order],
+        "popularity": popularity[order],
+        "vote_count": np.asarray(vote_count, dtype=np.int32)[order],
+        "vote_average": np.asarray(vote_average, dtype=np.float32)[order],
+        "adult": np.asarray(adult, dtype=np.bool_)[order],
+        # Inicio y fin de cada fila en metadata.jsonl (que conserva el orden original)
+        "meta_start": offsets[:-1][order],
+        "meta_end": offsets[1:][order],
+    }
+    for name, column in columns.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), column)
+    return len(ids)
+
+
+def parse_genres(value):
+    """Devuelve (máscara, todos) a partir de with_genres ("," = todos, "|" = alguno)."""
+    value = str(value)
+    require_all = "|" not in value
+    mask = 0
+    for part in value.replace("|", ",").split(","):
+        part = part.strip()
+        if part:
+            bit = GENRE_BITS.get(int(part))
+            if bit is None and require_all:
+                # Un género desconocido obligatorio no puede cumplirse
+                return None, True
+            mask |= bit or 0
+    return mask, require_all
+
+
+class MovieCatalog:
+    """Motor local de /discover/movie sobre el índice columnar."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        self.ids = load("id")
+        self.genre_mask = load("genre_mask")
+        self.release_date = load("release_date")
+        self.popularity = load("popularity")
+        self.vote_count = load("vote_count")
+        self.vote_average = load("vote_average")
+        self.adult = load("adult")
+        self.meta_start = load("meta_start")
+        self.meta_end = load("meta_end")
+        self._metadata_file = open(os.path.join(directory, "metadata.jsonl"), "rb")
+        size = os.fstat(self._metadata_file.fileno()).st_size
+        self._metadata = mmap.mmap(self._metadata_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.ids)
+
+    def supports(self, params):
+        return all(key in SUPPORTED_PARAMS for key in params)
+
+    def movie(self, row):
+        """Metadatos de una fila del índice."""
+        start, end = int(self.meta_start[row]), int(self.meta_end[row])
+        return json.loads(self._metadata[start:end])
+
+    def mask(self, params):
+        """Máscara booleana de las filas que cumplen los filtros, o None si hay filtros desconocidos."""
+        if not self.supports(params):
+            return None
+
+        if str(params.get("include_adult", "false")).lower() != "true":
+            mask = ~self.adult
+        else:
+            mask = np.ones(len(self.ids), dtype=np.bool_)
+
+        if params.get("with_genres") not in (None, ""):
+            genres, require_all = parse_genres(params["with_genres"])
+            if genres is None:
+                return np.zeros(len(self.ids), dtype=np.bool_)
+            if require_all:
+                mask &= (self.genre_mask & np.uint32(genres)) == np.uint32(genres)
+            else:
+                mask &= (self.genre_mask & np.uint32(genres)) != 0
+
+        if params.get("primary_release_date.gte"):
+            mask &= self.release_date >= date_to_int(params["primary_release_date.gte"])
+        if params.get("primary_release_date.lte"):
+            mask &= (self.release_date <= date_to_int(params["primary_release_date.lte"])) & (self.release_date > 0)
+
+        for column, name in ((self.vote_count, "vote_count"), (self.vote_average, "vote_average")):
+            if params.get(f"{name}.gte") not in (None, ""):
+                mask &= column >= float(params[f"{name}.gte"])
+            if params.get(f"{name}.lte") not in (None, ""):
+                mask &= column <= float(params[f"{name}.lte"])
+        return mask
+
+    def select(self, params):
+        """Filas que cumplen los filtros, ordenadas y paginadas como en TMDb.
+
+        Devuelve None si los parámetros incluyen filtros que el índice no conoce
+        (por ejemplo ``with_people``) y hay que preguntar a la API.
+        """
+        mask = self.mask(params)
+        if mask is None:
+            return None
+
+        rows = np.flatnonzero(mask)
+        page = max(1, int(params.get("page", 1)))
+        top = min(page * PAGE_SIZE, len(rows))
+
+        sort_by = params.get("sort_by", "popularity.desc")
+        if sort_by == "popularity.desc" or top == 0:
+            # Las filas ya están ordenadas por popularidad
+            return rows[(page - 1) * PAGE_SIZE:top]
+
+        field, _, direction = sort_by.partition(".")
+        key = getattr(self, SORT_COLUMNS.get(field, "popularity"))[rows]
+        if direction != "asc":
+            key = -key.astype(np.float64)
+
+        # Top-k sin ordenar todo el resultado: argpartition y luego ordenar sólo k filas
+        if top < len(rows):
+            candidates = np.argpartition(key, top - 1)[:top]
+        else:
+            candidates = np.arange(len(rows))
+        candidates = candidates[np.argsort(key[candidates], kind="stable")]
+        return rows[candidates[(page - 1) * PAGE_SIZE:top]]
+
+    def discover(self, params):
+        """Evalúa los parámetros de /discover/movie y devuelve los resultados, o None."""
+        rows = self.select(params)
+        if rows is None:
+            return None
+        return [self.movie(int(row)) for row in rows]
+
+    def close(self):
+        if isinstance(self._metadata, mmap.mmap):
+            self._metadata.close()
+        self._metadata_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice local del catálogo de películas")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Construye el índice a partir de una exportación JSONL")
+    build.add_argument("source", help="Archivo JSONL con una película por línea")
+    build.add_argument("out_dir", help="Directorio donde guardar el índice")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_catalog(args.source, args.out_dir)
+        print(f"Películas indexadas: {count}")
+
+
+if __name__ == "__main__":
+    main()
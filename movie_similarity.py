@@ -0,0 +1,250 @@
+"""Búsqueda de películas parecidas ("más como esta") sobre el catálogo local.
+
+Construye, a partir de un índice de movie_catalog, una matriz TF-IDF de
+n-gramas de palabras (unigramas y bigramas del título y la sinopsis) con
+hashing de características, normalizada por fila, y la guarda en formato
+disperso por columnas (un índice invertido) como arrays .npy cargados con mmap:
+
+    python movie_similarity.py build catalog/
+
+Una consulta vectoriza la sinopsis de la película de referencia, suma las
+listas de filas de sus n-gramas con ``np.bincount`` (similitud coseno, porque
+las filas están normalizadas) y elige el top-k con ``argpartition``.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+from movie_catalog import MovieCatalog
+
+# Número de columnas del espacio de características (hashing)
+N_FEATURES = 1 << 20
+
+# Los n-gramas presentes en más de esta fracción de películas no aportan
+# (son como palabras vacías) y alargan mucho las listas del índice invertido
+MAX_DF_RATIO = 0.1
+
+# Las sinopsis pesan menos que el título
+OVERVIEW_WEIGHT = 1.0
+TITLE_WEIGHT = 2.0
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Películas que se vectorizan por tanda al construir el índice
+BUILD_CHUNK_SIZE = 5000
+
+
+def normalize_title(text):
+    """Minúsculas, sin acentos ni signos: la misma forma que normalize_text más limpieza."""
+    text = "".join(c for c in unicodedata.normalize("NFD", (text or "").lower())
+                   if unicodedata.category(c) != "Mn")
+    return " ".join(TOKEN_PATTERN.findall(text))
+
+
+def features(title, overview):
+    """Pesos TF (sublineales) por columna de hashing para el título y la sinopsis."""
+    counts = {}
+    for text, weight in ((title, TITLE_WEIGHT), (overview, OVERVIEW_WEIGHT)):
+        tokens = normalize_title(text).split()
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for gram in grams:
+            column = zlib.crc32(gram.encode("utf-8")) & (N_FEATURES - 1)
+            counts[column] = counts.get(column, 0.0) + weight
+    return {column: 1.0 + math.log(count) for column, count in counts.items()}
+
+
+def build_similarity_index(catalog_dir, out_dir=None):
+    """Construye el índice de similitud de un catálogo; devuelve la cantidad de películas.
+
+    El catálogo se vectoriza por tandas de BUILD_CHUNK_SIZE películas, cada una
+    guardada como arrays compactos, y al final se vuelcan en las listas del
+    índice, reservadas de antemano y escritas con mmap. Así la memoria crece con
+    unos pocos bytes por n-grama y no con un objeto Python por cada uno.
+    """
+    out_dir = out_dir or os.path.join(catalog_dir, "similarity")
+    os.makedirs(out_dir, exist_ok=True)
+    catalog = MovieCatalog(catalog_dir)
+    n_movies = len(catalog)
+
+    # Tandas de (columnas, pesos TF, n-gramas por película) y frecuencia de cada columna
+    chunks = []
+    df = np.zeros(N_FEATURES, dtype=np.int64)
+    titles = {}
+    for first in range(0, n_movies, BUILD_CHUNK_SIZE):
+        columns, values, lengths = [], [], []
+        for row in range(first, min(first + BUILD_CHUNK_SIZE, n_movies)):
+            movie = catalog.movie(row)
+            title = normalize_title(movie.get("title"))
+            if title:
+                # Ante títulos repetidos gana la película más popular (las filas ya van en ese orden)
+                titles.setdefault(title, row)
+            weights = features(movie.get("title"), movie.get("overview"))
+            columns.extend(weights.keys())
+            values.extend(weights.values())
+            lengths.append(len(weights))
+        chunk = (
+            np.array(columns, dtype=np.int32),
+            np.array(values, dtype=np.float32),
+            np.array(lengths, dtype=np.int32),
+        )
+        df += np.bincount(chunk[0], minlength=N_FEATURES)
+        chunks.append(chunk)
+    catalog.close()
+
+    # IDF suavizado; los n-gramas demasiado frecuentes se descartan
+    idf = (np.log((1 + n_movies) / (1 + df)) + 1).astype(np.float32)
+    idf[df > max(1, MAX_DF_RATIO * n_movies)] = 0
+
+    # TF-IDF con normalización L2 por película, tanda a tanda
+    counts = np.zeros(N_FEATURES, dtype=np.int64)
+    for index, (columns, values, lengths) in enumerate(chunks):
+        values *= idf[columns]
+        rows = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+        norms = np.sqrt(np.bincount(rows, weights=values.astype(np.float64) ** 2, minlength=len(lengths)))
+        values /= np.maximum(norms[rows], 1e-12).astype(np.float32)
+        keep = values > 0
+        lengths = np.bincount(rows[keep], minlength=len(lengths)).astype(np.int32)
+        chunks[index] = (columns[keep], values[keep], lengths)
+        counts += np.bincount(chunks[index][0], minlength=N_FEATURES)
+
+    # Formato disperso por columnas (CSC): para cada n-grama, sus películas en orden
+    column_ptr = np.zeros(N_FEATURES + 1, dtype=np.int64)
+    np.cumsum(counts, out=column_ptr[1:])
+    nnz = int(column_ptr[-1])
+    row_index = np.lib.format.open_memmap(
+        os.path.join(out_dir, "row_index.npy"), mode="w+", dtype=np.int32, shape=(nnz,)
+    )
+    weights = np.lib.format.open_memmap(
+        os.path.join(out_dir, "weights.npy"), mode="w+", dtype=np.float32, shape=(nnz,)
+    )
+    cursor = column_ptr[:-1].copy()
+    first = 0
+    while chunks:
+        columns, values, lengths = chunks.pop(0)
+        rows = np.repeat(np.arange(first, first + len(lengths), dtype=np.int32), lengths)
+        first += len(lengths)
+        order = np.argsort(columns, kind="stable")
+        columns = columns[order]
+        # Posición de cada entrada dentro de las de su columna en esta tanda
+        offsets = np.arange(len(columns)) - np.searchsorted(columns, columns)
+        positions = cursor[columns] + offsets
+        row_index[positions] = rows[order]
+        weights[positions] = values[order]
+        cursor += np.bincount(columns, minlength=N_FEATURES)
+    row_index.flush()
+    weights.flush()
+    del row_index, weights
+
+    np.save(os.path.join(out_dir, "column_ptr.npy"), column_ptr)
+    np.save(os.path.join(out_dir, "idf.npy"), idf)
+    with open(os.path.join(out_dir, "titles.json"), "w", encoding="utf-8") as f:
+        json.dump(titles, f, ensure_ascii=False)
+    return n_movies
+
+
+class MovieSimilarity:
+    """Consultas de películas parecidas sobre un catálogo y su índice de similitud."""
+
+    def __init__(self, catalog, directory=None):
+        self.catalog = catalog
+        directory = directory or os.path.join(catalog.directory, "similarity")
+        load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        self.column_ptr = load("column_ptr")
+        self.row_index = load("row_index")
+        self.weights = load("weights")
+        self.idf = load("idf")
+        with open(os.path.join(directory, "titles.json"), encoding="utf-8") as f:
+            self.titles = json.load(f)
+
+    def find_title(self, text):
+        """Fila de la película cuyo título es el prefijo más largo del texto, o None.
+
+        Permite reconocer "el padrino por favor" como "El padrino".
+        """
+        words = normalize_title(text).split()
+        for end in range(len(words), 0, -1):
+            row = self.titles.get(" ".join(words[:end]))
+            if row is not None:
+                return row
+        return None
+
+    def query_vector(self, title, overview):
+        """Columnas y pesos TF-IDF normalizados de un texto."""
+        weighted = {column: tf * float(self.idf[column])
+                    for column, tf in features(title, overview).items()}
+        weighted = {column: weight for column, weight in weighted.items() if weight > 0}
+        norm = math.sqrt(sum(weight * weight for weight in weighted.values())) or 1.0
+        columns = np.fromiter(weighted.keys(), dtype=np.int64, count=len(weighted))
+        weights = np.fromiter((weight / norm for weight in weighted.values()), dtype=np.float32, count=len(weighted))
+        return columns, weights
+
+    def scores(self, columns, weights):
+        """Similitud coseno del vector consultado con todas las películas."""
+        starts = self.column_ptr[columns]
+        ends = self.column_ptr[columns + 1]
+        if not len(columns) or not (ends - starts).any():
+            return np.zeros(len(self.catalog), dtype=np.float64)
+        postings = [np.arange(start, end) for start, end in zip(starts, ends)]
+        positions = np.concatenate(postings)
+        query_weights = np.repeat(weights, ends - starts)
+        return np.bincount(
+            self.row_index[positions],
+            weights=self.weights[positions] * query_weights,
+            minlength=len(self.catalog),
+        )
+
+    def similar_rows(self, row, k=3, mask=None):
+        """Las k filas más parecidas a una fila del catálogo (sin incluirla).
+
+        Con ``mask`` (ver MovieCatalog.mask) sólo se consideran las filas que la cumplen.
+        """
+        movie = self.catalog.movie(row)
+        scores = self.scores(*self.query_vector(movie.get("title"), movie.get("overview")))
+        if mask is not None:
+            scores[~mask] = -1
+        scores[row] = -1
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top[scores[top] > 0]
+
+    def similar_to(self, title, k=3, params=None):
+        """Películas parecidas a la del título dado; lista vacía si el título no se conoce.
+
+        Con ``params`` de /discover/movie se devuelven sólo las que cumplen sus
+        filtros (género, fechas, votos), o ninguna si el catálogo no los conoce todos.
+        """
+        row = self.find_title(title)
+        if row is None:
+            return []
+        mask = None
+        if params is not None:
+            mask = self.catalog.mask(params)
+            if mask is None:
+                return []
+        return [self.catalog.movie(int(r)) for r in self.similar_rows(row, k, mask)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice de películas parecidas")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Construye el índice de similitud de un catálogo")
+    build.add_argument("catalog_dir", help="Directorio del índice creado con movie_catalog.py")
+    build.add_argument("--out-dir", help="Directorio de salida (por defecto <catalog_dir>/similarity)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_similarity_index(args.catalog_dir, args.out_dir)
+        print(f"Películas indexadas: {count}")
+
+
+if __name__ == "__main__":
+    main()
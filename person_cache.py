@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import threading
+
+# Campos de la respuesta de /search/person que se conservan en la caché
+PERSON_FIELDS = ("id", "name", "known_for_department", "popularity", "profile_path")
+
+
+class PersonCache:
+    """Caché nombre -> persona de TMDb, persistida en un archivo JSON.
+
+    Los ids de TMDb no cambian, así que las entradas no expiran. El archivo se
+    reescribe de forma atómica (archivo temporal + rename) en cada cambio, con lo
+    que sobrevive a reinicios y nunca queda a medio escribir.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._people = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._people = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading person cache {path}: {e}")
+
+    def get(self, key):
+        person = self._people.get(key)
+        if person is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return person
+
+    def set(self, key, person):
+        self.set_many({key: person})
+
+    def set_many(self, people):
+        """Guarda varias personas y escribe el archivo una sola vez."""
+        if not people:
+            return
+        with self._lock:
+            for key, person in people.items():
+                self._people[key] = {field: person.get(field) for field in PERSON_FIELDS}
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._people, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving person cache {self.path}: {e}")
+
+    def __contains__(self, key):
+        return key in self._people
+
+    def __len__(self):
+        return len(self._people)
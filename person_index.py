@@ -0,0 +1,331 @@
+"""Índice local de personas de TMDb para reconocer nombres en los mensajes sin red.
+
+Se construye a partir de la exportación diaria de personas de TMDb
+(person_ids_MM_DD_YYYY.json: un objeto por línea con id, name, popularity y
+adult; si trae known_for_department, distingue directores de actores):
+
+    python person_index.py build person_ids.json people/ --limit 200000
+
+Se guardan las ``limit`` personas más populares, con las filas ordenadas por
+popularidad. Los nombres se normalizan como los mensajes (minúsculas y sin
+acentos) y el índice son arrays NumPy guardados como .npy (cargados con mmap):
+
+- los hashes de los nombres completos, ordenados, para buscar un nombre exacto
+  con ``np.searchsorted`` (entre homónimos, el más popular va primero);
+- el vocabulario de palabras de los nombres, también por hash;
+- un índice invertido de trigramas de caracteres sobre ese vocabulario, para
+  corregir palabras mal escritas ("tarantno" -> "tarantino").
+
+Para reconocer nombres en un mensaje se prueban sus tramos de 2 a 4 palabras.
+Las palabras que no están en el vocabulario pero van junto a una que sí se
+sustituyen por las más parecidas por trigramas, y cada tramo se busca como
+nombre exacto. Gana el tramo más largo y, a igual longitud, el de mayor
+similitud ponderada por popularidad.
+"""
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+# Palabras de un nombre (con guiones y apóstrofos internos: "jean-luc", "o'brien")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+# Un nombre se busca en tramos de como mucho tantas palabras
+MAX_NAME_WORDS = 4
+
+# Palabras con las que no empieza ni termina un nombre dentro de una frase
+# (sí pueden ir en medio: "guillermo del toro", "robert de niro")
+SPAN_STOPWORDS = frozenset(
+    "a al como con de del el en es la las le lo los me mi o para pero por que se sin sobre su te tu un una y ya"
+    .split()
+)
+
+# Corrección de palabras: similitud de Dice mínima entre sus trigramas,
+# longitud mínima y cuántas alternativas se prueban por palabra
+FUZZY_SIMILARITY = 0.7
+FUZZY_MIN_LENGTH = 4
+FUZZY_CANDIDATES = 3
+
+
+def normalize_name(text):
+    """Minúsculas y sin acentos (el mismo criterio que normalize_text de app.py)."""
+    text = text.lower()
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def tokenize(normalized_text):
+    return TOKEN_PATTERN.findall(normalized_text)
+
+
+def stable_hash(text):
+    """Hash de 64 bits que no cambia entre procesos (a diferencia de ``hash``)."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def trigram_codes(token):
+    """Códigos de los trigramas distintos de una palabra, con un espacio de relleno a cada lado."""
+    padded = f" {token} "
+    return sorted({zlib.crc32(padded[i:i + 3].encode("utf-8")) for i in range(len(padded) - 2)})
+
+
+def _save_strings(out_dir, name, strings):
+    """Guarda una lista de textos como un blob UTF-8 y sus offsets."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(out_dir, f"{name}.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(os.path.join(out_dir, f"{name}_offsets.npy"), offsets)
+
+
+def read_people(path):
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            person = json.loads(line)
+            if person.get("adult") or not person.get("name"):
+                continue
+            yield (
+                float(person.get("popularity") or 0.0),
+                int(person["id"]),
+                person["name"],
+                person.get("known_for_department") == "Directing",
+            )
+
+
+def build_person_index(source_path, out_dir, limit=200000):
+    """Lee la exportación de personas y escribe el índice en ``out_dir``."""
+    os.makedirs(out_dir, exist_ok=True)
+    save = lambda name, array: np.save(os.path.join(out_dir, f"{name}.npy"), array)
+
+    # La exportación completa tiene millones de personas: sólo se retienen las más populares
+    people = heapq.nlargest(limit, read_people(source_path), key=lambda person: (person[0], -person[1]))
+    normalized = [" ".join(tokenize(normalize_name(person[2]))) for person in people]
+
+    save("id", np.array([person[1] for person in people], dtype=np.int32))
+    save("popularity", np.array([person[0] for person in people], dtype=np.float32))
+    save("director", np.array([person[3] for person in people], dtype=np.bool_))
+    _save_strings(out_dir, "names", [person[2] for person in people])
+
+    # Nombres completos por hash; a igual hash, la fila más popular (la menor) primero
+    name_hash = np.array([stable_hash(name) for name in normalized], dtype=np.uint64)
+    order = np.lexsort((np.arange(len(people)), name_hash))
+    save("name_hash", name_hash[order])
+    save("name_row", order.astype(np.int32))
+
+    # Vocabulario de palabras, ordenado por hash
+    vocabulary = sorted({token for name in normalized for token in name.split()}, key=stable_hash)
+    save("token_hash", np.array([stable_hash(token) for token in vocabulary], dtype=np.uint64))
+    _save_strings(out_dir, "tokens", vocabulary)
+
+    # Índice invertido trigrama -> palabras del vocabulario (listas ordenadas)
+    postings = {}
+    counts = np.zeros(len(vocabulary), dtype=np.uint8)
+    for index, token in enumerate(vocabulary):
+        codes = trigram_codes(token)
+        counts[index] = min(len(codes), 255)
+        for code in codes:
+            postings.setdefault(code, []).append(index)
+    codes = sorted(postings)
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum([len(postings[code]) for code in codes], out=offsets[1:])
+    save("trigram_code", np.array(codes, dtype=np.uint32))
+    save("trigram_offsets", offsets)
+    save("trigram_postings", np.fromiter(
+        (index for code in codes for index in postings[code]), dtype=np.int32, count=int(offsets[-1])
+    ))
+    save("token_trigrams", counts)
+    return len(people)
+
+
+class PersonMatch:
+    """Un nombre reconocido en un mensaje: palabras ``start:end`` del texto normalizado."""
+
+    __slots__ = ("id", "name", "director", "popularity", "start", "end", "similarity")
+
+    def __init__(self, id, name, director, popularity, start, end, similarity):
+        self.id = id
+        self.name = name
+        self.director = director
+        self.popularity = popularity
+        self.start = start
+        self.end = end
+        self.similarity = similarity
+
+    def person(self):
+        """Formato de un resultado de /search/person (lo que guarda la caché de personas)."""
+        return {"id": self.id, "name": self.name, "popularity": self.popularity}
+
+    def __repr__(self):
+        return f"PersonMatch({self.name!r}, id={self.id}, words={self.start}:{self.end}, similarity={self.similarity:.2f})"
+
+
+class PersonIndex:
+    """Búsqueda local de personas de TMDb por nombre exacto o aproximado."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        load = lambda name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        self.ids = load("id")
+        self.popularity = load("popularity")
+        self.director = load("director")
+        self.names = load("names")
+        self.name_offsets = load("names_offsets")
+        self.name_hash = load("name_hash")
+        self.name_row = load("name_row")
+        self.token_hash = load("token_hash")
+        self.tokens = load("tokens")
+        self.token_offsets = load("tokens_offsets")
+        self.trigram_code = load("trigram_code")
+        self.trigram_offsets = load("trigram_offsets")
+        self.trigram_postings = load("trigram_postings")
+        self.token_trigrams = load("token_trigrams")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def name(self, row):
+        return bytes(self.names[self.name_offsets[row]:self.name_offsets[row + 1]]).decode("utf-8")
+
+    def token(self, index):
+        return bytes(self.tokens[self.token_offsets[index]:self.token_offsets[index + 1]]).decode("utf-8")
+
+    def _rows(self, names):
+        """Fila más popular de cada nombre normalizado (-1 si no está)."""
+        hashes = np.array([stable_hash(name) for name in names], dtype=np.uint64)
+        positions = np.searchsorted(self.name_hash, hashes)
+        found = positions < len(self.name_hash)
+        found[found] = self.name_hash[positions[found]] == hashes[found]
+        rows = np.full(len(names), -1, dtype=np.int64)
+        rows[found] = self.name_row[positions[found]]
+        return rows
+
+    def _match(self, row, start, end, similarity):
+        return PersonMatch(
+            int(self.ids[row]), self.name(row), bool(self.director[row]),
+            float(self.popularity[row]), start, end, similarity,
+        )
+
+    def lookup(self, name):
+        """Persona más popular con ese nombre exacto (sin contar acentos ni mayúsculas), o None."""
+        tokens = tokenize(normalize_name(name))
+        if not tokens:
+            return None
+        normalized = " ".join(tokens)
+        row = int(self._rows([normalized])[0])
+        # Descarta una colisión de hash (improbable) comparando el nombre guardado
+        if row < 0 or " ".join(tokenize(normalize_name(self.name(row)))) != normalized:
+            return None
+        return self._match(row, 0, len(tokens), 1.0).person()
+
+    def similar_tokens(self, token):
+        """Palabras del vocabulario parecidas a ``token`` por trigramas: [(palabra, similitud)]."""
+        codes = np.array(trigram_codes(token), dtype=np.uint32)
+        positions = np.searchsorted(self.trigram_code, codes)
+        present = positions < len(self.trigram_code)
+        present[present] = self.trigram_code[positions[present]] == codes[present]
+        positions = positions[present]
+        if not len(positions):
+            return []
+        starts = self.trigram_offsets[positions]
+        ends = self.trigram_offsets[positions + 1]
+
+        # Filtro por prefijo: para llegar a la similitud mínima hay que compartir al
+        # menos ``needed`` trigramas, así que basta con mirar las listas más cortas
+        needed = math.ceil(FUZZY_SIMILARITY * len(codes) / (2 - FUZZY_SIMILARITY))
+        scanned = len(codes) - needed + 1 - (len(codes) - len(positions))
+        if scanned <= 0:
+            return []
+        rarest = np.argsort(ends - starts, kind="stable")[:scanned]
+        candidates = np.unique(np.concatenate(
+            [self.trigram_postings[starts[i]:ends[i]] for i in rarest]
+        ))
+
+        overlap = np.zeros(len(candidates), dtype=np.int32)
+        for start, end in zip(starts, ends):
+            postings = self.trigram_postings[start:end]
+            found = np.searchsorted(postings, candidates)
+            found[found == len(postings)] = 0
+            overlap += postings[found] == candidates
+        similarity = 2 * overlap / (len(codes) + self.token_trigrams[candidates].astype(np.int32))
+        best = np.flatnonzero(similarity >= FUZZY_SIMILARITY)
+        best = best[np.argsort(-similarity[best], kind="stable")[:FUZZY_CANDIDATES]]
+        return [(self.token(int(candidates[i])), float(similarity[i])) for i in best]
+
+    def find(self, normalized_text):
+        """Nombres de personas en un texto normalizado, sin solaparse y en orden de aparición."""
+        tokens = tokenize(normalized_text)
+        if len(tokens) < 2:
+            return []
+        hashes = np.array([stable_hash(token) for token in tokens], dtype=np.uint64)
+        positions = np.searchsorted(self.token_hash, hashes)
+        known = positions < len(self.token_hash)
+        known[known] = self.token_hash[positions[known]] == hashes[known]
+        anchors = [bool(known[i]) and token not in SPAN_STOPWORDS and len(token) >= 3 for i, token in enumerate(tokens)]
+
+        # Alternativas de cada palabra: ella misma si está en el vocabulario, o las
+        # más parecidas si es larga y va junto a una palabra de nombre
+        options = []
+        for i, token in enumerate(tokens):
+            if known[i]:
+                options.append([(token, 1.0)])
+            elif len(token) >= FUZZY_MIN_LENGTH and ((i > 0 and anchors[i - 1]) or (i + 1 < len(tokens) and anchors[i + 1])):
+                options.append(self.similar_tokens(token))
+            else:
+                options.append([])
+
+        spans = []
+        for start in range(len(tokens)):
+            if tokens[start] in SPAN_STOPWORDS or not options[start]:
+                continue
+            for end in range(start + 2, min(start + MAX_NAME_WORDS, len(tokens)) + 1):
+                if not options[end - 1]:
+                    break
+                if tokens[end - 1] in SPAN_STOPWORDS:
+                    continue
+                for combination in itertools.product(*options[start:end]):
+                    similarity = sum(s for _, s in combination) / len(combination)
+                    spans.append((start, end, " ".join(word for word, _ in combination), similarity))
+        if not spans:
+            return []
+
+        found = []
+        for (start, end, _, similarity), row in zip(spans, self._rows([span[2] for span in spans])):
+            if row >= 0:
+                rank = similarity * math.log(2 + float(self.popularity[row]))
+                found.append((end - start, rank, start, end, int(row), similarity))
+
+        matches = []
+        taken = set()
+        for _, _, start, end, row, similarity in sorted(found, key=lambda f: (-f[0], -f[1])):
+            if taken.isdisjoint(range(start, end)):
+                taken.update(range(start, end))
+                matches.append(self._match(row, start, end, similarity))
+        return sorted(matches, key=lambda match: match.start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice local de personas de TMDb")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Construye el índice a partir de la exportación de personas")
+    build.add_argument("source", help="Archivo JSONL con una persona por línea")
+    build.add_argument("out_dir", help="Directorio donde guardar el índice")
+    build.add_argument("--limit", type=int, default=200000, help="Personas más populares que se indexan")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_person_index(args.source, args.out_dir, args.limit)
+        print(f"Personas indexadas: {count}")
+
+
+if __name__ == "__main__":
+    main()
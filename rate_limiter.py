@@ -0,0 +1,139 @@
+"""Limitador de tasa con prioridades para las llamadas salientes (token bucket).
+
+Las llamadas interactivas (las de un turno de chat) reservan fichas aunque el
+balde quede en negativo y esperan su turno, siempre que quepa en el plazo de
+la petición. Las de menor prioridad sólo pueden gastar fichas por encima de
+una reserva que queda para las interactivas: con el balde lleno pasan sin
+esperar, pero bajo presión esperan o se descartan. Así un trabajo en segundo
+plano nunca empuja a TMDb por encima de su cuota ni retrasa al chat.
+
+La prioridad se lleva en una ``ContextVar`` (``priority_scope``), igual que el
+plazo de resilience.py: el código en segundo plano la fija una vez y todas las
+llamadas que haga heredan su clase.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from metrics import RATE_LIMIT_SHED, RATE_LIMIT_WAIT_SECONDS
+from resilience import remaining
+
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+BACKGROUND = "background"
+
+# Clase -> (fracción del balde reservada para las clases superiores, espera máxima en segundos)
+PRIORITY_CLASSES = {
+    INTERACTIVE: (0.0, None),   # espera lo que haga falta dentro del plazo de la petición
+    PREFETCH: (0.25, 0.0),      # una precarga que no puede salir ya no sirve: se descarta
+    BACKGROUND: (0.5, 60.0),    # precalentamientos y lotes: esperan a que haya hueco
+}
+
+_priority = contextvars.ContextVar("priority", default=INTERACTIVE)
+
+
+class RateLimited(requests.ConnectionError):
+    """La llamada se descartó para no superar la cuota del servicio."""
+
+
+@contextmanager
+def priority_scope(priority):
+    """Fija la clase de prioridad de las llamadas salientes dentro del bloque."""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Prioridad desconocida: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def with_priority(priority, fn):
+    """Envuelve ``fn`` para que se ejecute con la prioridad dada (p. ej. en un pool de hilos)."""
+    def run(*args, **kwargs):
+        with priority_scope(priority):
+            return fn(*args, **kwargs)
+    return run
+
+
+def current_priority():
+    return _priority.get()
+
+
+class RateLimiter:
+    """Token bucket de ``rate`` llamadas por segundo con ráfagas de hasta ``burst``."""
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=None):
+        """Espera una ficha; lanza RateLimited si la clase no puede esperar tanto."""
+        for delay in self._waits(priority or current_priority()):
+            time.sleep(delay)
+
+    async def acquire_async(self, priority=None):
+        for delay in self._waits(priority or current_priority()):
+            await asyncio.sleep(delay)
+
+    def _waits(self, priority):
+        """Esperas sucesivas hasta obtener una ficha (la lógica común a acquire y acquire_async)."""
+        reserve, max_wait = PRIORITY_CLASSES[priority]
+        floor = self.burst * reserve
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if priority == INTERACTIVE:
+                    # Reservar la ficha y esperar a que se "pague" la deuda, si cabe en el plazo
+                    wait = max(0.0, (1 - self._tokens) / self.rate)
+                    left = remaining()
+                    if left is not None and wait >= left:
+                        self._shed(priority, now - start)
+                    self._tokens -= 1
+                    granted = True
+                elif self._tokens >= floor + 1:
+                    self._tokens -= 1
+                    wait = 0.0
+                    granted = True
+                else:
+                    wait = (floor + 1 - self._tokens) / self.rate
+                    granted = False
+                    if now - start + wait > max_wait:
+                        self._shed(priority, now - start)
+
+            if granted:
+                RATE_LIMIT_WAIT_SECONDS.observe(now - start + wait, limiter=self.name, priority=priority)
+                if wait > 0:
+                    yield wait
+                return
+            yield wait
+
+    def _shed(self, priority, waited):
+        RATE_LIMIT_SHED.inc(limiter=self.name, priority=priority)
+        RATE_LIMIT_WAIT_SECONDS.observe(waited, limiter=self.name, priority=priority)
+        raise RateLimited(f"Límite de peticiones a {self.name}: llamada {priority} descartada")
+
+    def penalize(self, seconds):
+        """Detiene a todas las clases ``seconds`` segundos (p. ej. tras un 429 con Retry-After)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {"tokens": self._tokens, "rate": self.rate, "burst": self.burst}
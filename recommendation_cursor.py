@@ -0,0 +1,176 @@
+"""Cursor de recomendaciones de una conversación: paginación y películas ya mostradas.
+
+El cursor guarda la consulta de /discover/movie en curso, la página cargada,
+las películas de esa página que aún no se mostraron y un filtro de Bloom con
+los ids de TMDb ya mostrados, para que "más recomendaciones" siga donde se
+quedó y nunca repita una película. Todo es serializable a JSON, así que viaja
+con la sesión.
+"""
+import base64
+import re
+
+# Tamaño de página de /discover/movie en TMDb
+PAGE_SIZE = 20
+
+# Campos de cada película que se guardan en el buffer (los que se muestran)
+MOVIE_FIELDS = ("id", "title", "release_date", "overview")
+
+# Parámetros que no se guardan en el cursor (la página la lleva el cursor y la
+# API key no debe acabar en el almacén de sesiones)
+TRANSIENT_PARAMS = ("page", "api_key")
+
+# Enlaces de TMDb en las respuestas de recomendación (ver format_movie_recommendations)
+MOVIE_LINK_PATTERN = re.compile(r"themoviedb\.org/movie/(\d+)")
+
+
+def mix32(value):
+    """Finalizador de MurmurHash3: todos los bits de la salida dependen de todos los de la entrada."""
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & 0xFFFFFFFF
+    value ^= value >> 13
+    value = (value * 0xC2B2AE35) & 0xFFFFFFFF
+    return value ^ (value >> 16)
+
+
+class SeenSet:
+    """Filtro de Bloom sobre ids de TMDb.
+
+    Con los valores por defecto (4096 bits, 3 funciones hash) ocupa 512 bytes y
+    la probabilidad de descartar por error una película no vista es de 1 en 1000
+    con unas 140 películas mostradas y de 1 en 400 con 200.
+
+    ``version`` es el esquema de hashing: los filtros guardados antes de la
+    versión 2 (que sólo miraba los bits bajos del id) se siguen leyendo con el
+    suyo hasta que caduque su sesión.
+    """
+
+    VERSION = 2
+
+    def __init__(self, bits=4096, hashes=3, data=None, count=0, version=VERSION):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray(bits // 8)
+        self.count = count
+        self.version = version
+
+    def _positions(self, movie_id):
+        value = int(movie_id) & 0xFFFFFFFF
+        if self.version < 2:
+            h1 = (value * 0x9E3779B1) & 0xFFFFFFFF
+            h2 = ((value * 0x85EBCA6B) & 0xFFFFFFFF) | 1
+        else:
+            # Doble hashing con dos mezclas de 32 bits (estable entre procesos)
+            h1 = mix32(value)
+            h2 = mix32(h1 ^ 0x9E3779B9) | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, movie_id):
+        for position in self._positions(movie_id):
+            self.data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, movie_id):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(movie_id))
+
+    def to_dict(self):
+        return {
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "count": self.count,
+            "version": self.version,
+            "data": base64.b64encode(bytes(self.data)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return cls()
+        return cls(data["bits"], data["hashes"], base64.b64decode(data["data"]), data.get("count", 0),
+                   data.get("version", 1))
+
+
+class RecommendationCursor:
+    """Consulta de recomendaciones en curso y películas ya mostradas."""
+
+    def __init__(self):
+        self.query = None       # clave canónica de las preferencias consultadas
+        self.params = None      # parámetros de /discover/movie que dieron resultados
+        self.page = 0           # última página cargada (0 = ninguna)
+        self.exhausted = False  # no hay más páginas
+        self.buffer = []        # películas de la página cargada aún no mostradas
+        self.seen = SeenSet()
+
+    def start(self, query, params):
+        """Empieza una consulta nueva si cambió; las películas vistas se conservan."""
+        if query == self.query:
+            return
+        self.query = query
+        self.params = {key: value for key, value in params.items() if key not in TRANSIENT_PARAMS}
+        self.page = 0
+        self.exhausted = False
+        self.buffer = []
+
+    def take(self, limit):
+        """Saca hasta ``limit`` películas no vistas del buffer y las marca como vistas."""
+        movies = []
+        while self.buffer and len(movies) < limit:
+            movie = self.buffer.pop(0)
+            if movie.get("id") is None or movie["id"] not in self.seen:
+                movies.append(movie)
+                self.mark_seen(movie)
+        return movies
+
+    def mark_seen(self, movie):
+        if movie.get("id") is not None:
+            self.seen.add(movie["id"])
+
+    def next_page_params(self):
+        """Parámetros de la siguiente página (sin api_key), o None si ya no quedan."""
+        if self.exhausted or self.params is None:
+            return None
+        return {**self.params, "page": self.page + 1}
+
+    def add_page(self, params, results):
+        """Incorpora una página; ``params`` son los que la devolvieron (tras las alternativas)."""
+        self.params = {key: value for key, value in params.items() if key not in TRANSIENT_PARAMS}
+        self.page += 1
+        self.exhausted = len(results) < PAGE_SIZE
+        self.buffer = [
+            {field: movie.get(field) for field in MOVIE_FIELDS}
+            for movie in results
+            if movie.get("id") is None or movie["id"] not in self.seen
+        ]
+
+    def to_dict(self):
+        return {
+            "query": list(self.query) if self.query is not None else None,
+            "params": self.params,
+            "page": self.page,
+            "exhausted": self.exhausted,
+            "buffer": self.buffer,
+            "seen": self.seen.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        cursor = cls()
+        if not data:
+            return cursor
+        query = data.get("query")
+        cursor.query = tuple(tuple(item) for item in query) if query is not None else None
+        cursor.params = data.get("params")
+        cursor.page = data.get("page", 0)
+        cursor.exhausted = data.get("exhausted", False)
+        cursor.buffer = data.get("buffer", [])
+        cursor.seen = SeenSet.from_dict(data.get("seen"))
+        return cursor
+
+    @classmethod
+    def from_history(cls, chat_history):
+        """Cursor del modo sin estado: sólo las películas ya mostradas en el historial."""
+        cursor = cls()
+        for msg in chat_history:
+            if msg.get("role") == "assistant":
+                for movie_id in MOVIE_LINK_PATTERN.findall(msg.get("content", "")):
+                    cursor.seen.add(int(movie_id))
+        return cursor
@@ -0,0 +1,199 @@
+"""Instantánea en disco de /discover/movie para la rejilla de preferencias comunes.
+
+Sin filtro de persona, las consultas que puede hacer el chat son pocas y
+enumerables (género × década o época × popularidad), así que se pueden pedir
+todas de antemano. La instantánea guarda las primeras páginas de cada una en
+un JSON comprimido, con cada película una sola vez, y los workers la leen al
+arrancar: la mayoría de los turnos de recomendación no llaman a TMDb.
+
+Un proceso (o un cron con ``flask --app app refresh-snapshot``) la regenera;
+los demás detectan el archivo nuevo por su fecha de modificación y lo
+recargan. Se escribe de forma atómica, igual que la caché de personas.
+"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+
+from cache import canonical_key
+from recommendation_cursor import MOVIE_FIELDS, PAGE_SIZE
+
+# Cada cuánto se mira si el archivo cambió (segundos)
+RELOAD_CHECK_INTERVAL = 30.0
+
+# Si falla más de esta fracción de las consultas, no se reemplaza la instantánea
+MAX_FAILED_FRACTION = 0.5
+
+
+class SnapshotBuildError(RuntimeError):
+    """Fallaron demasiadas consultas para reemplazar la instantánea."""
+
+
+def snapshot_key(params):
+    """Clave de una consulta en la instantánea (sin api_key, con la página)."""
+    return "&".join(f"{key}={value}" for key, value in canonical_key({"page": 1, **params}))
+
+
+class RecommendationSnapshot:
+    """Resultados precalculados de /discover/movie leídos de ``path``.
+
+    El archivo se carga la primera vez que se consulta. Las instantáneas más
+    viejas que ``max_age`` segundos se ignoran (se vuelve a la API).
+    """
+
+    def __init__(self, path, max_age=7 * 86400):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._built_at = 0.0
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, params):
+        """Resultados de la consulta, o None si no está en la instantánea (o es demasiado vieja)."""
+        self.reload_if_changed()
+        entries = self._entries
+        if not entries or time.time() - self._built_at > self.max_age:
+            self.misses += 1
+            return None
+        results = entries.get(snapshot_key(params))
+        if results is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return results
+
+    def reload_if_changed(self):
+        """Carga el archivo si es la primera vez o si cambió desde la última lectura."""
+        now = time.monotonic()
+        if self._entries is not None and now - self._checked < RELOAD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self._entries is not None and now - self._checked < RELOAD_CHECK_INTERVAL:
+                return
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                self._entries = self._entries or {}
+                return
+            if mtime != self._mtime:
+                self._load()
+                self._mtime = mtime
+
+    def _load(self):
+        data = read_snapshot(self.path)
+        if data is None:
+            print(f"Error loading recommendation snapshot {self.path}")
+            self._entries = self._entries or {}
+            return
+        movies = data["movies"]
+        self._entries = {key: [movies[str(movie_id)] for movie_id in ids] for key, ids in data["queries"].items()}
+        self._built_at = data["built_at"]
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries or {}),
+            "age": time.time() - self._built_at if self._built_at else None,
+        }
+
+
+def read_snapshot(path):
+    """Contenido del archivo de la instantánea, o None si no existe o no se puede leer."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_snapshot(path, queries, fetch, pages=2):
+    """Pide ``pages`` páginas de cada consulta con ``fetch(params)`` y guarda la instantánea.
+
+    ``fetch`` devuelve la lista de resultados de una página. Para las páginas
+    que fallan se conserva lo que tenía la instantánea anterior; si falla más
+    de MAX_FAILED_FRACTION de las consultas (p. ej. TMDb está caído) se lanza
+    SnapshotBuildError y el archivo no se toca. Devuelve la cantidad guardada.
+    """
+    queries = list(queries)
+    previous = read_snapshot(path) or {"queries": {}, "movies": {}}
+    movies = {}
+    stored = {}
+    failed = 0
+    for params in queries:
+        for page in range(1, pages + 1):
+            page_params = {**params, "page": page}
+            try:
+                results = fetch(page_params)
+            except Exception as e:
+                print(f"Error building recommendation snapshot for {snapshot_key(page_params)}: {e}")
+                failed += 1
+                if failed > MAX_FAILED_FRACTION * len(queries):
+                    # TMDb está caído o limitando: no seguir insistiendo
+                    raise SnapshotBuildError(f"Fallaron {failed} de {len(queries)} consultas; se conserva {path}")
+                # Conservar las páginas anteriores de esta consulta
+                for previous_page in range(page, pages + 1):
+                    key = snapshot_key({**params, "page": previous_page})
+                    ids = previous["queries"].get(key)
+                    if ids is not None:
+                        stored[key] = ids
+                        for movie_id in ids:
+                            movies[str(movie_id)] = previous["movies"][str(movie_id)]
+                break
+            ids = []
+            for movie in results:
+                if movie.get("id") is None:
+                    continue
+                movies[str(movie["id"])] = {field: movie.get(field) for field in MOVIE_FIELDS}
+                ids.append(movie["id"])
+            stored[snapshot_key(page_params)] = ids
+            if len(results) < PAGE_SIZE:
+                break
+
+    data = {"built_at": time.time(), "queries": stored, "movies": movies}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(stored)
+
+
+class SnapshotRefresher:
+    """Hilo que regenera la instantánea cada ``interval`` segundos (si la actual es más vieja)."""
+
+    def __init__(self, snapshot, build, interval):
+        self.snapshot = snapshot
+        self.build = build
+        self.interval = interval
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                age = time.time() - os.path.getmtime(self.snapshot.path)
+            except OSError:
+                age = None
+            if age is None or age >= self.interval:
+                try:
+                    self.build()
+                except Exception as e:
+                    print(f"Error refreshing recommendation snapshot: {e}")
+                age = 0.0
+            time.sleep(max(1.0, self.interval - age))
@@ -0,0 +1,148 @@
+"""Plazos por petición y circuit breakers para las llamadas a servicios externos.
+
+El plazo se guarda en una ``ContextVar``: lo heredan las funciones llamadas
+desde el mismo hilo o tarea asíncrona, así que cada llamada saliente puede
+acotar su timeout con lo que queda sin recibirlo como argumento. Para usarlo en
+otro hilo hay que copiar el contexto (``contextvars.copy_context().run``).
+
+Los errores son excepciones de ``requests`` para que quien llama los trate igual
+que un fallo de red.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Se agotó el plazo de la petición antes de la llamada saliente."""
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """El circuit breaker del servicio está abierto: la llamada no se intenta."""
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Fija un plazo de ``seconds`` segundos (o ninguno si es 0) para el bloque.
+
+    Si ya hay un plazo más estricto, se conserva ese.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Segundos que quedan del plazo actual, o None si no hay plazo."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def bounded_timeout(timeout):
+    """Recorta un timeout a lo que queda del plazo; lanza DeadlineExceeded si ya no queda."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Se agotó el plazo de la petición")
+    return left if timeout is None else min(timeout, left)
+
+
+class CircuitBreaker:
+    """Circuit breaker de un servicio externo (cerrado, abierto o semiabierto).
+
+    Se abre tras ``failure_threshold`` fallos consecutivos; las llamadas que
+    tardan más de ``slow_call_seconds`` cuentan como fallos. Abierto, rechaza
+    las llamadas con CircuitOpenError durante ``reset_timeout`` segundos y
+    después deja pasar una sola de prueba: si sale bien se cierra y si falla
+    vuelve a abrirse.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, slow_call_seconds=None, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lanza CircuitOpenError si la llamada no debe intentarse."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            if self.state != self.CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuito abierto para {self.name}")
+
+    def record_success(self, duration):
+        if self.slow_call_seconds is not None and duration > self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._probing = False
+
+    def release_probe(self):
+        """Permite otra llamada de prueba sin registrar resultado (la actual se abandonó)."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self):
+        """Envuelve una llamada: la rechaza si el circuito está abierto y registra el resultado."""
+        self.before_call()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # GeneratorExit (el cliente cerró el stream) o una interrupción: no dice
+            # nada del servicio, pero si era la llamada de prueba hay que liberarla
+            self.release_probe()
+            raise
+        self.record_success(time.monotonic() - start)
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
@@ -0,0 +1,130 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def new_session_id():
+    """Genera un identificador de sesión opaco y difícil de adivinar."""
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+    """Conversaciones en memoria, acotadas por TTL y con expulsión LRU.
+
+    Una conversación es cualquier objeto serializable a JSON (historial y
+    preferencias acumuladas); se guarda tal cual, sin copiarlo.
+    """
+
+    def __init__(self, ttl=1800, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # id -> (último acceso, conversación)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Devuelve la conversación de la sesión o None si no existe o expiró."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            last_access, conversation = entry
+            if now - last_access > self.ttl:
+                del self._sessions[session_id]
+                return None
+            self._sessions[session_id] = (now, conversation)
+            self._sessions.move_to_end(session_id)
+            return conversation
+
+    def save(self, session_id, conversation):
+        """Guarda la conversación y expulsa las sesiones menos usadas si hace falta."""
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session_id] = (now, conversation)
+            self._sessions.move_to_end(session_id)
+            # Las sesiones más antiguas están al principio
+            while self._sessions:
+                oldest_id, (last_access, _) = next(iter(self._sessions.items()))
+                if len(self._sessions) > self.max_sessions or now - last_access > self.ttl:
+                    del self._sessions[oldest_id]
+                else:
+                    break
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Conversaciones en un archivo SQLite local (como JSON), con TTL y expulsión LRU.
+
+    Permite que varios procesos de la misma máquina compartan las sesiones y que
+    sobrevivan a un reinicio. La columna se sigue llamando ``history`` (como
+    cuando sólo se guardaba el historial) para poder abrir bases ya creadas.
+    """
+
+    def __init__(self, path="sessions.db", ttl=1800, max_sessions=10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY, history TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def get(self, session_id):
+        """Devuelve la conversación de la sesión o None si no existe o expiró."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, last_access FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                return None
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+            return json.loads(row[0])
+
+    def save(self, session_id, conversation):
+        """Guarda la conversación y expulsa las sesiones expiradas o menos usadas."""
+        now = time.time()
+        payload = json.dumps(conversation, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, history, last_access) VALUES (?, ?, ?)",
+                (session_id, payload, now),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM sessions WHERE id IN ("
+                " SELECT id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(backend="memory", ttl=1800, max_sessions=10000, path="sessions.db"):
+    """Crea el almacén de sesiones configurado ("memory" o "sqlite")."""
+    if backend == "sqlite":
+        return SQLiteSessionStore(path=path, ttl=ttl, max_sessions=max_sessions)
+    if backend == "memory":
+        return MemorySessionStore(ttl=ttl, max_sessions=max_sessions)
+    raise ValueError(f"Backend de sesiones desconocido: {backend}")
@@ -0,0 +1,104 @@
+"""Coalescencia de llamadas idénticas simultáneas ("single-flight").
+
+Mientras una llamada con cierta clave está en curso, las demás peticiones con
+la misma clave esperan su resultado (o su excepción) en vez de repetirla. No es
+una caché: cuando la llamada termina, la siguiente vuelve a hacerse.
+"""
+import asyncio
+import threading
+
+from resilience import DeadlineExceeded, bounded_timeout
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Single-flight entre hilos."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        """Ejecuta ``fn(*args)`` o espera a la llamada en curso con la misma clave.
+
+        Quien espera lo hace como mucho hasta el plazo de su propia petición.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(bounded_timeout(None)):
+                raise DeadlineExceeded("Se agotó el plazo esperando una llamada en curso")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """Single-flight entre tareas de un mismo bucle de eventos.
+
+    La llamada corre en su propia tarea: si la petición que la inició se
+    cancela, las demás siguen esperando el resultado.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args):
+        """Espera ``fn(*args)`` o la llamada en curso con la misma clave."""
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), bounded_timeout(None))
+        except asyncio.TimeoutError:
+            if task.done():
+                raise
+            raise DeadlineExceeded("Se agotó el plazo de la petición") from None
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Marcar la excepción como leída aunque nadie quede esperando
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
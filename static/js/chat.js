@@ -3,8 +3,18 @@ document.addEventListener("DOMContentLoaded", () => {
     const chatForm = document.getElementById("chat-form")
     const userInput = document.getElementById("user-input")
   
-    // Chat history to keep track of the conversation
+    // Session mode: the server keeps the history and we only send the new message.
+    // Set to false to use the stateless protocol (full history on every request).
+    const USE_SERVER_SESSION = true
+
+    // Session token returned by the server (session mode)
+    let sessionId = null
+
+    // Chat history to keep track of the conversation (stateless mode)
     let chatHistory = []
+
+    // Streaming mode: render the answer token by token as the server generates it
+    const USE_STREAMING = true
   
     // Function to add a message to the chat
     function addMessage(content, sender) {
@@ -21,6 +31,24 @@ document.addEventListener("DOMContentLoaded", () => {
         sender === "user" ? "text-white" : "text-gray-800",
       )
   
+      renderContent(messageBubble, content, sender)
+      messageDiv.appendChild(messageBubble)
+  
+      chatMessages.appendChild(messageDiv)
+  
+      // Animate the message appearance
+      setTimeout(() => {
+        messageDiv.classList.add("show")
+      }, 100)
+  
+      // Scroll to the bottom
+      chatMessages.scrollTop = chatMessages.scrollHeight
+
+      return messageBubble
+    }
+
+    // Function to render (or re-render) the content of a message bubble
+    function renderContent(messageBubble, content, sender) {
       // Process markdown-like syntax for bot messages
       if (sender === "bot") {
         // Convert **text** to bold
@@ -37,17 +65,6 @@ document.addEventListener("DOMContentLoaded", () => {
       }
   
       messageBubble.innerHTML = content
-      messageDiv.appendChild(messageBubble)
-  
-      chatMessages.appendChild(messageDiv)
-  
-      // Animate the message appearance
-      setTimeout(() => {
-        messageDiv.classList.add("show")
-      }, 100)
-  
-      // Scroll to the bottom
-      chatMessages.scrollTop = chatMessages.scrollHeight
     }
   
     // Function to show typing indicator
@@ -77,8 +94,122 @@ document.addEventListener("DOMContentLoaded", () => {
       }
     }
   
+    // Request body for either protocol
+    function buildPayload(message) {
+      return USE_SERVER_SESSION
+        ? { message: message, session_id: sessionId }
+        : { message: message, history: chatHistory }
+    }
+
+    // Keep the conversation state returned by the server
+    function updateConversation(data) {
+      if (USE_SERVER_SESSION) {
+        // Keep the (possibly new) session token
+        sessionId = data.session_id
+      } else {
+        // Update chat history
+        chatHistory = data.history
+      }
+    }
+
+    // Show the server's error message ({"error": ...}) for a failed request
+    async function showRequestError(response) {
+      let message = "Lo siento, ha ocurrido un error al procesar tu mensaje."
+      try {
+        const data = await response.json()
+        if (data && data.error) message = data.error
+      } catch (error) {
+        // Not JSON (e.g. a proxy error page): keep the generic message
+      }
+      removeTypingIndicator()
+      addMessage(message, "bot")
+    }
+
+    // Function to send a message and render the answer as Server-Sent Events arrive
+    async function streamMessage(message) {
+      showTypingIndicator()
+
+      let bubble = null
+      let text = ""
+
+      try {
+        const response = await fetch("/api/chat/stream", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify(buildPayload(message)),
+        })
+
+        // Validation and rate limiting errors come back as JSON, not as a stream
+        if (!response.ok) {
+          await showRequestError(response)
+          return
+        }
+
+        const reader = response.body.getReader()
+        const decoder = new TextDecoder()
+        let buffer = ""
+
+        while (true) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer += decoder.decode(value, { stream: true })
+
+          // Events are separated by a blank line
+          let boundary
+          while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const rawEvent = buffer.slice(0, boundary)
+            buffer = buffer.slice(boundary + 2)
+
+            let eventName = "message"
+            let eventData = ""
+            for (const line of rawEvent.split("\n")) {
+              if (line.startsWith("event: ")) eventName = line.slice(7)
+              else if (line.startsWith("data: ")) eventData += line.slice(6)
+            }
+            const data = JSON.parse(eventData)
+
+            if (eventName === "token") {
+              text += data.text
+              if (!bubble) {
+                removeTypingIndicator()
+                bubble = addMessage(text, "bot")
+              } else {
+                renderContent(bubble, text, "bot")
+                chatMessages.scrollTop = chatMessages.scrollHeight
+              }
+            } else if (eventName === "done") {
+              updateConversation(data)
+              // The final response is authoritative (it may replace what was streamed)
+              if (!bubble) {
+                removeTypingIndicator()
+                bubble = addMessage(data.response, "bot")
+              } else if (data.response !== text) {
+                renderContent(bubble, data.response, "bot")
+              }
+            }
+          }
+        }
+
+        // The stream ended without any reply (e.g. the connection dropped)
+        if (!bubble) {
+          removeTypingIndicator()
+          addMessage("Lo siento, ha ocurrido un error al procesar tu mensaje.", "bot")
+        }
+      } catch (error) {
+        console.error("Error:", error)
+        removeTypingIndicator()
+        addMessage("Lo siento, ha ocurrido un error al procesar tu mensaje.", "bot")
+      }
+    }
+
     // Function to send message to the server
     async function sendMessage(message) {
+      if (USE_STREAMING) {
+        return streamMessage(message)
+      }
+
       showTypingIndicator()
   
       try {
@@ -87,16 +218,17 @@ document.addEventListener("DOMContentLoaded", () => {
           headers: {
             "Content-Type": "application/json",
           },
-          body: JSON.stringify({
-            message: message,
-            history: chatHistory,
-          }),
+          body: JSON.stringify(buildPayload(message)),
         })
   
+        if (!response.ok) {
+          await showRequestError(response)
+          return
+        }
+  
         const data = await response.json()
   
-        // Update chat history
-        chatHistory = data.history
+        updateConversation(data)
   
         // Remove typing indicator and add bot response
         removeTypingIndicator()
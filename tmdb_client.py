@@ -0,0 +1,251 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from resilience import bounded_timeout, remaining
+
+# Respuestas que vale la pena reintentar
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Convierte la cabecera Retry-After (segundos o fecha HTTP) en segundos, o None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _RetryPolicy:
+    """Timeouts, backoff, presupuesto de reintentos, circuit breaker y límite de tasa compartidos por los clientes.
+
+    Los timeouts y las esperas entre reintentos se recortan al plazo de la
+    petición en curso (ver resilience.deadline_scope). Con ``rate_limiter``
+    cada intento espera su ficha según la prioridad del contexto (ver
+    rate_limiter.priority_scope) y un 429 detiene el limitador lo que pida
+    ``Retry-After``.
+    """
+
+    def __init__(self, base_url, pool_size=16, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_base=0.25, backoff_max=4.0, max_retry_after=10.0,
+                 retry_budget_ratio=0.2, retry_budget_max=10.0, breaker=None, rate_limiter=None):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_max = retry_budget_max
+        self.breaker = breaker
+        self.rate_limiter = rate_limiter
+        self._retry_budget = retry_budget_max
+        self._lock = threading.Lock()
+
+    def _take_retry(self, attempt):
+        if attempt >= self.max_retries:
+            return False
+        with self._lock:
+            if self._retry_budget >= 1:
+                self._retry_budget -= 1
+                return True
+            return False
+
+    def _refill_budget(self):
+        with self._lock:
+            self._retry_budget = min(self.retry_budget_max, self._retry_budget + self.retry_budget_ratio)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        # Backoff exponencial con "full jitter"
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_delay(self, attempt, retry_after=None):
+        """Espera antes del siguiente reintento, o None si no hay que reintentar.
+
+        No se reintenta si la espera no cabe en lo que queda del plazo.
+        """
+        delay = self._backoff(attempt, retry_after)
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        if not self._take_retry(attempt):
+            return None
+        return delay
+
+    def _timeouts(self):
+        """Timeouts de conexión y lectura recortados al plazo de la petición."""
+        return bounded_timeout(self.connect_timeout), bounded_timeout(self.read_timeout)
+
+    def _rate_limited(self, status_code, retry_after):
+        """Tras un 429, frena a todas las llamadas (por defecto un segundo)."""
+        if status_code == 429 and self.rate_limiter is not None:
+            self.rate_limiter.penalize(retry_after if retry_after is not None else 1.0)
+
+    def _before_attempt(self):
+        if self.breaker is not None:
+            self.breaker.before_call()
+        return time.monotonic()
+
+    def _record_attempt(self, start, ok):
+        if self.breaker is None:
+            return
+        if ok:
+            self.breaker.record_success(time.monotonic() - start)
+        else:
+            self.breaker.record_failure()
+
+
+class TMDbClient(_RetryPolicy):
+    """Cliente HTTP compartido para TMDb.
+
+    Usa una única ``requests.Session`` con un pool de conexiones keep-alive
+    acotado por host, timeouts de conexión y lectura, y reintentos limitados
+    con backoff exponencial con jitter para 429/5xx y errores de red,
+    respetando ``Retry-After``. Los reintentos consumen un presupuesto
+    compartido que se recarga con cada petición, para que una caída de TMDb
+    no multiplique el tráfico, y el circuit breaker opcional corta las
+    llamadas mientras TMDb sigue fallando.
+
+    Como mucho ``pool_size`` peticiones van a la vez. La espera por una
+    conexión libre no pasa del timeout de conexión (recortado al plazo de la
+    petición) y, si se agota, cuenta como un intento fallido.
+    """
+
+    def __init__(self, base_url, **options):
+        super().__init__(base_url, **options)
+        self.session = requests.Session()
+        # pool_block: como mucho pool_size conexiones simultáneas por host. El pool
+        # de urllib3 esperaría sin límite, así que la espera la acota _connection_slot
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, pool_block=True, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+
+    @contextmanager
+    def _connection_slot(self, timeout):
+        """Reserva una de las ``pool_size`` conexiones; lanza ConnectTimeout si no hay ninguna a tiempo."""
+        if not self._slots.acquire(timeout=timeout):
+            raise requests.ConnectTimeout(f"No free connection to {self.base_url} after {timeout:.2f} s")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def get(self, path, params=None):
+        """Hace un GET a TMDb y devuelve el JSON; lanza requests.RequestException si falla."""
+        url = f"{self.base_url}{path}"
+        self._refill_budget()
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            timeout = self._timeouts()
+            start = self._before_attempt()
+            try:
+                with self._connection_slot(timeout[0]):
+                    response = self.session.get(url, params=params, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record_attempt(start, ok=False)
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self._record_attempt(start, ok=response.status_code not in RETRY_STATUSES)
+            if response.status_code in RETRY_STATUSES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                self._rate_limited(response.status_code, retry_after)
+                delay = self._retry_delay(attempt, retry_after)
+                if delay is not None:
+                    response.close()
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncTMDbClient(_RetryPolicy):
+    """Versión asíncrona de TMDbClient sobre ``httpx.AsyncClient``.
+
+    Aplica la misma política de timeouts y reintentos. Los errores se traducen a
+    excepciones de ``requests`` para que quien llama los trate igual en los dos
+    caminos. Debe crearse y usarse dentro del mismo bucle de eventos.
+    """
+
+    def __init__(self, base_url, **options):
+        super().__init__(base_url, **options)
+        import httpx  # dependencia opcional: sólo la necesita el camino asíncrono
+
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+
+    async def get(self, path, params=None):
+        """Hace un GET a TMDb y devuelve el JSON; lanza requests.RequestException si falla."""
+        httpx = self._httpx
+        self._refill_budget()
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            connect_timeout, read_timeout = self._timeouts()
+            start = self._before_attempt()
+            try:
+                response = await self.client.get(
+                    path, params=params, timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+                )
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                self._record_attempt(start, ok=False)
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise requests.ConnectionError(str(e)) from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self._record_attempt(start, ok=response.status_code not in RETRY_STATUSES)
+            if response.status_code in RETRY_STATUSES:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                self._rate_limited(response.status_code, retry_after)
+                delay = self._retry_delay(attempt, retry_after)
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+
+            if response.status_code >= 400:
+                raise requests.HTTPError(f"{response.status_code} Error for url: {response.url}")
+            try:
+                return response.json()
+            except ValueError as e:
+                # Igual que requests: un cuerpo que no es JSON es un error de la petición
+                raise requests.RequestException(f"Invalid JSON from {response.url}: {e}") from e
+
+    async def aclose(self):
+        await self.client.aclose()